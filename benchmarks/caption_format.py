@@ -0,0 +1,81 @@
+"""Compare the AVOD captions format with the legacy Python repr format
+
+Usage:
+    python benchmarks/caption_format.py [--captions N]
+"""
+import argparse
+import ast
+import io
+import os
+import random
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "source", "common"))
+
+from avod_common.captions import read_captions, write_captions  # noqa: E402
+
+
+WORDS = ["olá", "mundo", "vídeo", "legenda", "aula", "transcrição", "hoje"]
+
+
+def make_captions(amount):
+    rnd = random.Random(42)
+    start = 0.0
+    captions = []
+    for _ in range(amount):
+        words = [rnd.choice(WORDS) for _ in range(rnd.randint(4, 12))]
+        end = start + rnd.uniform(1.0, 5.0)
+        captions.append({
+            "start": round(start, 2),
+            "caption": " ".join(words),
+            "wordConfidence": [
+                {"w": word, "c": round(rnd.random(), 4)} for word in words
+            ],
+            "end": round(end, 2)
+        })
+        start = end + rnd.uniform(0.0, 1.0)
+    return captions
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--captions", type=int, default=100000)
+    args = parser.parse_args()
+
+    captions = make_captions(args.captions)
+
+    legacy = io.StringIO()
+    print(captions, file=legacy)
+    legacy = legacy.getvalue()
+
+    compact = io.StringIO()
+    _, write_seconds = timed(lambda: write_captions(captions, compact))
+    compact = compact.getvalue()
+
+    _, legacy_seconds = timed(lambda: ast.literal_eval(legacy))
+    _, compact_seconds = timed(
+        lambda: list(read_captions(io.StringIO(compact)))
+    )
+
+    print(f"Captions: {args.captions}")
+    print(f"{'format':<8}{'size MB':>10}{'parse seconds':>16}")
+    for name, document, seconds in (
+        ("repr", legacy, legacy_seconds),
+        ("avod", compact, compact_seconds)
+    ):
+        size = len(document.encode("utf-8")) / (1024 * 1024)
+        print(f"{name:<8}{size:>10.2f}{seconds:>16.2f}")
+    print(f"avod write seconds: {write_seconds:.2f}")
+
+
+if __name__ == "__main__":
+    main()
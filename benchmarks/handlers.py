@@ -0,0 +1,656 @@
+"""Cold start and handler latency of the Lambda functions
+
+Usage:
+    python benchmarks/handlers.py [--imports N] [--invocations N]
+                                  [--words N] [FUNCTION ...]
+
+Init: source/<function>/app.py is imported --imports times, each time in
+a fresh interpreter, reporting the p50/p99 import time, the peak RSS
+added by the import and the memory allocated by it (tracemalloc, in one
+more run, as tracing slows the import down).
+
+Handlers: lambda_handler is called --invocations times with the events/
+fixture of the function, reporting the p50/p99 latency and the peak
+memory allocated by a call. The boto3 clients are real ones, but their
+calls are answered with canned responses by a botocore before-call
+handler, like botocore Stubber does, so the parameters are validated
+against the service models and nothing leaves the process. Unlike the
+Stubber the responses are looked up by operation, so handlers doing a
+variable number of calls can run in a loop. The first call, which
+creates the clients, is not measured.
+"""
+import argparse
+import copy
+import io
+import json
+import math
+import os
+import random
+import resource
+import struct
+import subprocess
+import sys
+import time
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = os.path.join(ROOT, "source")
+EVENTS = os.path.join(ROOT, "events")
+
+UUID = "531f729c-2f96-4ba7-8cf7-02284f3e7e35"
+BUCKET = "example-bucket"
+ENDPOINT = "https://abcd12345.mediaconvert.us-east-1.amazonaws.com"
+WORDS = ["olá", "mundo", "vídeo", "legenda", "aula", "transcrição", "hoje"]
+SEGMENTS = 100
+SEGMENT_SECONDS = 6.0
+# Bytes of a HLS segment, 4 Mbit/s
+TS_BYTES = 3000000
+
+# Credentials and region of the clients, never used to send a request
+ENVIRONMENT = {
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_EC2_METADATA_DISABLED": "true"
+}
+
+
+def transcript(words, offset=0.0, spacing=0.2):
+    """Synthetic Transcribe Transcript.json, a word every spacing seconds"""
+
+    rnd = random.Random(42)
+    items = []
+    for index in range(words):
+        start = offset + index * spacing
+        items.append({
+            "start_time": f"{start:.3f}",
+            "end_time": f"{start + spacing * 0.75:.3f}",
+            "alternatives": [{
+                "confidence": f"{rnd.random():.4f}",
+                "content": rnd.choice(WORDS)
+            }],
+            "type": "pronunciation"
+        })
+        if index % 10 == 9:
+            items.append({
+                "alternatives": [{"confidence": "0.0", "content": "."}],
+                "type": "punctuation"
+            })
+    return json.dumps({
+        "jobName": f"key.mp4-{UUID}",
+        "status": "COMPLETED",
+        "results": {
+            "transcripts": [{"transcript": " ".join(
+                x["alternatives"][0]["content"] for x in items
+            )}],
+            "items": items
+        }
+    }).encode("utf-8")
+
+
+def web_captions(words):
+    """Synthetic WebCaptions, a caption every 8 words"""
+
+    from avod_common.captions import write_captions
+
+    captions = []
+    for index in range(0, words, 8):
+        captions.append({
+            "start": index * 0.2,
+            "end": (index + 8) * 0.2,
+            "caption": " ".join(WORDS[x % len(WORDS)] for x in range(8)),
+            "wordConfidence": [
+                {"w": WORDS[x % len(WORDS)], "c": 0.9} for x in range(8)
+            ]
+        })
+    f = io.StringIO()
+    write_captions(captions, f)
+    return f.getvalue().encode("utf-8")
+
+
+def playlists():
+    """HLS master and media playlists, as written by MediaConvert"""
+
+    master = "\n".join([
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+        "#EXT-X-STREAM-INF:BANDWIDTH=5500000,RESOLUTION=1920x1080,"
+        "CODECS=\"avc1.640029,mp4a.40.2\"",
+        "key_1080p.m3u8",
+        ""
+    ])
+    media = ["#EXTM3U", "#EXT-X-VERSION:3",
+             f"#EXT-X-TARGETDURATION:{int(SEGMENT_SECONDS)}",
+             "#EXT-X-MEDIA-SEQUENCE:1", "#EXT-X-PLAYLIST-TYPE:VOD"]
+    for index in range(1, SEGMENTS + 1):
+        media += [f"#EXTINF:{SEGMENT_SECONDS:.3f},",
+                  f"key_1080p_{index:05d}.ts"]
+    media.append("#EXT-X-ENDLIST")
+    return master.encode("utf-8"), "\n".join(media).encode("utf-8")
+
+
+def hls_listing(size=TS_BYTES):
+    """list_objects_v2 of the HLS folder of playlists()"""
+
+    prefix = f"outputs/{UUID}/HLS"
+    master, media = playlists()
+    return {"Contents": [
+        {"Key": f"{prefix}/key.m3u8", "Size": len(master)},
+        {"Key": f"{prefix}/key_1080p.m3u8", "Size": len(media)}
+    ] + [
+        {"Key": f"{prefix}/key_1080p_{index:05d}.ts", "Size": size}
+        for index in range(1, SEGMENTS + 1)
+    ]}
+
+
+def hls_index(size=TS_BYTES):
+    """Index of playlists(), as written by the HLS verifier"""
+
+    variant = {
+        "bandwidth": 5500000,
+        "resolution": "1920x1080",
+        "codecs": "avc1.640029,mp4a.40.2",
+        "uri": "key_1080p.m3u8",
+        "target_duration": int(SEGMENT_SECONDS),
+        "duration": SEGMENTS * SEGMENT_SECONDS,
+        "bytes": SEGMENTS * size,
+        "measured_average_bandwidth": int(size * 8 / SEGMENT_SECONDS),
+        "measured_peak_bandwidth": int(size * 8 / SEGMENT_SECONDS),
+        "segments": {
+            "uri": [
+                f"key_1080p_{index:05d}.ts"
+                for index in range(1, SEGMENTS + 1)
+            ],
+            "duration": [SEGMENT_SECONDS] * SEGMENTS,
+            "bytes": [size] * SEGMENTS
+        }
+    }
+    return json.dumps({
+        "version": 1,
+        "master": "key.m3u8",
+        "variants": [variant],
+        "media": [],
+        "warnings": [],
+        "duration": variant["duration"],
+        "segments": SEGMENTS,
+        "bytes": variant["bytes"]
+    }).encode("utf-8")
+
+
+def edge():
+    """Local HTTP server standing for the CDN edge in front of the HLS
+    folder of playlists(), answering X-Cache Miss from cloudfront on the
+    first GET of a path and Hit from cloudfront after
+
+    Returns
+    ------
+    Base URL of the edge: str
+
+    """
+
+    master, media = playlists()
+    prefix = f"/outputs/{UUID}/HLS/"
+    objects = {f"{prefix}key.m3u8": master, f"{prefix}key_1080p.m3u8": media}
+    segment = bytes(64 * 1024)
+    cached = set()
+    lock = threading.Lock()
+
+    class Edge(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            data = objects.get(self.path)
+            if data is None and self.path.startswith(f"{prefix}key_1080p_"):
+                data = segment
+            if data is None:
+                self.send_error(404)
+                return
+            with lock:
+                hit = self.path in cached
+                cached.add(self.path)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header(
+                "X-Cache", f"{'Hit' if hit else 'Miss'} from cloudfront"
+            )
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Edge)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def mp4(seconds=SEGMENTS * SEGMENT_SECONDS):
+    """Smallest MP4 the probe and the audio remux accept: a H.264 and an
+    AAC track, the mdat a second of video then a second of audio samples,
+    and the moov at the end like a file that is not fast start"""
+
+    # AAC frames of 1024 samples at 48 kHz, 2 bytes each, in chunks of 47
+    frames = int(seconds * 48000) // 1024
+    per_chunk, sample_size, video_size = 47, 2, 32
+    chunks = -(-frames // per_chunk)
+    chunk_size = video_size + per_chunk * sample_size
+
+    def trak(handler, entry, width, height, timescale, delta, tables=b""):
+        duration = int(seconds * timescale)
+        return box(b"trak", box(
+            b"tkhd", bytes(76) + struct.pack(">II", width << 16, height << 16)
+        ) + box(b"mdia", box(
+            b"mdhd", bytes(12) + struct.pack(">IIHH", timescale, duration,
+                                             0x55C4, 0)
+        ) + box(
+            b"hdlr", bytes(8) + handler + bytes(13)
+        ) + box(b"minf", box(b"stbl", box(
+            b"stsd", bytes(4) + struct.pack(">I", 1) + entry
+        ) + box(
+            b"stts", bytes(4) + struct.pack(
+                ">III", 1, duration // delta, delta
+            )
+        ) + tables))))
+
+    def descriptor(tag, payload):
+        return bytes([tag, len(payload)]) + payload
+
+    ftyp = box(b"ftyp", b"isom" + bytes(4) + b"isommp42")
+    offsets = [
+        len(ftyp) + 8 + x * chunk_size + video_size for x in range(chunks)
+    ]
+    video = box(b"avc1", bytes(24) + struct.pack(">HH", 1920, 1080) +
+                bytes(50))
+    # AAC LC, 48 kHz, stereo
+    esds = box(b"esds", bytes(4) + descriptor(3, bytes(3) + descriptor(
+        4, bytes([0x40, 0x15]) + bytes(3) + struct.pack(">II", 96000, 96000) +
+        descriptor(5, b"\x11\x90")
+    ) + descriptor(6, b"\x02")))
+    audio = box(b"mp4a", bytes(16) + struct.pack(">HHHHI", 2, 16, 0, 0,
+                                                 48000 << 16) + esds)
+    audio_tables = box(
+        b"stsc", bytes(4) + struct.pack(">IIII", 1, 1, per_chunk, 1)
+    ) + box(
+        b"stsz", bytes(4) + struct.pack(">II", sample_size, frames)
+    ) + box(
+        b"stco", bytes(4) + struct.pack(f">I{chunks}I", chunks, *offsets)
+    )
+    moov = box(b"moov", box(
+        b"mvhd", bytes(12) + struct.pack(">II", 1000, int(seconds * 1000)) +
+        bytes(80)
+    ) + trak(b"vide", video, 1920, 1080, 30000, 1001) +
+        trak(b"soun", audio, 0, 0, 48000, 1024, audio_tables))
+    mdat = box(b"mdat", bytes(max(256 * 1024, chunks * chunk_size)))
+    return ftyp + mdat + moov
+
+
+def body(data):
+    from botocore.response import StreamingBody
+
+    return StreamingBody(io.BytesIO(data), len(data))
+
+
+def get_object(objects):
+    """get_object answering with the objects by key and the Range"""
+
+    def respond(params):
+        data = objects[params["Key"]]
+        response = {}
+        if "Range" in params:
+            start, end = params["Range"].split("=")[1].split("-")
+            end = min(int(end), len(data) - 1)
+            response["ContentRange"] = f"bytes {start}-{end}/{len(data)}"
+            data = data[int(start):end + 1]
+        return {"Body": body(data), "ContentLength": len(data), **response}
+
+    return respond
+
+
+def mediaconvert_job(status):
+    return {"Job": {
+        "Id": "1234567890123-a1bcd2",
+        "Role": "arn:aws:iam::012345678901:role/DummyRole",
+        "Status": status,
+        "Settings": {"OutputGroups": [{
+            "OutputGroupSettings": {
+                "Type": "FILE_GROUP_SETTINGS",
+                "FileGroupSettings": {
+                    "Destination": f"s3://{BUCKET}/outputs/{UUID}/"
+                }
+            },
+            "Outputs": [{"Extension": "mp4", "NameModifier": "_audio"}]
+        }]}
+    }}
+
+
+def transcription_job(status):
+    return {"TranscriptionJob": {
+        "TranscriptionJobName": f"key.mp4-{UUID}",
+        "TranscriptionJobStatus": status
+    }}
+
+
+# Responses shared by the functions writing to S3
+S3_WRITES = {
+    "put_object": {"ETag": "\"etag\""},
+    "create_multipart_upload": {"UploadId": "upload"},
+    "upload_part": {"ETag": "\"etag\""},
+    "complete_multipart_upload": {},
+    "abort_multipart_upload": {}
+}
+MEDIACONVERT = {
+    "describe_endpoints": {"Endpoints": [{"Url": ENDPOINT}]},
+    "create_job": mediaconvert_job("SUBMITTED")
+}
+
+
+def responses(function, words):
+    """Canned responses of the clients of a function
+
+    Returns
+    ------
+    Responses, or callables of the parameters returning them, by
+    operation by (service, endpoint url): dict
+
+    """
+
+    prefix = f"outputs/{UUID}"
+    if function == "admission":
+        return {("stepfunctions", None): {"send_task_success": {}}}
+    if function == "complete_job":
+        return {
+            ("dynamodb", None): {
+                "get_item": {"Item": {
+                    "job_id": {"S": "1234567890123-a1bcd2"},
+                    "task_token": {"S": "token"}
+                }},
+                "delete_item": {}
+            },
+            ("stepfunctions", None): {"send_task_success": {}}
+        }
+    if function in ("get_extract_audio", "get_hls"):
+        return {
+            ("mediaconvert", ENDPOINT): {
+                "get_job": mediaconvert_job("COMPLETE")
+            }
+        }
+    if function == "get_transcribe":
+        return {
+            ("transcribe", None): {
+                "get_transcription_job": transcription_job("COMPLETED")
+            }
+        }
+    if function in ("probe_media", "remux_audio"):
+        source = mp4()
+        return {("s3", None): {
+            "head_object": {"ContentLength": len(source)},
+            "get_object": get_object({"input/key.mp4": source}),
+            **S3_WRITES
+        }}
+    if function in ("start_extract_audio", "start_hls"):
+        return {
+            ("mediaconvert", None): MEDIACONVERT,
+            ("mediaconvert", ENDPOINT): MEDIACONVERT
+        }
+    if function == "start_transcribe":
+        return {
+            ("transcribe", None): {
+                "start_transcription_job": transcription_job("IN_PROGRESS")
+            }
+        }
+    if function == "start_webcaptions":
+        return {("s3", None): {
+            "get_object": get_object({
+                f"{prefix}/Transcript.json": transcript(words)
+            }),
+            **S3_WRITES
+        }}
+    if function == "start_srt":
+        return {("s3", None): {
+            "get_object": get_object({
+                f"{prefix}/WebCaptions_pt-BR": web_captions(words)
+            }),
+            **S3_WRITES
+        }}
+    if function == "start_subtitles":
+        master, media = playlists()
+        return {("s3", None): {
+            "get_object": get_object({
+                f"{prefix}/HLS/key.m3u8": master,
+                f"{prefix}/HLS/key_1080p.m3u8": media,
+                f"{prefix}/HLS/key_index.json": hls_index(),
+                f"{prefix}/WebCaptions_pt-BR": web_captions(words)
+            }),
+            **S3_WRITES
+        }}
+    if function == "redrive":
+        keys = [
+            f"{prefix}/HLS/key.m3u8", f"{prefix}/HLS/key_1080p.m3u8",
+            f"{prefix}/HLS/key_index.json", f"{prefix}/Transcript.json"
+        ]
+        return {
+            ("s3", None): {
+                "list_objects_v2": {"Contents": [
+                    {"Key": x, "Size": 1024} for x in keys
+                ]},
+            },
+            ("stepfunctions", None): {"start_execution": {
+                "executionArn": "arn:aws:states:us-east-1:123456789012:"
+                                "execution:AVOD:key-r1",
+                "startDate": 0
+            }}
+        }
+    if function == "prewarm_cdn":
+        return {("s3", None): {
+            "get_object": get_object({
+                f"{prefix}/HLS/key_index.json": hls_index()
+            })
+        }}
+    if function == "verify_hls":
+        master, media = playlists()
+        return {("s3", None): {
+            "list_objects_v2": hls_listing(),
+            "get_object": get_object({
+                f"{prefix}/HLS/key.m3u8": master,
+                f"{prefix}/HLS/key_1080p.m3u8": media
+            }),
+            **S3_WRITES
+        }}
+    if function == "start_workflow":
+        return {("stepfunctions", None): {"start_execution": {
+            "executionArn": "arn:aws:states:us-east-1:123456789012:"
+                            "execution:AVOD:key",
+            "startDate": 0
+        }}}
+    if function == "stitch_transcripts":
+        return {("s3", None): {
+            "get_object": get_object({
+                f"{prefix}/Transcript_000.json": transcript(words // 2),
+                f"{prefix}/Transcript_001.json": transcript(words // 2)
+            }),
+            **S3_WRITES
+        }}
+    return {}
+
+
+# Fixture of each function in events/
+FIXTURES = {
+    "admission": "admission_event.json",
+    "complete_job": "mediaconvert_job_state_change_event.json",
+    "get_extract_audio": "get_extract_audio_event.json",
+    "get_hls": "get_hls_event.json",
+    "get_transcribe": "get_transcribe_event.json",
+    "organize_stepfunctions": "organize_stepfunctions_event.json",
+    "prewarm_cdn": "start_subtitles_event.json",
+    "probe_media": "start_stepfunctions_event.json",
+    "redrive": "redrive_event.json",
+    "remux_audio": "start_extract_audio_event.json",
+    "split_transcription": "split_transcription_event.json",
+    "start_extract_audio": "start_extract_audio_event.json",
+    "start_hls": "start_hls_event.json",
+    "start_srt": "start_srt_event.json",
+    "start_subtitles": "start_subtitles_event.json",
+    "start_transcribe": "start_transcribe_event.json",
+    "start_webcaptions": "start_webcaptions_event.json",
+    "start_workflow": "s3_put_event.json",
+    "stitch_transcripts": "stitch_transcripts_event.json",
+    "verify_hls": "get_hls_event.json"
+}
+
+
+def answer(client, operations):
+    """Answer the calls of a client with canned responses"""
+
+    from botocore import xform_name
+    from botocore.awsrequest import AWSResponse
+
+    def keep_params(params, context, **kwargs):
+        context["benchmark_params"] = dict(params)
+
+    def respond(model, context, **kwargs):
+        response = operations[xform_name(model.name)]
+        if callable(response):
+            response = response(context["benchmark_params"])
+        return AWSResponse(None, 200, {}, None), response
+
+    client.meta.events.register("before-parameter-build.*.*", keep_params)
+    client.meta.events.register_first("before-call.*.*", respond)
+
+
+def use_function(function):
+    sys.path[:0] = [os.path.join(SOURCE, function),
+                    os.path.join(SOURCE, "common")]
+
+
+def run_init(function, trace):
+    """Import the function, in a fresh interpreter
+
+    Returns
+    ------
+    Seconds, peak RSS added in KB and allocated KB if traced: list
+
+    """
+
+    use_function(function)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    __import__("app")
+    elapsed = time.perf_counter() - started
+    allocated = None
+    if trace:
+        allocated = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    added = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+    return [elapsed, added, allocated]
+
+
+def run_handler(function, invocations, words):
+    """Call the handler of the function with its fixture
+
+    Returns
+    ------
+    Seconds and peak allocated KB of each call: list
+
+    """
+
+    use_function(function)
+    from avod_common import clients
+
+    if function == "prewarm_cdn":
+        os.environ["CDNBASEURL"] = edge()
+    for (service, endpoint_url), operations in responses(
+        function, words
+    ).items():
+        answer(clients.client(service, endpoint_url), operations)
+    app = __import__("app")
+    with open(os.path.join(EVENTS, FIXTURES[function])) as f:
+        event = json.load(f)
+
+    app.lambda_handler(copy.deepcopy(event), None)
+    latencies = []
+    for _ in range(invocations):
+        payload = copy.deepcopy(event)
+        started = time.perf_counter()
+        app.lambda_handler(payload, None)
+        latencies.append(time.perf_counter() - started)
+
+    allocated = []
+    for _ in range(max(invocations // 10, 1)):
+        payload = copy.deepcopy(event)
+        tracemalloc.start()
+        app.lambda_handler(payload, None)
+        allocated.append(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+    return [latencies, allocated]
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(math.ceil(len(values) * percent / 100),
+                      len(values)) - 1]
+
+
+def child(*args):
+    output = subprocess.check_output(
+        [sys.executable, __file__, *args],
+        env={**os.environ, **ENVIRONMENT}
+    )
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("functions", nargs="*", default=sorted(FIXTURES))
+    parser.add_argument("--imports", type=int, default=10)
+    parser.add_argument("--invocations", type=int, default=200)
+    parser.add_argument("--words", type=int, default=3000)
+    parser.add_argument("--init", action="store_true")
+    parser.add_argument("--handler", action="store_true")
+    parser.add_argument("--trace", action="store_true")
+    args = parser.parse_args()
+
+    if args.init:
+        print(json.dumps(run_init(args.functions[0], args.trace)))
+        return
+    if args.handler:
+        print(json.dumps(
+            run_handler(args.functions[0], args.invocations, args.words)
+        ))
+        return
+
+    print(f"{'function':<24}{'init p50':>10}{'init p99':>10}"
+          f"{'rss MB':>8}{'init KB':>9}"
+          f"{'call p50':>10}{'call p99':>10}{'call KB':>9}")
+    for function in args.functions:
+        inits = [child(function, "--init") for _ in range(args.imports)]
+        traced = child(function, "--init", "--trace")
+        latencies, allocated = child(
+            function, "--handler", "--invocations", str(args.invocations),
+            "--words", str(args.words)
+        )
+        seconds = [x[0] for x in inits]
+        print(
+            f"{function:<24}"
+            f"{percentile(seconds, 50) * 1000:>8.1f}ms"
+            f"{percentile(seconds, 99) * 1000:>8.1f}ms"
+            f"{max(x[1] for x in inits) / 1024:>8.1f}"
+            f"{traced[2]:>9.0f}"
+            f"{percentile(latencies, 50) * 1000:>8.2f}ms"
+            f"{percentile(latencies, 99) * 1000:>8.2f}ms"
+            f"{max(allocated):>9.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Compare the streaming SRT writer with the legacy string concatenation
+
+Usage:
+    python benchmarks/srt_writer.py [--cues N]
+
+The streaming writer sends its output to an in-memory stand-in of the S3
+client, so only the formatting and the part buffering are measured.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "source", "common"))
+
+from avod_common.s3_upload import MultipartUploadWriter  # noqa: E402
+from avod_common.subtitles import SRTWriter  # noqa: E402
+
+
+class MemoryS3:
+    """Just enough of the S3 client API for MultipartUploadWriter"""
+
+    def __init__(self):
+        self.parts = 0
+        self.size = 0
+
+    def create_multipart_upload(self, **kwargs):
+        return {"UploadId": "benchmark"}
+
+    def upload_part(self, Body, **kwargs):
+        self.parts += 1
+        self.size += len(Body)
+        return {"ETag": str(self.parts)}
+
+    def complete_multipart_upload(self, **kwargs):
+        pass
+
+    def put_object(self, Body, **kwargs):
+        self.size += len(Body)
+
+
+def legacy_format_SRT(time_seconds):
+    ONE_HOUR = 60 * 60
+    ONE_MINUTE = 60
+    hours = math.floor(time_seconds / ONE_HOUR)
+    remainder = time_seconds - (hours * ONE_HOUR)
+    minutes = math.floor(remainder / 60)
+    remainder = remainder - (minutes * ONE_MINUTE)
+    seconds = math.floor(remainder)
+    remainder = remainder - seconds
+    millis = remainder
+
+    return (
+        str(hours).zfill(2) + ":" +
+        str(minutes).zfill(2) + ":" +
+        str(seconds).zfill(2) + "," +
+        str(math.floor(millis * 1000)).zfill(3)
+    )
+
+
+def legacy(captions):
+    srt = ''
+    index = 1
+    for caption in captions:
+        srt += f"{str(index)}\n"
+        srt += (
+            legacy_format_SRT(float(caption['start'])) + " --> " +
+            legacy_format_SRT(float(caption['end'])) + "\n"
+        )
+        srt += caption["caption"] + '\n\n'
+        index += 1
+    return len(srt.encode("utf-8"))
+
+
+def streaming(captions):
+    s3 = MemoryS3()
+    with MultipartUploadWriter(s3, "bucket", "key") as f, \
+            SRTWriter(f) as writer:
+        for caption in captions:
+            writer.write(caption)
+    return s3.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cues", type=int, default=100000)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    start = 0.0
+    captions = []
+    for _ in range(args.cues):
+        end = start + rnd.uniform(1.0, 5.0)
+        captions.append({
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "caption": "legenda de exemplo com algumas palavras"
+        })
+        start = end
+
+    print(f"Cues: {args.cues}")
+    print(f"{'writer':<10}{'seconds':>10}{'size MB':>10}")
+    for name, function in (("legacy", legacy), ("streaming", streaming)):
+        started = time.perf_counter()
+        size = function(captions)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<10}{elapsed:>10.3f}{size / (1024 * 1024):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
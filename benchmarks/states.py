@@ -0,0 +1,664 @@
+"""Step Functions interpreter on a virtual clock
+
+Runs Amazon States Language definitions in-process. The executions are
+generators driven by a discrete event Loop: Wait states, retry backoffs
+and task tokens suspend them until the virtual time or the token they
+wait for, so hours of workflows run in the time their Lambda handlers
+take.
+
+Supported: Task, Pass, Choice, Wait, Parallel, Map, Succeed and Fail
+states, InputPath, Parameters, ItemSelector, ResultSelector, ResultPath
+and OutputPath, Retry and Catch, TimeoutSeconds of the .waitForTaskToken
+tasks, the context object ($$) and the States.JsonToString and
+States.StringToJson intrinsic functions. The Task resources are called
+through the resources generator given to the StateMachine.
+"""
+import fnmatch
+import heapq
+import itertools
+import json
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+
+# Virtual time 0
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+# Maximum size of a state input or output
+MAX_PAYLOAD = 256 * 1024
+
+PATH = re.compile(r"\.([^.\[\]]+)|\[(\d+)\]")
+INTRINSIC = re.compile(r"^(States\.\w+)\((.*)\)$")
+COMPARISON = re.compile(
+    r"^(String|Numeric|Boolean|Timestamp)"
+    r"(Equals|LessThan|GreaterThan|LessThanEquals|GreaterThanEquals|"
+    r"Matches)(Path)?$"
+)
+
+
+class StatesError(Exception):
+    """Error of a state, matched by the ErrorEquals of Retry and Catch"""
+
+    def __init__(self, error, cause=""):
+        super().__init__(f"{error}: {cause}" if cause else error)
+        self.error = error
+        self.cause = cause
+
+
+class Sleep:
+    """Command suspending a task for seconds of virtual time"""
+
+    def __init__(self, seconds):
+        self.seconds = max(seconds, 0)
+
+
+class Callback:
+    """Command suspending a task until its token is sent back, or failing
+    it with States.Timeout after timeout seconds"""
+
+    def __init__(self, token, timeout=None):
+        self.token = token
+        self.timeout = timeout
+
+
+class Gather:
+    """Command running generators as child tasks, at most limit at a time
+    (0 for no limit), resuming with their results in order or with the
+    first error, which cancels the others"""
+
+    def __init__(self, generators, limit=0):
+        self.generators = list(generators)
+        self.limit = limit
+
+
+class Token:
+    """Task token, holding the result when it is sent back before the
+    task waits for it"""
+
+    def __init__(self, token_id):
+        self.id = token_id
+        self.waiter = None
+        self.result = None
+
+
+class Task:
+    """A generator driven by the Loop, like an execution or a branch"""
+
+    def __init__(self, loop, generator, done=None):
+        self.loop = loop
+        self.generator = generator
+        self.done = done
+        self.children = []
+        self.token = None
+        self.timer = None
+        self.finished = False
+        # Resumes scheduled for an older suspension are ignored
+        self.suspension = 0
+
+    def start(self):
+        self.loop.call_later(0, self.resume, self.suspension)
+
+    def resume(self, suspension, value=None, error=None):
+        if self.finished or suspension != self.suspension:
+            return
+        self.suspension += 1
+        self.token = None
+        self.loop.cancel(self.timer)
+        self.timer = None
+        try:
+            if error is not None:
+                command = self.generator.throw(error)
+            else:
+                command = self.generator.send(value)
+        except StopIteration as stop:
+            self.finish(stop.value, None)
+            return
+        except StatesError as e:
+            self.finish(None, e)
+            return
+        self.handle(command)
+
+    def handle(self, command):
+        suspension = self.suspension
+        if isinstance(command, Sleep):
+            self.loop.call_later(command.seconds, self.resume, suspension)
+        elif isinstance(command, Callback):
+            token = command.token
+            if token.result is not None:
+                self.loop.call_later(0, self.resume, suspension,
+                                     *token.result)
+                return
+            token.waiter = (self, suspension)
+            self.token = token
+            if command.timeout:
+                self.timer = self.loop.call_later(
+                    command.timeout, self.timeout, token, suspension
+                )
+        elif isinstance(command, Gather):
+            self.gather(command, suspension)
+        else:
+            raise TypeError(f"Unknown command {command!r}")
+
+    def timeout(self, token, suspension):
+        if self.finished or suspension != self.suspension:
+            return
+        self.loop.tokens.pop(token.id, None)
+        self.resume(suspension, None, StatesError("States.Timeout"))
+
+    def gather(self, command, suspension):
+        results = [None] * len(command.generators)
+        pending = iter(enumerate(command.generators))
+        state = {"running": 0, "left": len(results)}
+        if not results:
+            self.loop.call_later(0, self.resume, suspension, [])
+            return
+
+        def start_next():
+            limit = command.limit or len(results)
+            while state["running"] < limit:
+                item = next(pending, None)
+                if item is None:
+                    return
+                index, generator = item
+                child = Task(self.loop, generator,
+                             lambda value, error, index=index:
+                             child_done(index, value, error))
+                self.children.append(child)
+                state["running"] += 1
+                child.start()
+
+        def child_done(index, value, error):
+            if self.finished or suspension != self.suspension:
+                return
+            if error is not None:
+                self.cancel_children()
+                self.resume(suspension, None, error)
+                return
+            results[index] = value
+            state["running"] -= 1
+            state["left"] -= 1
+            if state["left"]:
+                start_next()
+            else:
+                self.children = []
+                self.resume(suspension, results)
+
+        start_next()
+
+    def cancel_children(self):
+        children, self.children = self.children, []
+        for child in children:
+            child.cancel()
+
+    def cancel(self):
+        if self.finished:
+            return
+        self.finished = True
+        if self.token is not None:
+            self.loop.tokens.pop(self.token.id, None)
+        self.loop.cancel(self.timer)
+        self.cancel_children()
+        self.generator.close()
+
+    def finish(self, value, error):
+        self.finished = True
+        self.cancel_children()
+        if self.done is not None:
+            self.done(value, error)
+
+
+class Loop:
+    """Discrete event loop on a virtual clock in seconds"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.events = []
+        self.sequence = itertools.count()
+        self.tokens = {}
+        self.token_ids = itertools.count(1)
+
+    def datetime(self):
+        return EPOCH + timedelta(seconds=self.now)
+
+    def timestamp(self):
+        return self.datetime().isoformat(timespec="milliseconds").replace(
+            "+00:00", "Z"
+        )
+
+    def call_at(self, when, function, *args):
+        """Call a function at a virtual time
+
+        Returns
+        ------
+        Event, to cancel it: list
+
+        """
+
+        event = [when, next(self.sequence), function, args]
+        heapq.heappush(self.events, event)
+        return event
+
+    def call_later(self, delay, function, *args):
+        return self.call_at(self.now + delay, function, *args)
+
+    def cancel(self, event):
+        if event is not None:
+            event[2] = None
+
+    def pending(self):
+        """Whether any event is left"""
+
+        return any(x[2] is not None for x in self.events)
+
+    def spawn(self, generator, done=None):
+        task = Task(self, generator, done)
+        task.start()
+        return task
+
+    def run(self, until=None):
+        """Run the events up to the virtual time until, or all of them"""
+
+        while self.events:
+            if until is not None and self.events[0][0] > until:
+                self.now = until
+                return
+            when, _, function, args = heapq.heappop(self.events)
+            if function is None:
+                continue
+            self.now = max(self.now, when)
+            function(*args)
+
+    def token(self):
+        token = Token(f"token-{next(self.token_ids):08d}")
+        self.tokens[token.id] = token
+        return token
+
+    def send(self, token_id, output=None, error=None):
+        """Send a task token back, like SendTaskSuccess and
+        SendTaskFailure
+
+        Raises KeyError when the token is unknown, already sent back or
+        its task timed out or was cancelled.
+        """
+
+        token = self.tokens.pop(token_id)
+        if token.waiter is None:
+            token.result = (output, error)
+            return
+        task, suspension = token.waiter
+        self.call_later(0, task.resume, suspension, output, error)
+
+
+def parse_path(path):
+    if not path.startswith("$"):
+        raise StatesError("States.Runtime", f"Invalid path {path}")
+    return [
+        name if name else int(index)
+        for name, index in PATH.findall(path[1:])
+    ]
+
+
+def get_path(data, path, context=None):
+    if path.startswith("$$"):
+        data, path = context, path[1:]
+    for part in parse_path(path):
+        try:
+            data = data[part]
+        except (KeyError, IndexError, TypeError):
+            raise StatesError(
+                "States.Runtime", f"Invalid path {path}: {part} not found"
+            )
+    return data
+
+
+def set_path(data, path, value):
+    if path == "$":
+        return value
+    parts = parse_path(path)
+    data = json.loads(json.dumps(data))
+    node = data
+    for part in parts[:-1]:
+        node = node.setdefault(part, {})
+        if not isinstance(node, dict):
+            raise StatesError(
+                "States.Runtime", f"Invalid ResultPath {path}"
+            )
+    node[parts[-1]] = value
+    return data
+
+
+def evaluate(expression, data, context):
+    """Value of a path or of an intrinsic function of one path"""
+
+    match = INTRINSIC.match(expression)
+    if match is None:
+        return get_path(data, expression, context)
+    function, argument = match.groups()
+    value = evaluate(argument.strip(), data, context)
+    if function == "States.JsonToString":
+        return json.dumps(value, separators=(",", ":"))
+    if function == "States.StringToJson":
+        return json.loads(value)
+    raise StatesError("States.Runtime", f"Unsupported function {function}")
+
+
+def resolve(template, data, context):
+    """Payload template, like Parameters, with its ".$" fields replaced by
+    their values"""
+
+    if isinstance(template, dict):
+        result = {}
+        for key, value in template.items():
+            if key.endswith(".$"):
+                result[key[:-2]] = evaluate(value, data, context)
+            else:
+                result[key] = resolve(value, data, context)
+        return result
+    if isinstance(template, list):
+        return [resolve(x, data, context) for x in template]
+    return template
+
+
+def select(data, path, context=None):
+    """InputPath and OutputPath, null selects an empty object"""
+
+    if path is None:
+        return {}
+    return get_path(data, path, context)
+
+
+def timestamp(text):
+    return datetime.fromisoformat(text.replace("Z", "+00:00"))
+
+
+def compare(operator, value, expected):
+    kind, test, _ = COMPARISON.match(operator).groups()
+    if kind == "String" and not isinstance(value, str):
+        return False
+    if kind == "Numeric" and (
+        isinstance(value, bool) or not isinstance(value, (int, float))
+    ):
+        return False
+    if kind == "Boolean":
+        return isinstance(value, bool) and value == expected
+    if kind == "Timestamp":
+        try:
+            value, expected = timestamp(value), timestamp(expected)
+        except (TypeError, ValueError):
+            return False
+    if test == "Matches":
+        return fnmatch.fnmatchcase(value, expected)
+    return {
+        "Equals": value == expected,
+        "LessThan": value < expected,
+        "GreaterThan": value > expected,
+        "LessThanEquals": value <= expected,
+        "GreaterThanEquals": value >= expected
+    }[test]
+
+
+def matches(rule, data, context):
+    """Whether a Choice rule matches the state input"""
+
+    if "And" in rule:
+        return all(matches(x, data, context) for x in rule["And"])
+    if "Or" in rule:
+        return any(matches(x, data, context) for x in rule["Or"])
+    if "Not" in rule:
+        return not matches(rule["Not"], data, context)
+
+    try:
+        value = get_path(data, rule["Variable"], context)
+        present = True
+    except StatesError:
+        value, present = None, False
+    for operator, expected in rule.items():
+        if operator in ("Variable", "Next"):
+            continue
+        if operator == "IsPresent":
+            return present == expected
+        if not present:
+            raise StatesError(
+                "States.Runtime", f"Invalid path {rule['Variable']}"
+            )
+        if operator == "IsNull":
+            return (value is None) == expected
+        if operator == "IsString":
+            return isinstance(value, str) == expected
+        if operator == "IsBoolean":
+            return isinstance(value, bool) == expected
+        if operator == "IsNumeric":
+            return (
+                isinstance(value, (int, float)) and
+                not isinstance(value, bool)
+            ) == expected
+        if operator == "IsTimestamp":
+            try:
+                timestamp(value)
+                return expected
+            except (TypeError, ValueError):
+                return not expected
+        if operator.endswith("Path"):
+            expected = get_path(data, expected, context)
+        return compare(operator, value, expected)
+    raise StatesError("States.Runtime", f"Invalid Choice rule {rule}")
+
+
+def match_error(rules, error):
+    """First Retry or Catch rule matching an error name
+
+    Returns
+    ------
+    Index and rule, or None: tuple
+
+    """
+
+    if error == "States.Runtime":
+        # Never retried or caught
+        return None
+    for index, rule in enumerate(rules):
+        names = rule["ErrorEquals"]
+        if (
+            error in names or "States.ALL" in names or
+            ("States.TaskFailed" in names and error != "States.Timeout")
+        ):
+            return index, rule
+    return None
+
+
+def next_state(state):
+    return None if state.get("End") else state["Next"]
+
+
+class StateMachine:
+    """Executions of a state machine definition on a Loop
+
+    Parameters
+    ----------
+    definition: dict, required
+        Amazon States Language definition
+
+    loop: Loop, required
+        Event loop of the executions
+
+    resources: callable, required
+        resources(resource, parameters) returning a generator of the
+        commands of the call, returning the Task result or raising
+        StatesError
+
+    """
+
+    def __init__(self, definition, loop, resources):
+        self.definition = definition
+        self.loop = loop
+        self.resources = resources
+        self.transitions = Counter()
+        self.retries = Counter()
+        self.caught = Counter()
+        self.max_payload = 0
+
+    def execute(self, name, data):
+        """Generator of an execution, returning its output"""
+
+        context = {
+            "Execution": {
+                "Id": name,
+                "Input": data,
+                "Name": name,
+                "StartTime": self.loop.timestamp()
+            },
+            "StateMachine": {"Id": "simulated", "Name": "simulated"}
+        }
+        return (yield from self.run(self.definition, data, context))
+
+    def run(self, machine, data, context):
+        name = machine["StartAt"]
+        while name is not None:
+            state = machine["States"][name]
+            context = {
+                **context,
+                "State": {
+                    "Name": name,
+                    "EnteredTime": self.loop.timestamp()
+                }
+            }
+            self.transitions[name] += 1
+            data, name = yield from self.run_state(state, data, context)
+            size = len(json.dumps(data))
+            self.max_payload = max(self.max_payload, size)
+            if size > MAX_PAYLOAD:
+                raise StatesError(
+                    "States.DataLimitExceeded",
+                    f"The state/task output of {size} bytes exceeds the "
+                    f"{MAX_PAYLOAD} bytes limit"
+                )
+        return data
+
+    def run_state(self, state, data, context):
+        kind = state["Type"]
+        if kind == "Fail":
+            raise StatesError(
+                state.get("Error", "States.Fail"), state.get("Cause", "")
+            )
+        if kind == "Succeed":
+            value = select(data, state.get("InputPath", "$"))
+            return select(value, state.get("OutputPath", "$")), None
+        if kind == "Choice":
+            value = select(data, state.get("InputPath", "$"))
+            for rule in state["Choices"]:
+                if matches(rule, value, context):
+                    following = rule["Next"]
+                    break
+            else:
+                if "Default" not in state:
+                    raise StatesError("States.NoChoiceMatched")
+                following = state["Default"]
+            return select(value, state.get("OutputPath", "$")), following
+        if kind == "Wait":
+            value = select(data, state.get("InputPath", "$"))
+            yield Sleep(self.wait_seconds(state, value, context))
+            return select(value, state.get("OutputPath", "$")), \
+                next_state(state)
+        return (yield from self.run_task(state, data, context))
+
+    def wait_seconds(self, state, data, context):
+        if "Seconds" in state:
+            return state["Seconds"]
+        if "SecondsPath" in state:
+            return get_path(data, state["SecondsPath"], context)
+        if "TimestampPath" in state:
+            when = get_path(data, state["TimestampPath"], context)
+        else:
+            when = state["Timestamp"]
+        return (timestamp(when) - self.loop.datetime()).total_seconds()
+
+    def run_task(self, state, data, context):
+        """Task, Pass, Parallel and Map states, with Retry and Catch"""
+
+        attempts = {}
+        while True:
+            try:
+                result = yield from self.action(state, data, context)
+            except StatesError as e:
+                retrier = match_error(state.get("Retry", []), e.error)
+                if retrier is not None:
+                    index, rule = retrier
+                    count = attempts.get(index, 0)
+                    if count < rule.get("MaxAttempts", 3):
+                        attempts[index] = count + 1
+                        self.retries[e.error] += 1
+                        yield Sleep(
+                            rule.get("IntervalSeconds", 1) *
+                            rule.get("BackoffRate", 2.0) ** count
+                        )
+                        continue
+                catcher = match_error(state.get("Catch", []), e.error)
+                if catcher is None:
+                    raise
+                self.caught[e.error] += 1
+                rule = catcher[1]
+                path = rule.get("ResultPath", "$")
+                error = {"Error": e.error, "Cause": e.cause}
+                if path is not None:
+                    data = set_path(data, path, error)
+                return data, rule["Next"]
+
+            if "ResultSelector" in state:
+                result = resolve(state["ResultSelector"], result, context)
+            path = state.get("ResultPath", "$")
+            if path is not None:
+                data = set_path(data, path, result)
+            return select(data, state.get("OutputPath", "$")), \
+                next_state(state)
+
+    def action(self, state, data, context):
+        """Result of the work of a state, from its raw input"""
+
+        kind = state["Type"]
+        value = select(data, state.get("InputPath", "$"))
+
+        if kind == "Map":
+            items = get_path(value, state.get("ItemsPath", "$"), context)
+            processor = state.get("ItemProcessor") or state["Iterator"]
+            template = state.get("ItemSelector", state.get("Parameters"))
+            inputs = []
+            for index, item in enumerate(items):
+                if template is not None:
+                    item = resolve(template, value, {
+                        **context,
+                        "Map": {"Item": {"Index": index, "Value": item}}
+                    })
+                inputs.append(item)
+            return (yield Gather(
+                [self.run(processor, x, context) for x in inputs],
+                state.get("MaxConcurrency", 0)
+            ))
+
+        token = None
+        if kind == "Task" and state["Resource"].endswith(
+            ".waitForTaskToken"
+        ):
+            token = self.loop.token()
+            context = {**context, "Task": {"Token": token.id}}
+        if "Parameters" in state:
+            value = resolve(state["Parameters"], value, context)
+
+        if kind == "Pass":
+            return state.get("Result", value)
+        if kind == "Parallel":
+            return (yield Gather(
+                self.run(x, json.loads(json.dumps(value)), context)
+                for x in state["Branches"]
+            ))
+        if kind != "Task":
+            raise StatesError("States.Runtime", f"Unknown state {kind}")
+
+        try:
+            result = yield from self.resources(state["Resource"], value)
+        except StatesError:
+            if token is not None:
+                self.loop.tokens.pop(token.id, None)
+            raise
+        if token is not None:
+            result = yield Callback(token, state.get("TimeoutSeconds"))
+        return result
@@ -0,0 +1,107 @@
+"""Compare the streaming Transcript.json parser with the full load
+
+Usage:
+    python benchmarks/transcript_parser.py [--items N] [--chunk-size BYTES]
+
+Each mode runs in its own interpreter so the peak RSS reported is not
+polluted by the other one.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "source", "common"))
+
+WORDS = ["olá", "mundo", "vídeo", "legenda", "aula", "transcrição", "hoje"]
+
+
+def write_transcript(path, items):
+    """Write a synthetic Transcript.json with the given amount of items"""
+
+    rnd = random.Random(42)
+    start = 0.0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"jobName":"benchmark","accountId":"123456789012",')
+        f.write('"results":{"transcripts":[{"transcript":"')
+        f.write(" ".join(rnd.choice(WORDS) for _ in range(items)))
+        f.write('"}],"items":[')
+        for index in range(items):
+            if index:
+                f.write(",")
+            if index % 10 == 9:
+                item = {
+                    "type": "punctuation",
+                    "alternatives": [{"confidence": "0.0", "content": "."}]
+                }
+            else:
+                end = start + rnd.uniform(0.1, 0.6)
+                item = {
+                    "start_time": f"{start:.2f}",
+                    "end_time": f"{end:.2f}",
+                    "alternatives": [{
+                        "confidence": f"{rnd.random():.4f}",
+                        "content": rnd.choice(WORDS)
+                    }],
+                    "type": "pronunciation"
+                }
+                start = end + rnd.uniform(0.0, 0.3)
+            json.dump(item, f, ensure_ascii=False)
+        f.write(']},"status":"COMPLETED"}')
+
+
+def run(mode, path, chunk_size):
+    """Parse the transcript and return (items, seconds, peak rss in KB)"""
+
+    started = time.perf_counter()
+    count = 0
+    with open(path, "rb") as body:
+        if mode == "full":
+            transcript = json.loads(body.read().decode("utf-8"))
+            for _ in transcript["results"]["items"]:
+                count += 1
+        else:
+            from avod_common.transcript import iter_items
+            for _ in iter_items(body, chunk_size):
+                count += 1
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return count, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000000)
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024)
+    parser.add_argument("--mode", choices=["full", "stream"])
+    parser.add_argument("--path")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.mode, args.path, args.chunk_size)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "Transcript.json")
+        write_transcript(path, args.items)
+        size = os.path.getsize(path) / (1024 * 1024)
+        print(f"Transcript: {args.items} items, {size:.1f} MB")
+        print(f"{'mode':<8}{'items':>10}{'seconds':>10}{'peak rss MB':>14}")
+        for mode in ("full", "stream"):
+            output = subprocess.check_output([
+                sys.executable, __file__, "--mode", mode, "--path", path,
+                "--chunk-size", str(args.chunk_size)
+            ])
+            count, elapsed, peak = json.loads(output)
+            print(f"{mode:<8}{count:>10}{elapsed:>10.2f}{peak / 1024:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
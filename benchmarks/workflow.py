@@ -0,0 +1,1241 @@
+"""End to end simulation of the AVOD workflow on a virtual clock
+
+Usage:
+    python benchmarks/workflow.py [--workflows N] [--arrival-rate N]
+                                  [--duration SECONDS[-SECONDS]]
+                                  [--admission] [--ledger] [--redrive N]
+                                  [--parameter NAME=VALUE]
+
+The state machine of cloudformations/StepFunctions.yaml runs on the
+interpreter of benchmarks/states.py and calls the real lambda_handlers
+in-process. The uploads go through StartWorkflowFunction and the job
+state changes of MediaConvert and Transcribe are delivered to
+CompleteJobFunction, like the EventBridge rules of template.yaml do.
+
+S3, DynamoDB and Step Functions are kept in memory. MediaConvert and
+Transcribe run their jobs on queues with a concurrency limit, for a
+fixed overhead plus a time per second of media, and write the outputs
+the functions read next. With --admission the Admission function uses
+an in memory scheduler on the virtual clock, dispatched every minute.
+With --ledger the functions record the run ledger, and the queue and
+run times of its stages are reported.
+With --redrive N a failed workflow is re-driven by the Redrive function
+up to N times, from the outputs it left.
+
+The functions read their environment as usual, e.g. with
+TRANSCRIBECHUNKSECONDS=300 the transcription is chunked. They share
+one process, so module level caches like the MediaConvert endpoint are
+shared too, and the Admission function never sleeps waiting for tokens.
+The audio of the sources is remuxed by RemuxAudioFunction, in
+--remux-speed seconds per second of audio, and extracted by MediaConvert
+with AUDIOREMUX=false.
+With MCROUTING the MediaConvert jobs go to the queues and priorities of
+its rules, see avod_common.routing, and an accelerated HLS job runs at
+--accelerated-speed.
+VerifyHLSFunction checks the HLS output, with --segment-loss some of
+its segments are left out and the HLS stage fails.
+
+Reported: end to end latency percentiles, state transitions, Lambda
+invocations and peak concurrency, API calls with their peak per second,
+and the peak running and waiting jobs and the queue time of each
+service queue and of the MediaConvert jobs of each stage.
+"""
+import argparse
+import functools
+import hashlib
+import heapq
+import importlib.util
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import yaml
+from botocore.exceptions import ClientError
+
+import handlers
+from states import Loop, Sleep, StateMachine, StatesError
+
+
+TEMPLATE = os.path.join(handlers.ROOT, "template.yaml")
+STEPFUNCTIONS = os.path.join(
+    handlers.ROOT, "cloudformations", "StepFunctions.yaml"
+)
+BUCKET = handlers.BUCKET
+ENDPOINT = handlers.ENDPOINT
+ACCOUNT = "arn:aws:mediaconvert:us-east-1:012345678910"
+
+# Functions invoked by events instead of by the state machine
+START_WORKFLOW = "StartWorkflowFunction"
+COMPLETE_JOB = "CompleteJobFunction"
+ADMISSION = "AdmissionFunction"
+REDRIVE = "RedriveFunction"
+REMUX = "RemuxAudioFunction"
+
+# Body of the HLS segments, a null TS packet
+TS_PACKET = b"\x47\x1f\xff\x10" + bytes(184)
+
+# Executions of the default SFARN of the functions
+EXECUTIONS = "arn:aws:states:us-east-1:123456789012:execution:AVOD"
+
+# Error name prefix of the Step Functions service integrations
+INTEGRATION_ERRORS = {"dynamodb": "DynamoDB"}
+
+
+class TemplateLoader(yaml.SafeLoader):
+    """Loader reading the CloudFormation short form functions, like !Ref,
+    as their long form"""
+
+
+def construct_function(loader, name, node):
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+    if name == "Ref":
+        return {"Ref": value}
+    if name == "GetAtt" and isinstance(value, str):
+        value = value.split(".", 1)
+    return {f"Fn::{name}": value}
+
+
+TemplateLoader.add_multi_constructor("!", construct_function)
+
+
+def load_template(path):
+    with open(path) as f:
+        return yaml.load(f, Loader=TemplateLoader)
+
+
+def reference(template, value, overrides=None):
+    """Value of a !Ref to a parameter, its Default unless overridden"""
+
+    if isinstance(value, dict) and "Ref" in value:
+        name = value["Ref"]
+        if overrides and name in overrides:
+            return overrides[name]
+        return template["Parameters"][name]["Default"]
+    return value
+
+
+def load_definition(overrides):
+    """State machine definition of StepFunctions.yaml, with its Fn::Sub
+    variables replaced by the parameters"""
+
+    template = load_template(STEPFUNCTIONS)
+    machine = next(
+        x for x in template["Resources"].values()
+        if x["Type"] == "AWS::StepFunctions::StateMachine"
+    )
+    text, variables = machine["Properties"]["DefinitionString"]["Fn::Sub"]
+    return json.loads(re.sub(
+        r"\$\{([^}!.]+)\}",
+        lambda x: str(reference(template, variables[x.group(1)], overrides)),
+        text
+    ))
+
+
+def function_name(arn):
+    """Logical name of a function of template.yaml from its ARN, like
+    ProbeMediaFunction from ...:function:avod-ProbeMediaFunction"""
+
+    return arn.rsplit(":", 1)[1].split("-", 1)[-1]
+
+
+def table_keys(template):
+    """Key attributes of the DynamoDB tables by table name"""
+
+    return {
+        reference(template, x["Properties"]["TableName"]): [
+            key["AttributeName"] for key in x["Properties"]["KeySchema"]
+        ]
+        for x in template["Resources"].values()
+        if x["Type"] == "AWS::DynamoDB::Table"
+    }
+
+
+def import_handlers(template):
+    """lambda_handler of the functions of template.yaml by name"""
+
+    sys.path.insert(0, os.path.join(handlers.SOURCE, "common"))
+    functions = {}
+    for name, resource in template["Resources"].items():
+        if resource["Type"] != "AWS::Serverless::Function":
+            continue
+        code = os.path.join(handlers.ROOT, resource["Properties"]["CodeUri"])
+        # Modules next to app.py, like ladder, are imported by name
+        sys.path.insert(1, code)
+        spec = importlib.util.spec_from_file_location(
+            f"{os.path.basename(code)}_app", os.path.join(code, "app.py")
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        functions[name] = module
+    return functions
+
+
+def exceptions(*codes):
+    """Namespace of ClientError classes by error code, like the
+    exceptions of a boto3 client"""
+
+    return type("Exceptions", (), {
+        code: type(code, (ClientError,), {}) for code in codes
+    })
+
+
+def client_error(namespace, code, operation, message=""):
+    return getattr(namespace, code)(
+        {"Error": {"Code": code, "Message": message}}, operation
+    )
+
+
+def split_uri(uri):
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def timecode_seconds(timecode):
+    hours, minutes, seconds, _ = (int(x) for x in timecode.split(":"))
+    return hours * 3600 + minutes * 60 + seconds
+
+
+@functools.lru_cache(maxsize=None)
+def source_mp4(seconds):
+    return handlers.mp4(seconds)
+
+
+def mp4_seconds(data):
+    """Duration of a MP4 written by a function, like the remuxed audio"""
+
+    from avod_common import probe
+
+    for box_type, start, end in probe.iter_boxes(data):
+        if box_type == b"moov":
+            return probe.parse_moov(data[start:end])["duration"]
+    return None
+
+
+@functools.lru_cache(maxsize=64)
+def speech(seconds, words_per_second):
+    return handlers.transcript(
+        int(seconds * words_per_second), spacing=1 / words_per_second
+    )
+
+
+class Recorded:
+    """Client proxy counting the calls of each operation by virtual
+    second"""
+
+    def __init__(self, service, client, simulation):
+        self.service = service
+        self.client = client
+        self.simulation = simulation
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if name == "exceptions" or not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            self.simulation.calls[(self.service, name)][
+                int(self.simulation.loop.now)
+            ] += 1
+            return attribute(*args, **kwargs)
+
+        return call
+
+
+class JobQueue:
+    """Jobs of a service queue, running at most concurrency at a time, by
+    priority then submission"""
+
+    def __init__(self, loop, concurrency):
+        self.loop = loop
+        self.concurrency = concurrency
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.running = 0
+        self.jobs = 0
+        self.peak_running = 0
+        self.peak_waiting = 0
+        self.queued_seconds = []
+
+    def submit(self, seconds, start, finish, priority=0):
+        self.jobs += 1
+        heapq.heappush(self.waiting, (
+            -priority, next(self.sequence), self.loop.now, seconds, start,
+            finish
+        ))
+        self.dispatch()
+
+    def dispatch(self):
+        while self.waiting and self.running < self.concurrency:
+            _, _, submitted, seconds, start, finish = heapq.heappop(
+                self.waiting
+            )
+            self.running += 1
+            self.queued_seconds.append(self.loop.now - submitted)
+            start()
+            self.loop.call_later(seconds, self.finish, finish)
+        self.peak_running = max(self.peak_running, self.running)
+        self.peak_waiting = max(self.peak_waiting, len(self.waiting))
+
+    def finish(self, finish):
+        self.running -= 1
+        finish()
+        self.dispatch()
+
+
+class Paginator:
+    """Paginator of the operations returning everything in one page"""
+
+    def __init__(self, operation):
+        self.operation = operation
+
+    def paginate(self, **kwargs):
+        yield self.operation(**kwargs)
+
+
+class S3:
+    """In memory buckets, with the media duration of the sources and
+    audio files for the jobs reading them"""
+
+    exceptions = exceptions("NoSuchKey", "NoSuchUpload")
+
+    def __init__(self):
+        self.objects = {}
+        self.durations = {}
+        self.uploads = {}
+        self.upload_ids = itertools.count(1)
+
+    def put(self, bucket, key, data, duration=None):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.objects[(bucket, key)] = bytes(data)
+        if duration is None and data[4:8] == b"ftyp":
+            duration = mp4_seconds(data)
+        if duration is not None:
+            self.durations[(bucket, key)] = duration
+
+    def delete_prefix(self, bucket, prefix):
+        for stored in (self.objects, self.durations):
+            for key in [x for x in stored if x[0] == bucket and
+                        x[1].startswith(prefix)]:
+                del stored[key]
+
+    def read(self, bucket, key, operation):
+        data = self.objects.get((bucket, key))
+        if data is None:
+            raise client_error(
+                self.exceptions, "NoSuchKey", operation,
+                "The specified key does not exist."
+            )
+        return data
+
+    def head_object(self, Bucket, Key, **kwargs):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError(
+                {"Error": {"Code": "404", "Message": "Not Found"}},
+                "HeadObject"
+            )
+        data = self.objects[(Bucket, Key)]
+        return {
+            "ContentLength": len(data),
+            "ETag": f"\"{hashlib.md5(data).hexdigest()}\""
+        }
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        data = self.read(Bucket, Key, "GetObject")
+        response = {}
+        if Range is not None:
+            start, end = Range.split("=")[1].split("-")
+            end = min(int(end), len(data) - 1)
+            response["ContentRange"] = f"bytes {start}-{end}/{len(data)}"
+            data = data[int(start):end + 1]
+        return {
+            "Body": handlers.body(data),
+            "ContentLength": len(data),
+            **response
+        }
+
+    def list_objects_v2(self, Bucket, Prefix="", **kwargs):
+        return {
+            "Contents": [
+                {"Key": key, "Size": len(data)}
+                for (bucket, key), data in sorted(self.objects.items())
+                if bucket == Bucket and key.startswith(Prefix)
+            ]
+        }
+
+    def get_paginator(self, operation):
+        return Paginator(getattr(self, operation))
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        self.put(Bucket, Key, Body)
+        return {"ETag": "\"etag\""}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = f"upload-{next(self.upload_ids)}"
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body,
+                    **kwargs):
+        if UploadId not in self.uploads:
+            raise client_error(self.exceptions, "NoSuchUpload", "UploadPart")
+        self.uploads[UploadId][PartNumber] = bytes(Body)
+        return {"ETag": f"\"{PartNumber}\""}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId,
+                                  MultipartUpload, **kwargs):
+        parts = self.uploads.pop(UploadId)
+        self.put(Bucket, Key, b"".join(
+            parts[x["PartNumber"]] for x in MultipartUpload["Parts"]
+        ))
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self.uploads.pop(UploadId, None)
+        return {}
+
+
+class MediaConvert:
+    """MediaConvert jobs writing the HLS playlists and the audio file of
+    their settings, the segments are a single TS packet and
+    --segment-loss of them are left out"""
+
+    exceptions = exceptions(
+        "BadRequestException", "NotFoundException",
+        "TooManyRequestsException"
+    )
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.jobs = {}
+        self.seconds = {}
+        self.queues = {}
+        self.tokens = {}
+        self.waits = defaultdict(list)
+        self.ids = itertools.count(1)
+
+    def queue(self, name):
+        if name not in self.queues:
+            self.queues[name] = JobQueue(
+                self.simulation.loop,
+                self.simulation.args.mediaconvert_concurrency
+            )
+        return self.queues[name]
+
+    def describe_endpoints(self, **kwargs):
+        return {"Endpoints": [{"Url": ENDPOINT}]}
+
+    def create_job(self, Role, Settings, Queue="Default", Priority=0,
+                   ClientRequestToken=None, UserMetadata=None,
+                   AccelerationSettings=None, **kwargs):
+        loop = self.simulation.loop
+        if ClientRequestToken in self.tokens:
+            # Same request within a minute, the first job is returned
+            job_id, created = self.tokens[ClientRequestToken]
+            if loop.now - created < 60:
+                return {"Job": self.describe(self.jobs[job_id])}
+        group = Settings["OutputGroups"][0]
+        stage = "audio"
+        if group["OutputGroupSettings"]["Type"] == "HLS_GROUP_SETTINGS":
+            stage = "hls"
+        source = Settings["Inputs"][0]
+        duration = self.simulation.media_seconds(source["FileInput"])
+        clippings = source.get("InputClippings")
+        if clippings:
+            start = timecode_seconds(clippings[0]["StartTimecode"])
+            end = duration
+            if "EndTimecode" in clippings[0]:
+                end = min(timecode_seconds(clippings[0]["EndTimecode"]), end)
+            duration = max(end - start, 0)
+
+        job_id = f"{int(loop.now * 1000):013d}-{next(self.ids):06x}"
+        queue = Queue.rsplit("/", 1)[-1]
+        job = {
+            "Id": job_id,
+            "Arn": f"{ACCOUNT}:jobs/{job_id}",
+            "Role": Role,
+            "Settings": Settings,
+            "Queue": f"{ACCOUNT}:queues/{queue}",
+            "Priority": Priority,
+            "UserMetadata": UserMetadata or {},
+            "Status": "SUBMITTED",
+            "CreatedAt": loop.datetime(),
+            "Timing": {"SubmitTime": loop.datetime()}
+        }
+        self.jobs[job_id] = job
+        if ClientRequestToken is not None:
+            self.tokens[ClientRequestToken] = (job_id, loop.now)
+        speed = stage
+        if stage == "hls" and (AccelerationSettings or {}).get(
+            "Mode", "DISABLED"
+        ) != "DISABLED":
+            speed = "accelerated"
+        self.seconds[job_id] = self.simulation.job_seconds(speed, duration)
+        self.queue(queue).submit(
+            self.seconds[job_id],
+            functools.partial(self.start, job, stage),
+            functools.partial(self.finish, job, stage, duration),
+            Priority
+        )
+        return {"Job": self.describe(job)}
+
+    def get_job(self, Id, **kwargs):
+        if Id not in self.jobs:
+            raise client_error(
+                self.exceptions, "NotFoundException", "GetJob",
+                f"Job {Id} not found"
+            )
+        return {"Job": self.describe(self.jobs[Id])}
+
+    def describe(self, job):
+        job = dict(job, Timing=dict(job["Timing"]))
+        if job["Status"] == "PROGRESSING":
+            elapsed = (
+                self.simulation.loop.datetime() - job["Timing"]["StartTime"]
+            ).total_seconds()
+            job["JobPercentComplete"] = min(
+                int(100 * elapsed / self.seconds[job["Id"]]), 99
+            )
+        return job
+
+    def start(self, job, stage):
+        job["Status"] = "PROGRESSING"
+        job["Timing"]["StartTime"] = self.simulation.loop.datetime()
+        self.waits[stage].append((
+            job["Timing"]["StartTime"] - job["Timing"]["SubmitTime"]
+        ).total_seconds())
+
+    def finish(self, job, stage, duration):
+        job["Timing"]["FinishTime"] = self.simulation.loop.datetime()
+        detail = {"jobId": job["Id"], "queue": job["Queue"]}
+        if self.simulation.fails():
+            job["Status"] = "ERROR"
+            job["ErrorCode"] = 1999
+            job["ErrorMessage"] = "Simulated failure"
+            detail["errorMessage"] = job["ErrorMessage"]
+        else:
+            job["Status"] = "COMPLETE"
+            self.write_outputs(job["Settings"], stage, duration)
+        detail["status"] = job["Status"]
+        self.simulation.emit({
+            "source": "aws.mediaconvert",
+            "detail-type": "MediaConvert Job State Change",
+            "detail": detail
+        })
+
+    def write_outputs(self, settings, stage, duration):
+        s3 = self.simulation.s3
+        group = settings["OutputGroups"][0]
+        source = settings["Inputs"][0]["FileInput"]
+        base = source.rsplit("/", 1)[1].rsplit(".", 1)[0]
+
+        if stage == "audio":
+            bucket, prefix = split_uri(group["OutputGroupSettings"][
+                "FileGroupSettings"]["Destination"])
+            output = group["Outputs"][0]
+            s3.put(
+                bucket,
+                f"{prefix}{base}{output['NameModifier']}."
+                f"{output['Extension']}",
+                b"", duration
+            )
+            return
+
+        hls_settings = group["OutputGroupSettings"]["HlsGroupSettings"]
+        bucket, prefix = split_uri(hls_settings["Destination"])
+        length = hls_settings["SegmentLength"]
+        durations = [length] * int(duration // length)
+        if duration % length or not durations:
+            durations.append(duration % length or length)
+        master = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+        for output in group["Outputs"]:
+            video = output.get("VideoDescription")
+            if video is None:
+                continue
+            name = f"{base}{output['NameModifier']}"
+            codec = next(
+                x for x in video["CodecSettings"].values()
+                if isinstance(x, dict)
+            )
+            audio = output["AudioDescriptions"][0]["CodecSettings"][
+                "AacSettings"]["Bitrate"]
+            bandwidth = (codec.get("MaxBitrate") or codec["Bitrate"]) + audio
+            master += [
+                f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},"
+                f"RESOLUTION={video['Width']}x{video['Height']}",
+                f"{name}.m3u8"
+            ]
+            segments = []
+            for index, seconds in enumerate(durations, 1):
+                segment = f"{name}_{index:05d}.ts"
+                if self.simulation.rng.random() >= (
+                    self.simulation.args.segment_loss
+                ):
+                    s3.put(bucket, f"{prefix}{segment}", TS_PACKET)
+                segments.append({"uri": segment, "duration": seconds})
+            s3.put(bucket, f"{prefix}{name}.m3u8",
+                   self.simulation.hls.media_playlist(segments))
+        s3.put(bucket, f"{prefix}{base}.m3u8", "\n".join(master) + "\n")
+
+
+class Transcribe:
+    """Transcribe jobs writing a synthetic Transcript.json of
+    --words-per-second"""
+
+    exceptions = exceptions(
+        "BadRequestException", "ConflictException", "NotFoundException",
+        "LimitExceededException"
+    )
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.jobs = {}
+        self.queue = JobQueue(
+            simulation.loop, simulation.args.transcribe_concurrency
+        )
+
+    def start_transcription_job(self, TranscriptionJobName, Media,
+                                OutputBucketName=None, OutputKey=None,
+                                **kwargs):
+        if TranscriptionJobName in self.jobs:
+            raise client_error(
+                self.exceptions, "ConflictException",
+                "StartTranscriptionJob",
+                "The requested job name already exists."
+            )
+        duration = self.simulation.media_seconds(Media["MediaFileUri"])
+        job = {
+            "TranscriptionJobName": TranscriptionJobName,
+            "TranscriptionJobStatus": "QUEUED",
+            "LanguageCode": kwargs.get("LanguageCode"),
+            "Media": Media,
+            "CreationTime": self.simulation.loop.datetime()
+        }
+        self.jobs[TranscriptionJobName] = job
+        output = (OutputBucketName or "transcribe-output",
+                  OutputKey or f"{TranscriptionJobName}.json")
+        self.queue.submit(
+            self.simulation.job_seconds("transcribe", duration),
+            functools.partial(self.start, job),
+            functools.partial(self.finish, job, output, duration)
+        )
+        return {"TranscriptionJob": dict(job)}
+
+    def get_transcription_job(self, TranscriptionJobName, **kwargs):
+        if TranscriptionJobName not in self.jobs:
+            raise client_error(
+                self.exceptions, "BadRequestException",
+                "GetTranscriptionJob",
+                "The requested job couldn't be found."
+            )
+        return {"TranscriptionJob": dict(self.jobs[TranscriptionJobName])}
+
+    def delete_transcription_job(self, TranscriptionJobName, **kwargs):
+        self.jobs.pop(TranscriptionJobName, None)
+        return {}
+
+    def start(self, job):
+        job["TranscriptionJobStatus"] = "IN_PROGRESS"
+        job["StartTime"] = self.simulation.loop.datetime()
+
+    def finish(self, job, output, duration):
+        job["CompletionTime"] = self.simulation.loop.datetime()
+        detail = {"TranscriptionJobName": job["TranscriptionJobName"]}
+        if self.simulation.fails():
+            job["TranscriptionJobStatus"] = "FAILED"
+            job["FailureReason"] = "Simulated failure"
+            detail["FailureReason"] = job["FailureReason"]
+        else:
+            job["TranscriptionJobStatus"] = "COMPLETED"
+            bucket, key = output
+            self.simulation.s3.put(bucket, key, speech(
+                round(duration), self.simulation.args.words_per_second
+            ))
+            job["Transcript"] = {
+                "TranscriptFileUri":
+                    f"https://s3.us-east-1.amazonaws.com/{bucket}/{key}"
+            }
+        detail["TranscriptionJobStatus"] = job["TranscriptionJobStatus"]
+        self.simulation.emit({
+            "source": "aws.transcribe",
+            "detail-type": "Transcribe Job State Change",
+            "detail": detail
+        })
+
+
+class StepFunctions:
+    """Task tokens and executions of the simulated state machine"""
+
+    exceptions = exceptions(
+        "TaskTimedOut", "TaskDoesNotExist", "InvalidToken",
+        "ExecutionAlreadyExists", "ExecutionDoesNotExist"
+    )
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+
+    def send(self, operation, token, output=None, error=None):
+        try:
+            self.simulation.loop.send(token, output, error)
+        except KeyError:
+            raise client_error(
+                self.exceptions, "TaskTimedOut", operation,
+                "Task Timed Out"
+            )
+        return {}
+
+    def send_task_success(self, taskToken, output, **kwargs):
+        return self.send("SendTaskSuccess", taskToken, json.loads(output))
+
+    def send_task_failure(self, taskToken, error="", cause="", **kwargs):
+        return self.send(
+            "SendTaskFailure", taskToken, error=StatesError(error, cause)
+        )
+
+    def describe_execution(self, executionArn, **kwargs):
+        name = executionArn.rsplit(":", 1)[1]
+        if name not in self.simulation.executions:
+            raise client_error(
+                self.exceptions, "ExecutionDoesNotExist",
+                "DescribeExecution", f"Execution Does Not Exist: '{name}'"
+            )
+        return {
+            "executionArn": executionArn,
+            "name": name,
+            "input": json.dumps(self.simulation.executions[name]["input"])
+        }
+
+    def start_execution(self, stateMachineArn, name, input="{}",
+                        **kwargs):
+        if name in self.simulation.executions:
+            raise client_error(
+                self.exceptions, "ExecutionAlreadyExists",
+                "StartExecution", f"Execution Already Exists: '{name}'"
+            )
+        self.simulation.start(name, json.loads(input))
+        return {
+            "executionArn": (
+                f"{stateMachineArn.replace(':stateMachine:', ':execution:')}"
+                f":{name}"
+            ),
+            "startDate": self.simulation.loop.datetime()
+        }
+
+
+class DynamoDB:
+    """In memory tables, keyed by the KeySchema of template.yaml"""
+
+    exceptions = exceptions(
+        "ResourceNotFoundException", "ConditionalCheckFailedException"
+    )
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.tables = defaultdict(dict)
+
+    def key(self, table, item, operation):
+        if table not in self.keys:
+            raise client_error(
+                self.exceptions, "ResourceNotFoundException", operation,
+                "Requested resource not found"
+            )
+        return tuple(
+            json.dumps(item[x], sort_keys=True) for x in self.keys[table]
+        )
+
+    def get_item(self, TableName, Key, **kwargs):
+        item = self.tables[TableName].get(
+            self.key(TableName, Key, "GetItem")
+        )
+        return {} if item is None else {"Item": json.loads(item)}
+
+    def put_item(self, TableName, Item, ConditionExpression=None,
+                 **kwargs):
+        """Unconditional or attribute_not_exists of the key only"""
+
+        key = self.key(TableName, Item, "PutItem")
+        if (
+            ConditionExpression and
+            ConditionExpression.startswith("attribute_not_exists(") and
+            key in self.tables[TableName]
+        ):
+            raise client_error(
+                self.exceptions, "ConditionalCheckFailedException",
+                "PutItem", "The conditional request failed"
+            )
+        self.tables[TableName][key] = json.dumps(Item)
+        return {}
+
+    def update_item(self, TableName, Key, UpdateExpression,
+                    ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, **kwargs):
+        """SET of values and of list_append(if_not_exists(...)) only"""
+
+        key = self.key(TableName, Key, "UpdateItem")
+        stored = self.tables[TableName].get(key)
+        item = dict(Key) if stored is None else json.loads(stored)
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        for name, empty, appended, value in re.findall(
+            r"(#\w+) = (?:list_append\(if_not_exists\(#\w+, (:\w+)\), "
+            r"(:\w+)\)|(:\w+))",
+            UpdateExpression
+        ):
+            attribute = names.get(name, name)
+            if value:
+                item[attribute] = values[value]
+            else:
+                current = item.get(attribute, values[empty])
+                item[attribute] = {
+                    "L": current["L"] + values[appended]["L"]
+                }
+        self.tables[TableName][key] = json.dumps(item)
+        return {}
+
+    def delete_item(self, TableName, Key, **kwargs):
+        self.tables[TableName].pop(self.key(TableName, Key, "DeleteItem"),
+                                   None)
+        return {}
+
+
+class VirtualClock:
+    """Admission scheduler clock on the virtual time"""
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def time(self):
+        return self.loop.now
+
+    def sleep(self, seconds):
+        raise RuntimeError("The simulated Admission function can't sleep")
+
+
+def virtual_datetime(loop):
+    """datetime class whose now() is the virtual time"""
+
+    class VirtualDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            now = loop.datetime()
+            return now.astimezone(tz) if tz else now.replace(tzinfo=None)
+
+    return VirtualDatetime
+
+
+class Simulation:
+    """Uploads, executions and services of one simulation run"""
+
+    def __init__(self, args):
+        self.args = args
+        self.loop = Loop()
+        self.rng = random.Random(args.seed)
+        self.output = open(os.devnull, "w")
+        self.calls = defaultdict(Counter)
+        self.invocations = Counter()
+        self.errors = Counter()
+        self.handler_seconds = defaultdict(list)
+        self.lambda_running = 0
+        self.lambda_peak = 0
+        self.executions = {}
+
+        template = load_template(TEMPLATE)
+        self.functions = import_handlers(template)
+        from avod_common import (
+            admission, clients, hls, ledger, payloads, polling
+        )
+
+        self.hls = hls
+        self.s3 = S3()
+        self.mediaconvert = MediaConvert(self)
+        self.transcribe = Transcribe(self)
+        self.clients = {
+            service: Recorded(service, client, self)
+            for service, client in (
+                ("s3", self.s3),
+                ("mediaconvert", self.mediaconvert),
+                ("transcribe", self.transcribe),
+                ("stepfunctions", StepFunctions(self)),
+                ("dynamodb", DynamoDB(table_keys(template)))
+            )
+        }
+        for service, client in self.clients.items():
+            clients.clients[(service, None)] = client
+        clients.clients[("mediaconvert", ENDPOINT)] = (
+            self.clients["mediaconvert"]
+        )
+        polling.datetime = payloads.datetime = ledger.datetime = (
+            virtual_datetime(self.loop)
+        )
+        ledger.ledger_table = ""
+        if args.ledger:
+            ledger.ledger_table = reference(
+                template,
+                template["Resources"]["LedgerTable"]["Properties"][
+                    "TableName"]
+            )
+        self.ledger = ledger
+
+        admission.scheduler.clear()
+        admission.admission_table = ""
+        if args.admission:
+            admission.admission_table = "simulated"
+            admission.scheduler["default"] = admission.Scheduler(
+                admission.MemoryStore(),
+                admission.send_task_success(self.clients["stepfunctions"]),
+                VirtualClock(self.loop)
+            )
+            self.functions[ADMISSION].acquire_wait = 0
+            self.functions[ADMISSION].tick_wait = 0
+
+        self.machine = StateMachine(
+            load_definition(dict(args.parameter)), self.loop, self.resource
+        )
+
+    def fails(self):
+        return self.rng.random() < self.args.failure_rate
+
+    def media_seconds(self, uri):
+        return self.s3.durations.get(split_uri(uri), self.args.duration[0])
+
+    def job_seconds(self, stage, duration):
+        speed = {
+            "audio": self.args.audio_speed,
+            "hls": self.args.hls_speed,
+            "accelerated": self.args.accelerated_speed,
+            "transcribe": self.args.transcribe_speed
+        }[stage]
+        jitter = self.rng.uniform(-self.args.jitter, self.args.jitter)
+        return (self.args.job_overhead + duration * speed) * (1 + jitter)
+
+    def call(self, function, event):
+        """Call a handler like Lambda: JSON in and out, exceptions as the
+        error name
+
+        Returns
+        ------
+        Result and StatesError, one of them None: tuple
+
+        """
+
+        self.invocations[function] += 1
+        event = json.loads(json.dumps(event))
+        started = time.perf_counter()
+        try:
+            with redirect_stdout(self.output):
+                result = self.functions[function].lambda_handler(
+                    event, None
+                )
+        except Exception as e:
+            result, error = None, StatesError(type(e).__name__, str(e))
+        else:
+            try:
+                result, error = json.loads(json.dumps(result)), None
+            except (TypeError, ValueError) as e:
+                result, error = None, StatesError(
+                    "Runtime.MarshalError", str(e)
+                )
+        self.handler_seconds[function].append(
+            time.perf_counter() - started
+        )
+        if error is not None:
+            self.errors[(function, error.error)] += 1
+        return result, error
+
+    def busy_seconds(self, function, result):
+        """Seconds a function works on top of --lambda-seconds, the audio
+        remux copying the samples"""
+
+        if function != REMUX or not result:
+            return 0
+        audio = result["Outputs"].get("Audio", {})
+        return audio.get("seconds", 0) * self.args.remux_speed
+
+    def invoke(self, function, payload):
+        """Generator of a Lambda invocation lasting --lambda-seconds"""
+
+        self.lambda_running += 1
+        self.lambda_peak = max(self.lambda_peak, self.lambda_running)
+        try:
+            result, error = self.call(function, payload)
+            yield Sleep(
+                self.args.lambda_seconds + self.busy_seconds(function, result)
+            )
+        finally:
+            self.lambda_running -= 1
+        if error is not None:
+            raise error
+        return result
+
+    def invoke_async(self, function, event):
+        """Invocation by an event, like S3 or EventBridge"""
+
+        self.loop.spawn(self.invoke(function, event))
+
+    def resource(self, resource, parameters):
+        """Task resources: Lambda functions, lambda:invoke and the SDK
+        integrations of the simulated clients"""
+
+        if resource.startswith("arn:aws:lambda:"):
+            return (yield from self.invoke(
+                function_name(resource), parameters
+            ))
+        service, action = resource.split(":::", 1)[1].split(".")[0].split(
+            ":"
+        )
+        if service == "lambda" and action == "invoke":
+            payload = yield from self.invoke(
+                function_name(parameters["FunctionName"]),
+                parameters.get("Payload", {})
+            )
+            return {"Payload": payload, "StatusCode": 200}
+
+        yield Sleep(self.args.integration_seconds)
+        method = re.sub(r"([A-Z])", r"_\1", action).lower()
+        try:
+            return getattr(self.clients[service], method)(**parameters)
+        except ClientError as e:
+            raise StatesError(
+                f"{INTEGRATION_ERRORS.get(service, service)}."
+                f"{e.response['Error']['Code']}",
+                e.response["Error"]["Message"]
+            )
+
+    def emit(self, event):
+        """Job state change event, delivered after --event-delay"""
+
+        self.loop.call_later(
+            self.args.event_delay, self.invoke_async, COMPLETE_JOB, event
+        )
+
+    def start(self, name, data):
+        self.executions[name] = {
+            "start": self.loop.now,
+            "uuid": data["metadata"]["uuid"],
+            "redrive": data["metadata"].get("redrive", 0),
+            "input": data
+        }
+        self.loop.spawn(
+            self.machine.execute(name, data),
+            functools.partial(self.finished, name)
+        )
+
+    def finished(self, name, output, error):
+        execution = self.executions[name]
+        execution["end"] = self.loop.now
+        execution["error"] = None if error is None else error.error
+        if error is not None and execution["redrive"] < self.args.redrive:
+            # The outputs are kept for the re-drive to skip those stages
+            self.loop.call_later(
+                self.args.redrive_delay, self.invoke_async, REDRIVE,
+                {"execution_arn": f"{EXECUTIONS}:{name}"}
+            )
+        elif not self.args.keep_objects:
+            self.s3.delete_prefix(BUCKET, f"outputs/{execution['uuid']}/")
+
+    def upload(self, index, record):
+        duration = self.rng.uniform(*self.args.duration)
+        key = f"input/video_{index:05d}.mp4"
+        self.s3.put(BUCKET, key, source_mp4(round(duration)), duration)
+        record = json.loads(json.dumps(record))
+        record["eventTime"] = self.loop.timestamp()
+        record["s3"]["bucket"]["name"] = BUCKET
+        record["s3"]["object"]["key"] = key
+        self.invoke_async(START_WORKFLOW, {"Records": [record]})
+
+    def tick(self):
+        busy = self.loop.pending()
+        self.invoke_async(ADMISSION, {
+            "source": "aws.events",
+            "detail-type": "Scheduled Event"
+        })
+        if busy:
+            self.loop.call_later(60, self.tick)
+
+    def run(self):
+        with open(os.path.join(
+            handlers.EVENTS, handlers.FIXTURES["start_workflow"]
+        )) as f:
+            record = json.load(f)["Records"][0]
+        when = 0.0
+        for index in range(self.args.workflows):
+            self.loop.call_at(when, self.upload, index, record)
+            if self.args.arrival_rate:
+                when += self.rng.expovariate(self.args.arrival_rate / 60)
+        if self.args.admission:
+            self.loop.call_at(60, self.tick)
+        started = time.perf_counter()
+        self.loop.run()
+        return time.perf_counter() - started
+
+
+def duration_range(text):
+    low, _, high = text.partition("-")
+    return float(low), float(high or low)
+
+
+def parameter(text):
+    name, _, value = text.partition("=")
+    return name, value
+
+
+def ledger_report(simulation):
+    """Stage times of the ledger items, the chunks of a stage together"""
+
+    items = simulation.clients["dynamodb"].client.tables[
+        simulation.ledger.ledger_table].values()
+    stages = defaultdict(list)
+    for item in map(json.loads, items):
+        stages[re.sub(r"_\d{3}$", "", item["stage"]["S"])].append(item)
+
+    def seconds(items, name, p):
+        values = [float(x[name]["N"]) for x in items if name in x]
+        if not values:
+            return f"{'-':>10}"
+        return f"{handlers.percentile(values, p) / 60:>6.1f} min"
+
+    print(f"\n{'ledger stage':<20}{'items':>8}{'queue p50':>12}"
+          f"{'run p50':>12}{'run p95':>12}{'output MB':>12}")
+    for stage, items in sorted(stages.items()):
+        output = sum(int(x["output_bytes"]["N"]) for x in items
+                     if "output_bytes" in x)
+        print(f"{stage:<20}{len(items):>8}"
+              f"{seconds(items, 'queue_seconds', 50):>12}"
+              f"{seconds(items, 'run_seconds', 50):>12}"
+              f"{seconds(items, 'run_seconds', 95):>12}"
+              f"{output / 1e6:>12.1f}")
+
+
+def report(simulation, wall):
+    executions = list(simulation.executions.values())
+    finished = [x for x in executions if "end" in x]
+    latencies = [x["end"] - x["start"] for x in finished]
+    failed = Counter(x["error"] for x in finished if x["error"])
+    machine = simulation.machine
+
+    print(f"executions       {len(executions)} started, "
+          f"{len(finished) - sum(failed.values())} succeeded, "
+          f"{sum(failed.values())} failed, "
+          f"{len(executions) - len(finished)} unfinished")
+    for error, count in failed.most_common():
+        print(f"  {error:<40}{count:>8}")
+    if simulation.args.redrive:
+        succeeded = [x for x in finished if x["error"] is None]
+        print(f"workflows        {len({x['uuid'] for x in executions})} "
+              f"uploaded, {len(succeeded)} succeeded, "
+              f"{sum(1 for x in succeeded if x['redrive'])} of them "
+              f"re-driven")
+    print(f"virtual time     {simulation.loop.now / 3600:.2f} h "
+          f"in {wall:.1f} s")
+    if latencies:
+        print("latency          " + "  ".join(
+            f"p{x} {handlers.percentile(latencies, x) / 60:.1f} min"
+            for x in (50, 90, 99)
+        ) + f"  max {max(latencies) / 60:.1f} min")
+    print(f"transitions      {sum(machine.transitions.values())}, "
+          f"{sum(machine.retries.values())} retries, largest payload "
+          f"{machine.max_payload / 1024:.1f} KB")
+    for error, count in machine.caught.most_common():
+        print(f"  caught {error:<33}{count:>8}")
+    print(f"lambda           peak concurrency {simulation.lambda_peak}")
+
+    print(f"\n{'function':<36}{'calls':>8}{'errors':>8}{'p50':>10}")
+    for function, count in sorted(simulation.invocations.items()):
+        errors = sum(
+            n for (name, _), n in simulation.errors.items()
+            if name == function
+        )
+        p50 = handlers.percentile(simulation.handler_seconds[function], 50)
+        print(f"{function:<36}{count:>8}{errors:>8}{p50 * 1000:>8.2f}ms")
+
+    print(f"\n{'api call':<44}{'calls':>8}{'peak/s':>8}")
+    for (service, operation), seconds in sorted(simulation.calls.items()):
+        print(f"{service + '.' + operation:<44}"
+              f"{sum(seconds.values()):>8}{max(seconds.values()):>8}")
+
+    if simulation.ledger.ledger_table:
+        ledger_report(simulation)
+
+    queues = [
+        (f"mediaconvert/{name}", queue)
+        for name, queue in sorted(simulation.mediaconvert.queues.items())
+    ] + [("transcribe", simulation.transcribe.queue)]
+    print(f"\n{'queue':<28}{'jobs':>8}{'running':>8}{'waiting':>8}"
+          f"{'wait p50':>12}{'wait p99':>12}")
+    for name, queue in queues:
+        if not queue.jobs:
+            continue
+        waits = queue.queued_seconds
+        print(f"{name:<28}{queue.jobs:>8}{queue.peak_running:>8}"
+              f"{queue.peak_waiting:>8}"
+              f"{handlers.percentile(waits, 50) / 60:>8.1f} min"
+              f"{handlers.percentile(waits, 99) / 60:>8.1f} min")
+    for stage, waits in sorted(simulation.mediaconvert.waits.items()):
+        print(f"{'  ' + stage + ' jobs':<28}{len(waits):>8}{'':>16}"
+              f"{handlers.percentile(waits, 50) / 60:>8.1f} min"
+              f"{handlers.percentile(waits, 99) / 60:>8.1f} min")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workflows", type=int, default=200)
+    parser.add_argument("--arrival-rate", type=float, default=10,
+                        help="uploads per minute, 0 for all at once")
+    parser.add_argument("--duration", type=duration_range,
+                        default=(60.0, 1800.0),
+                        help="source seconds, or a uniform range")
+    parser.add_argument("--admission", action="store_true")
+    parser.add_argument("--ledger", action="store_true",
+                        help="record the run ledger and report its stages")
+    parser.add_argument("--parameter", type=parameter, action="append",
+                        default=[],
+                        help="StepFunctions.yaml parameter, NAME=VALUE")
+    parser.add_argument("--mediaconvert-concurrency", type=int, default=20)
+    parser.add_argument("--transcribe-concurrency", type=int, default=250)
+    parser.add_argument("--hls-speed", type=float, default=1.0,
+                        help="job seconds per source second")
+    parser.add_argument("--audio-speed", type=float, default=0.1)
+    parser.add_argument("--remux-speed", type=float, default=0.005,
+                        help="Lambda seconds of the audio remux per second "
+                             "of audio")
+    parser.add_argument("--accelerated-speed", type=float, default=0.25,
+                        help="HLS job seconds with accelerated transcoding")
+    parser.add_argument("--transcribe-speed", type=float, default=0.5)
+    parser.add_argument("--job-overhead", type=float, default=15)
+    parser.add_argument("--jitter", type=float, default=0.2,
+                        help="random fraction added to the job times")
+    parser.add_argument("--words-per-second", type=float, default=2.5)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    parser.add_argument("--segment-loss", type=float, default=0,
+                        help="fraction of the HLS segments not written")
+    parser.add_argument("--lambda-seconds", type=float, default=0.2)
+    parser.add_argument("--integration-seconds", type=float, default=0.05)
+    parser.add_argument("--event-delay", type=float, default=2)
+    parser.add_argument("--redrive", type=int, default=0,
+                        help="re-drives of a failed workflow")
+    parser.add_argument("--redrive-delay", type=float, default=300,
+                        help="seconds from the failure to the re-drive")
+    parser.add_argument("--keep-objects", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for name, value in handlers.ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    simulation = Simulation(args)
+    report(simulation, simulation.run())
+
+
+if __name__ == "__main__":
+    main()
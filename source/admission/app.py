@@ -0,0 +1,97 @@
+import os
+from avod_common import admission, chunks, ledger, routing
+
+
+# Seconds an admission request can wait for tokens before returning
+acquire_wait = float(os.environ.get("ADMISSIONWAIT", "10"))
+# Seconds the scheduled dispatch can wait for tokens
+tick_wait = float(os.environ.get("ADMISSIONTICKWAIT", "50"))
+
+
+def lambda_handler(event, context):
+    """Admission Lambda function
+
+    Invoked by the Step Functions with a task token before a job is
+    submitted, the token is sent back when the job is admitted, see
+    avod_common.admission. Invoked every minute by EventBridge to admit
+    the waiters that ran out of tokens and free the expired slots.
+    Invoked with release by the Step Functions when a job admitted in
+    metadata.admission fails before its end frees the slot.
+
+    Parameters
+    ----------
+    event: dict, required
+        service, stage, metadata and task_token, release and metadata,
+        or Scheduled Event
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+
+    Returns
+    ------
+    Tickets admitted, freed by the scheduled event, or if the slot was
+    released: dict
+
+    """
+
+    if event.get("source") == "aws.events":
+        if not admission.admission_table:
+            return {"admitted": {}, "reclaimed": {}}
+        scheduler = admission.get_scheduler()
+        lanes = admission.lanes()
+        reclaimed = {lane: scheduler.reclaim(lane) for lane in lanes}
+        admitted = {
+            lane: scheduler.dispatch(lane, tick_wait / len(lanes))
+            for lane in lanes
+        }
+        print({"admitted": admitted, "reclaimed": reclaimed})
+        return {"admitted": admitted, "reclaimed": reclaimed}
+
+    if event.get("release"):
+        try:
+            metadata = event["metadata"]
+        except KeyError as e:
+            raise {
+                "message": f"Error - {e}"
+            }
+        released = admission.release_job(metadata)
+        print({"admission": metadata.get("admission"), "released": released})
+        return {"released": released}
+
+    try:
+        service = event["service"]
+        metadata = event["metadata"]
+        queue = event.get("queue")
+        if queue is None and service == "mediaconvert":
+            # The lane of the queue the job will be routed to
+            queue = routing.queue_name(
+                routing.route(event["stage"], metadata)["queue"]
+            )
+        lane = admission.lane_name(service, queue)
+        ticket = (
+            f"{metadata['uuid']}-{event['stage']}"
+            f"{chunks.chunk_suffix(metadata)}"
+        )
+        token = event["task_token"]
+    except KeyError as e:
+        raise {
+            "message": f"Error - {e}"
+        }
+
+    if not admission.admission_table:
+        admission.get_scheduler().notify(
+            {"ticket": ticket, "token": token}, lane
+        )
+        return {"admitted": [ticket]}
+
+    admitted = admission.get_scheduler().acquire(
+        lane, ticket, token, metadata.get("priority"), acquire_wait
+    )
+    print({"lane": lane, "ticket": ticket, "admitted": admitted})
+    ledger.record(
+        metadata, event["stage"],
+        "ADMITTED" if ticket in admitted else "WAITING",
+        lane=lane
+    )
+    return {"admitted": admitted}
@@ -0,0 +1,501 @@
+"""Admission control of the MediaConvert and Transcribe jobs
+
+Jobs are submitted through lanes, a service and its queue like
+mediaconvert/Default. Each lane has a token bucket, limiting the
+submissions per second, and a limit of jobs running at the same time.
+Before starting a job the Step Functions ask for admission and wait
+with a task token, kept in the waiting list of the lane ordered by
+priority and arrival until a token and a slot are free. The slot is
+released when the job ends, or when its lease expires if the execution
+died before.
+
+The state lives behind a store: DynamoDBStore on ADMISSIONTABLE, or
+MemoryStore to simulate a lane with a FakeClock.
+"""
+import os
+import json
+import time
+import threading
+from avod_common import clients, routing
+
+
+# Admission table, empty to admit every job right away
+admission_table = os.environ.get("ADMISSIONTABLE", "")
+# Priority lanes, the first one admitted first
+priorities = os.environ.get(
+    "ADMISSIONPRIORITIES", "news,standard,backlog"
+).split(",")
+# Limits by service or lane, like {"mediaconvert/Default": {"rate": 1}}
+limits_overrides = json.loads(os.environ.get("ADMISSIONLIMITS") or "{}")
+# Seconds a slot is held when the job end is never seen
+lease_seconds = int(os.environ.get("ADMISSIONLEASE", "21600"))
+
+# rate: submissions per second, burst: bucket size,
+# concurrency: jobs running
+default_limits = {
+    "mediaconvert": {"rate": 2.0, "burst": 10, "concurrency": 20},
+    "transcribe": {"rate": 5.0, "burst": 10, "concurrency": 100}
+}
+default_queues = {
+    "mediaconvert": "Default",
+    "transcribe": "default"
+}
+
+scheduler = {}
+
+
+def lane_name(service, queue=None):
+    return f"{service}/{queue or default_queues[service]}"
+
+
+def lane_limits(lane):
+    """Limits of a lane, the service defaults updated with ADMISSIONLIMITS
+    for the service and then for the lane"""
+
+    service = lane.split("/")[0]
+    return {
+        **default_limits[service],
+        **limits_overrides.get(service, {}),
+        **limits_overrides.get(lane, {})
+    }
+
+
+def lanes():
+    """Lanes with default or configured limits"""
+
+    names = {lane_name(x) for x in default_limits}
+    names.update(lane_name("mediaconvert", x) for x in routing.queues())
+    names.update(x for x in limits_overrides if "/" in x)
+    return sorted(names)
+
+
+def priority_rank(priority):
+    """Position of a priority, unknown ones after the known ones"""
+
+    try:
+        return priorities.index(priority)
+    except ValueError:
+        return len(priorities)
+
+
+def refill(state, limits, now):
+    """Lane state with the tokens earned since the last refill"""
+
+    if state is None:
+        return {"running": 0, "tokens": float(limits["burst"]),
+                "refilled": now}
+    tokens = state["tokens"] + (now - state["refilled"]) * limits["rate"]
+    return {
+        "running": state["running"],
+        "tokens": min(tokens, float(limits["burst"])),
+        "refilled": now
+    }
+
+
+class SystemClock:
+    """Wall clock"""
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class FakeClock:
+    """Clock for simulations, sleeping moves the time forward"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class MemoryStore:
+    """In memory stand-in of the admission table"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.states = {}
+        self.waiting = {}
+        self.slots = {}
+
+    def get_lane(self, lane):
+        with self.lock:
+            state, version = self.states.get(lane, (None, 0))
+            return (dict(state) if state else None), version
+
+    def waiters(self, lane, limit):
+        with self.lock:
+            waiting = sorted(
+                self.waiting.get(lane, {}).values(),
+                key=lambda x: (x["rank"], x["enqueued"], x["ticket"])
+            )
+            return [dict(x) for x in waiting[:limit]]
+
+    def enqueue(self, lane, waiter):
+        with self.lock:
+            self.waiting.setdefault(lane, {})[waiter["ticket"]] = (
+                dict(waiter)
+            )
+
+    def admit(self, lane, state, version, waiter, slot):
+        with self.lock:
+            waiting = self.waiting.get(lane, {})
+            if (
+                self.states.get(lane, (None, 0))[1] != version or
+                waiter["ticket"] not in waiting
+            ):
+                return False
+            del waiting[waiter["ticket"]]
+            self.slots.setdefault(lane, {})[slot["ticket"]] = dict(slot)
+            self.states[lane] = (dict(state), version + 1)
+            return True
+
+    def release(self, lane, ticket):
+        with self.lock:
+            if self.slots.get(lane, {}).pop(ticket, None) is None:
+                return False
+            state, version = self.states[lane]
+            state = dict(state, running=state["running"] - 1)
+            self.states[lane] = (state, version + 1)
+            return True
+
+    def expired(self, lane, now):
+        with self.lock:
+            return [
+                dict(x) for x in self.slots.get(lane, {}).values()
+                if x["expires"] < now
+            ]
+
+
+class DynamoDBStore:
+    """Admission table, with a pk and sk key and a position local index
+
+    lane#<lane>, state: running, tokens, refilled and version
+    wait#<lane>, <ticket>: task token, ordered by position
+    slot#<lane>, <ticket>: lease expiration
+    """
+
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+
+    def key(self, kind, lane, sk):
+        return {"pk": {"S": f"{kind}#{lane}"}, "sk": {"S": sk}}
+
+    def get_lane(self, lane):
+        response = self.client.get_item(
+            TableName=self.table,
+            Key=self.key("lane", lane, "state"),
+            ConsistentRead=True
+        )
+        item = response.get("Item")
+        if item is None:
+            return None, 0
+        return {
+            "running": int(item["running"]["N"]),
+            "tokens": float(item["tokens"]["N"]),
+            "refilled": float(item["refilled"]["N"])
+        }, int(item["version"]["N"])
+
+    def waiters(self, lane, limit):
+        # Strongly consistent reads are allowed on local indexes
+        response = self.client.query(
+            TableName=self.table,
+            IndexName="position",
+            KeyConditionExpression="pk = :pk",
+            ExpressionAttributeValues={":pk": {"S": f"wait#{lane}"}},
+            ConsistentRead=True,
+            Limit=limit
+        )
+        return [
+            {
+                "ticket": x["sk"]["S"],
+                "token": x["token"]["S"],
+                "rank": int(x["rank"]["N"]),
+                "enqueued": float(x["enqueued"]["N"])
+            }
+            for x in response["Items"]
+        ]
+
+    def enqueue(self, lane, waiter):
+        self.client.put_item(
+            TableName=self.table,
+            Item={
+                **self.key("wait", lane, waiter["ticket"]),
+                "position": {"S": "%03d#%017.6f#%s" % (
+                    waiter["rank"], waiter["enqueued"], waiter["ticket"]
+                )},
+                "token": {"S": waiter["token"]},
+                "rank": {"N": str(waiter["rank"])},
+                "enqueued": {"N": repr(waiter["enqueued"])}
+            }
+        )
+
+    def admit(self, lane, state, version, waiter, slot):
+        if version:
+            condition = {
+                "ConditionExpression": "#version = :version",
+                "ExpressionAttributeNames": {"#version": "version"},
+                "ExpressionAttributeValues": {
+                    ":version": {"N": str(version)}
+                }
+            }
+        else:
+            condition = {
+                "ConditionExpression": "attribute_not_exists(pk)"
+            }
+        try:
+            self.client.transact_write_items(TransactItems=[
+                {"Put": {
+                    "TableName": self.table,
+                    "Item": {
+                        **self.key("lane", lane, "state"),
+                        "running": {"N": str(state["running"])},
+                        "tokens": {"N": repr(state["tokens"])},
+                        "refilled": {"N": repr(state["refilled"])},
+                        "version": {"N": str(version + 1)}
+                    },
+                    **condition
+                }},
+                {"Delete": {
+                    "TableName": self.table,
+                    "Key": self.key("wait", lane, waiter["ticket"]),
+                    "ConditionExpression": "attribute_exists(pk)"
+                }},
+                {"Put": {
+                    "TableName": self.table,
+                    "Item": {
+                        **self.key("slot", lane, slot["ticket"]),
+                        "expires": {"N": repr(slot["expires"])}
+                    }
+                }}
+            ])
+        except self.client.exceptions.TransactionCanceledException:
+            return False
+        return True
+
+    def release(self, lane, ticket):
+        try:
+            self.client.transact_write_items(TransactItems=[
+                {"Delete": {
+                    "TableName": self.table,
+                    "Key": self.key("slot", lane, ticket),
+                    "ConditionExpression": "attribute_exists(pk)"
+                }},
+                {"Update": {
+                    "TableName": self.table,
+                    "Key": self.key("lane", lane, "state"),
+                    "UpdateExpression": (
+                        "SET #running = #running - :one, "
+                        "#version = #version + :one"
+                    ),
+                    "ExpressionAttributeNames": {
+                        "#running": "running",
+                        "#version": "version"
+                    },
+                    "ExpressionAttributeValues": {":one": {"N": "1"}}
+                }}
+            ])
+        except self.client.exceptions.TransactionCanceledException:
+            return False
+        return True
+
+    def expired(self, lane, now):
+        paginator = self.client.get_paginator("query")
+        slots = []
+        for page in paginator.paginate(
+            TableName=self.table,
+            KeyConditionExpression="pk = :pk",
+            FilterExpression="#expires < :now",
+            ExpressionAttributeNames={"#expires": "expires"},
+            ExpressionAttributeValues={
+                ":pk": {"S": f"slot#{lane}"},
+                ":now": {"N": repr(now)}
+            }
+        ):
+            slots.extend(
+                {"ticket": x["sk"]["S"], "expires": float(x["expires"]["N"])}
+                for x in page["Items"]
+            )
+        return slots
+
+
+class Scheduler:
+    """Token bucket, concurrency limit and priority waiting list of the
+    lanes
+
+    Parameters
+    ----------
+    store: object, required
+        MemoryStore or DynamoDBStore
+
+    notify: callable, required
+        Called with the waiter and the lane when it is admitted, returns
+        False when the waiter is gone, like a timed out task token
+
+    clock: object, optional
+        SystemClock or FakeClock
+
+    """
+
+    def __init__(self, store, notify, clock=None):
+        self.store = store
+        self.notify = notify
+        self.clock = clock or SystemClock()
+
+    def acquire(self, lane, ticket, token, priority=None, max_wait=0):
+        """Add a job to the waiting list of the lane and admit the waiters
+        that fit
+
+        Returns
+        ------
+        Tickets admitted: list
+
+        """
+
+        # A ticket asking again is a new run of the same step
+        self.store.release(lane, ticket)
+        self.store.enqueue(lane, {
+            "ticket": ticket,
+            "token": token,
+            "rank": priority_rank(priority),
+            "enqueued": self.clock.time()
+        })
+        return self.dispatch(lane, max_wait)
+
+    def release(self, lane, ticket, max_wait=0):
+        """Free the slot of a job and admit the waiters that fit
+
+        Returns
+        ------
+        False when the slot was already free: bool
+
+        """
+
+        released = self.store.release(lane, ticket)
+        if released:
+            self.dispatch(lane, max_wait)
+        return released
+
+    def reclaim(self, lane):
+        """Free the slots with an expired lease
+
+        Returns
+        ------
+        Tickets of the freed slots: list
+
+        """
+
+        return [
+            x["ticket"] for x in self.store.expired(lane, self.clock.time())
+            if self.store.release(lane, x["ticket"])
+        ]
+
+    def dispatch(self, lane, max_wait=0):
+        """Admit the waiters of the lane, by priority and arrival, while
+        there are tokens and free slots
+
+        Parameters
+        ----------
+        lane: str, required
+            Service and queue, like mediaconvert/Default
+
+        max_wait: float, optional
+            Seconds to sleep waiting for tokens, a slot is only freed by a
+            job ending
+
+
+        Returns
+        ------
+        Tickets admitted: list
+
+        """
+
+        limits = lane_limits(lane)
+        deadline = self.clock.time() + max_wait
+        admitted = []
+        while True:
+            now = self.clock.time()
+            state, version = self.store.get_lane(lane)
+            state = refill(state, limits, now)
+            if state["running"] >= limits["concurrency"]:
+                break
+            waiters = self.store.waiters(lane, 1)
+            if not waiters:
+                break
+            if state["tokens"] < 1:
+                wait = (1 - state["tokens"]) / limits["rate"]
+                if now + wait > deadline:
+                    break
+                self.clock.sleep(wait)
+                continue
+
+            waiter = waiters[0]
+            state["running"] += 1
+            state["tokens"] -= 1
+            slot = {"ticket": waiter["ticket"], "expires": now + lease_seconds}
+            if not self.store.admit(lane, state, version, waiter, slot):
+                # Another dispatcher changed the lane, read it again
+                continue
+            if self.notify(waiter, lane):
+                admitted.append(waiter["ticket"])
+            else:
+                self.store.release(lane, waiter["ticket"])
+        return admitted
+
+
+def send_task_success(sf):
+    """Scheduler notify sending the admission to a Step Functions task
+    token"""
+
+    def notify(waiter, lane):
+        try:
+            sf.send_task_success(
+                taskToken=waiter["token"],
+                output=json.dumps({
+                    "lane": lane,
+                    "ticket": waiter["ticket"]
+                })
+            )
+        except (
+            sf.exceptions.TaskTimedOut,
+            sf.exceptions.TaskDoesNotExist,
+            sf.exceptions.InvalidToken
+        ):
+            return False
+        return True
+
+    return notify
+
+
+def get_scheduler():
+    """Scheduler on ADMISSIONTABLE, kept between warm invocations"""
+
+    if "default" not in scheduler:
+        scheduler["default"] = Scheduler(
+            DynamoDBStore(clients.lazy("dynamodb"), admission_table),
+            send_task_success(clients.lazy("stepfunctions"))
+        )
+    return scheduler["default"]
+
+
+def release_job(metadata):
+    """Free the slot of the job of a Step Functions payload, admitted in
+    metadata.admission
+
+    Returns
+    ------
+    False when admission is disabled or the slot was already free: bool
+
+    """
+
+    admission = metadata.get("admission")
+    if not admission_table or not admission:
+        return False
+    return get_scheduler().release(admission["lane"], admission["ticket"])
@@ -0,0 +1,181 @@
+"""AVOD captions interchange format
+
+The WebCaptions artifact is a JSON Lines document. The first line is a
+header with the format name and version, every other line is a block of
+up to BLOCK_SIZE captions stored as column arrays:
+
+    {"format": "avod-captions", "version": 1}
+    {"start": [...], "duration": [...], "text": [...], "strings": [...],
+     "word_count": [...], "words": [...], "confidence": [...]}
+
+- start: caption start in milliseconds, delta from the previous caption
+- duration: caption end minus caption start in milliseconds
+- text: caption text
+- strings: words added to the string table by this block
+- word_count: number of words of each caption
+- words: string table index of each word, for all captions of the block
+- confidence: confidence of each word quantized to 0-100
+
+The string table is shared by all blocks of a document, so each distinct
+word is written only once.
+"""
+import json
+
+
+FORMAT = "avod-captions"
+VERSION = 1
+BLOCK_SIZE = 1000
+CONFIDENCE_SCALE = 100
+
+
+def to_millis(seconds):
+    return int(round(float(seconds) * 1000))
+
+
+class CaptionWriter:
+    """Write captions to a text file object in the AVOD captions format
+
+    Parameters
+    ----------
+    f: object, required
+        Text file object with a write method
+
+    block_size: int, optional
+        Amount of captions written per line
+
+    """
+
+    def __init__(self, f, block_size=BLOCK_SIZE):
+        self.f = f
+        self.block_size = block_size
+        self.strings = {}
+        self.previous_start = 0
+        self.reset()
+        self.f.write(
+            json.dumps({"format": FORMAT, "version": VERSION}) + "\n"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def reset(self):
+        self.block = {
+            "start": [],
+            "duration": [],
+            "text": [],
+            "strings": [],
+            "word_count": [],
+            "words": [],
+            "confidence": []
+        }
+
+    def write(self, caption):
+        """Append a caption dict (start, end, caption, wordConfidence)"""
+
+        block = self.block
+        start = to_millis(caption["start"])
+        block["start"].append(start - self.previous_start)
+        block["duration"].append(to_millis(caption["end"]) - start)
+        block["text"].append(caption["caption"])
+        self.previous_start = start
+
+        words = caption.get("wordConfidence", [])
+        block["word_count"].append(len(words))
+        for word in words:
+            index = self.strings.get(word["w"])
+            if index is None:
+                index = len(self.strings)
+                self.strings[word["w"]] = index
+                block["strings"].append(word["w"])
+            block["words"].append(index)
+            block["confidence"].append(
+                int(round(float(word["c"]) * CONFIDENCE_SCALE))
+            )
+
+        if len(block["start"]) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if self.block["start"]:
+            self.f.write(
+                json.dumps(
+                    self.block, ensure_ascii=False, separators=(",", ":")
+                ) + "\n"
+            )
+            self.reset()
+
+    def close(self):
+        self.flush()
+
+
+def write_captions(captions, f, block_size=BLOCK_SIZE):
+    """Write an iterable of caption dicts to a text file object"""
+
+    with CaptionWriter(f, block_size) as writer:
+        for caption in captions:
+            writer.write(caption)
+
+
+def read_captions(lines):
+    """Read captions written by CaptionWriter
+
+    Parameters
+    ----------
+    lines: iterable, required
+        Lines of the document as str or bytes, like a file object or
+        the iter_lines() of a S3 StreamingBody
+
+
+    Returns
+    ------
+    Captions with start, end, caption and wordConfidence: generator of dict
+
+    """
+
+    lines = (line for line in lines if line.strip())
+
+    try:
+        header = json.loads(next(lines))
+    except StopIteration:
+        raise ValueError("Empty captions document")
+
+    if (
+        not isinstance(header, dict) or
+        header.get("format") != FORMAT
+    ):
+        raise ValueError("Not an AVOD captions document")
+    if header.get("version") != VERSION:
+        raise ValueError(
+            f"Unsupported captions version: {header.get('version')}"
+        )
+
+    strings = []
+    start = 0
+
+    for line in lines:
+        block = json.loads(line)
+        strings.extend(block["strings"])
+        words = block["words"]
+        confidence = block["confidence"]
+        position = 0
+
+        for index in range(len(block["start"])):
+            start += block["start"][index]
+            count = block["word_count"][index]
+            yield {
+                "start": start / 1000,
+                "end": (start + block["duration"][index]) / 1000,
+                "caption": block["text"][index],
+                "wordConfidence": [
+                    {
+                        "w": strings[words[i]],
+                        "c": confidence[i] / CONFIDENCE_SCALE
+                    }
+                    for i in range(position, position + count)
+                ]
+            }
+            position += count
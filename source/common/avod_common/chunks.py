@@ -0,0 +1,77 @@
+"""Time ranges of a chunked transcription
+
+Long sources are transcribed in chunks of TRANSCRIBECHUNKSECONDS, every
+chunk but the last one goes TRANSCRIBECHUNKOVERLAP seconds into the next
+one, so the words cut at the end of a chunk are transcribed whole by the
+next one. The stitching keeps the words of the overlap starting before
+its middle from the first chunk, and the words of the second one
+starting after the last word kept.
+
+The chunk being processed is metadata.chunk, with index, count, start
+and end in seconds. A single chunk has no end and keeps the names used
+without chunks.
+"""
+import os
+
+
+chunk_seconds = int(os.environ.get("TRANSCRIBECHUNKSECONDS", "0"))
+chunk_overlap = int(os.environ.get("TRANSCRIBECHUNKOVERLAP", "10"))
+
+
+def plan_chunks(duration, seconds=None, overlap=None):
+    """Split a source duration in chunks
+
+    Parameters
+    ----------
+    duration: float, required
+        Source duration in seconds, None when it is unknown
+
+    seconds: int, optional
+        Chunk length, 0 to disable the chunks
+
+    overlap: int, optional
+        Seconds each chunk goes into the next one
+
+
+    Returns
+    ------
+    Chunks with index, count, start and end: list of dict
+
+    """
+
+    seconds = chunk_seconds if seconds is None else seconds
+    overlap = chunk_overlap if overlap is None else overlap
+
+    if not duration or seconds <= 0 or duration <= seconds + overlap:
+        return [{"index": 0, "count": 1, "start": 0}]
+
+    starts = list(range(0, int(duration), seconds))
+    if duration - starts[-1] <= overlap:
+        # The previous chunk overlap already covers the end
+        starts.pop()
+
+    chunks = []
+    for index, start in enumerate(starts):
+        chunk = {"index": index, "count": len(starts), "start": start}
+        if index < len(starts) - 1:
+            chunk["end"] = start + seconds + overlap
+        chunks.append(chunk)
+    return chunks
+
+
+def chunk_suffix(metadata):
+    """Suffix of the job and file names of the chunk, empty for a single
+    chunk"""
+
+    chunk = metadata.get("chunk")
+    if not chunk or chunk["count"] < 2:
+        return ""
+    return f"_{chunk['index']:03d}"
+
+
+def timecode(seconds):
+    """Format seconds as a HH:MM:SS:FF MediaConvert timecode"""
+
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%02d:%02d:%02d:00" % (hours, minutes, seconds)
@@ -0,0 +1,100 @@
+"""boto3 clients shared by the functions
+
+Clients are created on first use and kept between warm invocations, one
+per service and endpoint, so a function only pays for the clients of
+the path it runs; boto3 itself is imported by the first one. They share
+one botocore Config: adaptive retries, which also back off on client
+side when the service throttles, a connection pool sized for the
+threads of a function, TCP keep-alive and bounded timeouts.
+"""
+import os
+import threading
+
+
+region = os.environ.get("REGION", "us-east-1")
+aws_environment = os.environ.get("AWSENV", "AWS")
+max_attempts = int(os.environ.get("AWSMAXATTEMPTS", "5"))
+pool_connections = int(os.environ.get("AWSPOOLCONNECTIONS", "32"))
+connect_timeout = int(os.environ.get("AWSCONNECTTIMEOUT", "5"))
+read_timeout = int(os.environ.get("AWSREADTIMEOUT", "60"))
+
+# Endpoints of the local services with AWSENV AWS_SAM_LOCAL
+local_endpoints = {
+    "stepfunctions": "http://stepfunctions:8083",
+    "dynamodb": "http://dynamodb:8000"
+}
+
+clients = {}
+config = {}
+lock = threading.Lock()
+
+
+def get_config():
+    """botocore Config of every client"""
+
+    if "default" not in config:
+        from botocore.config import Config
+
+        config["default"] = Config(
+            retries={"mode": "adaptive", "max_attempts": max_attempts},
+            max_pool_connections=pool_connections,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            tcp_keepalive=True
+        )
+    return config["default"]
+
+
+def client(service, endpoint_url=None):
+    """Return the client of a service, created on the first call
+
+    Parameters
+    ----------
+    service: str, required
+        boto3 service name
+
+    endpoint_url: str, optional
+        Endpoint, like the MediaConvert account endpoint. With AWSENV
+        AWS_SAM_LOCAL the local one is used for Step Functions and
+        DynamoDB
+
+
+    Returns
+    ------
+    boto3 client: object
+
+    """
+
+    key = (service, endpoint_url)
+    if key not in clients:
+        with lock:
+            if key not in clients:
+                import boto3
+
+                if endpoint_url is None and (
+                    aws_environment == "AWS_SAM_LOCAL"
+                ):
+                    endpoint_url = local_endpoints.get(service)
+                clients[key] = boto3.client(
+                    service,
+                    region_name=region,
+                    endpoint_url=endpoint_url,
+                    config=get_config()
+                )
+    return clients[key]
+
+
+class LazyClient:
+    """Stand-in for a module level client, the client is created when
+    one of its attributes is first used"""
+
+    def __init__(self, service, endpoint_url=None):
+        self._service = service
+        self._endpoint_url = endpoint_url
+
+    def __getattr__(self, name):
+        return getattr(client(self._service, self._endpoint_url), name)
+
+
+def lazy(service, endpoint_url=None):
+    return LazyClient(service, endpoint_url)
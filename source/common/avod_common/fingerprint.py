@@ -0,0 +1,72 @@
+"""Content fingerprint of the uploaded media
+
+The fingerprint identifies the same content uploaded again or copied to
+another key. By default it is the object ETag and size, read with a
+HEAD request. The ETag of a multipart upload depends on the part size,
+so the same file uploaded by another tool can have another ETag; with
+samples > 0 the fingerprint is the size and a SHA-256 of samples evenly
+spread over the file, read with ranged GETs.
+"""
+import hashlib
+
+
+SAMPLE_SIZE = 64 * 1024
+
+
+def sample_ranges(size, samples, sample_size=SAMPLE_SIZE):
+    """Byte ranges of the samples, the first at the start of the file and
+    the last at the end, or the whole file when it is small"""
+
+    if not size:
+        return []
+    if size <= samples * sample_size:
+        return [(0, size - 1)]
+    step = (size - sample_size) / max(samples - 1, 1)
+    return [
+        (int(step * x), int(step * x) + sample_size - 1)
+        for x in range(samples)
+    ]
+
+
+def fingerprint(s3, bucket, key, samples=0, sample_size=SAMPLE_SIZE):
+    """Fingerprint a S3 object
+
+    Parameters
+    ----------
+    s3: object, required
+        boto3 S3 client
+
+    bucket: str, required
+        Bucket of the object
+
+    key: str, required
+        Key of the object
+
+    samples: int, optional
+        Number of samples hashed, 0 to use the ETag
+
+    sample_size: int, optional
+        Size of each sample
+
+
+    Returns
+    ------
+    Fingerprint: str
+
+    """
+
+    head = s3.head_object(Bucket=bucket, Key=key)
+    size = head["ContentLength"]
+    if samples <= 0:
+        etag = head["ETag"].strip('"')
+        return f"etag:{etag}:{size}"
+
+    sha = hashlib.sha256()
+    for start, end in sample_ranges(size, samples, sample_size):
+        response = s3.get_object(
+            Bucket=bucket,
+            Key=key,
+            Range=f"bytes={start}-{end}"
+        )
+        sha.update(response["Body"].read())
+    return f"sha256:{sha.hexdigest()}:{size}"
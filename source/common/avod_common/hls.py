@@ -0,0 +1,211 @@
+"""HLS playlists helpers"""
+import math
+import re
+
+
+ATTRIBUTE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_attributes(text):
+    """Parse an HLS attribute list into a dict"""
+
+    return {
+        name: value.strip('"') for name, value in ATTRIBUTE.findall(text)
+    }
+
+
+def parse_master(text):
+    """Parse a master playlist
+
+    Parameters
+    ----------
+    text: str, required
+        Master playlist
+
+
+    Returns
+    ------
+    Variants with uri and the EXT-X-STREAM-INF attributes, and the
+    EXT-X-MEDIA renditions attributes: tuple of two lists of dict
+
+    """
+
+    variants = []
+    media = []
+    stream_inf = None
+
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            stream_inf = parse_attributes(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-MEDIA:"):
+            media.append(parse_attributes(line.split(":", 1)[1]))
+        elif line and not line.startswith("#") and stream_inf is not None:
+            variants.append({"uri": line, "attributes": stream_inf})
+            stream_inf = None
+
+    return variants, media
+
+
+def parse_playlist(text):
+    """Parse a media playlist with its tags
+
+    Parameters
+    ----------
+    text: str, required
+        Media playlist
+
+
+    Returns
+    ------
+    Segments with uri, duration in seconds and byterange, the length and
+    offset of a EXT-X-BYTERANGE segment, the target duration, the
+    EXT-X-MAP uri and whether the playlist ends with EXT-X-ENDLIST: dict
+
+    """
+
+    playlist = {
+        "segments": [],
+        "target_duration": None,
+        "map": None,
+        "endlist": False
+    }
+    duration = None
+    byterange = None
+    next_offset = 0
+
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXTINF:"):
+            duration = float(line.split(":", 1)[1].split(",", 1)[0])
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            length, _, offset = line.split(":", 1)[1].partition("@")
+            # Without offset the range follows the previous one
+            byterange = [int(length), int(offset) if offset else next_offset]
+        elif line.startswith("#EXT-X-TARGETDURATION:"):
+            playlist["target_duration"] = int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-MAP:"):
+            playlist["map"] = parse_attributes(
+                line.split(":", 1)[1]
+            ).get("URI")
+        elif line == "#EXT-X-ENDLIST":
+            playlist["endlist"] = True
+        elif line and not line.startswith("#") and duration is not None:
+            segment = {"uri": line, "duration": duration}
+            if byterange is not None:
+                segment["byterange"] = byterange
+                next_offset = sum(byterange)
+                byterange = None
+            playlist["segments"].append(segment)
+            duration = None
+
+    return playlist
+
+
+def parse_media(text):
+    """Parse a media playlist
+
+    Parameters
+    ----------
+    text: str, required
+        Media playlist
+
+
+    Returns
+    ------
+    Segments with uri and duration in seconds: list of dict
+
+    """
+
+    return parse_playlist(text)["segments"]
+
+
+def add_subtitles(master, uri, language, name=None, group="subs"):
+    """Add a subtitles rendition to a master playlist
+
+    The EXT-X-MEDIA entry is added before the first variant and every
+    EXT-X-STREAM-INF gets the SUBTITLES group. A rendition already in the
+    playlist for the same group and language is replaced.
+
+    Parameters
+    ----------
+    master: str, required
+        Master playlist
+
+    uri: str, required
+        Subtitles media playlist uri, relative to the master
+
+    language: str, required
+        Subtitles language, like pt-BR
+
+    name: str, optional
+        Subtitles name shown by the players, the language by default
+
+    group: str, optional
+        Subtitles GROUP-ID
+
+
+    Returns
+    ------
+    Master playlist: str
+
+    """
+
+    media = (
+        f'#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="{group}",'
+        f'NAME="{name or language}",LANGUAGE="{language}",'
+        f'DEFAULT=YES,AUTOSELECT=YES,FORCED=NO,URI="{uri}"'
+    )
+
+    lines = []
+    added = False
+    for line in master.splitlines():
+        if line.startswith("#EXT-X-MEDIA:"):
+            attributes = parse_attributes(line.split(":", 1)[1])
+            if (
+                attributes.get("TYPE") == "SUBTITLES" and
+                attributes.get("GROUP-ID") == group and
+                attributes.get("LANGUAGE") == language
+            ):
+                continue
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            if not added:
+                lines.append(media)
+                added = True
+            attributes = parse_attributes(line.split(":", 1)[1])
+            if "SUBTITLES" not in attributes:
+                line += f',SUBTITLES="{group}"'
+        lines.append(line)
+
+    return "\n".join(lines) + "\n"
+
+
+def media_playlist(segments):
+    """Write a VOD media playlist
+
+    Parameters
+    ----------
+    segments: list, required
+        Segments with uri and duration in seconds
+
+
+    Returns
+    ------
+    Media playlist: str
+
+    """
+
+    target = max([int(math.ceil(x["duration"])) for x in segments] + [1])
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{target}",
+        "#EXT-X-MEDIA-SEQUENCE:1",
+        "#EXT-X-PLAYLIST-TYPE:VOD"
+    ]
+    for segment in segments:
+        lines.append(f"#EXTINF:{segment['duration']:.3f},")
+        lines.append(segment["uri"])
+    lines.append("#EXT-X-ENDLIST")
+
+    return "\n".join(lines) + "\n"
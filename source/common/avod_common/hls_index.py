@@ -0,0 +1,388 @@
+"""Integrity check and index of the HLS outputs
+
+The master playlist, its variant and rendition playlists and every
+segment they reference are checked against a single listing of the HLS
+folder. These are errors:
+
+    a playlist or segment that is missing or empty
+    a byte range past the end of its object
+    a media playlist without EXT-X-ENDLIST
+    a segment longer than the target duration
+
+These are warnings: a rendition more than DURATION_TOLERANCE seconds
+longer or shorter than the source, or with a measured peak bitrate over
+the BANDWIDTH of its variant.
+
+The index, <master>_index.json next to the master playlist, has the
+variants and renditions with their attributes, duration, bytes and
+measured bitrates, and their segments as columns of uris, durations and
+bytes. Players, CDN prewarms and QC tools read this one object instead
+of listing the folder.
+"""
+import json
+import math
+import posixpath
+from avod_common import clients, hls
+
+
+INDEX_VERSION = 1
+# Seconds the duration of a rendition can differ from the source
+DURATION_TOLERANCE = 1.0
+# Errors kept in the message of an IntegrityError
+MAX_ERRORS = 10
+
+# Index names of the EXT-X-STREAM-INF and EXT-X-MEDIA attributes
+VARIANT_ATTRIBUTES = {
+    "BANDWIDTH": "bandwidth",
+    "AVERAGE-BANDWIDTH": "average_bandwidth",
+    "RESOLUTION": "resolution",
+    "FRAME-RATE": "frame_rate",
+    "CODECS": "codecs",
+    "AUDIO": "audio",
+    "SUBTITLES": "subtitles"
+}
+MEDIA_ATTRIBUTES = {
+    "TYPE": "type",
+    "GROUP-ID": "group",
+    "LANGUAGE": "language",
+    "NAME": "name",
+    "DEFAULT": "default"
+}
+INTEGER_ATTRIBUTES = {"bandwidth", "average_bandwidth"}
+
+s3 = clients.lazy("s3")
+
+
+class IntegrityError(Exception):
+    """The HLS output is incomplete or broken"""
+
+
+def index_key(master_key):
+    """Key of the index of a master playlist"""
+
+    return f"{master_key.rsplit('.', 1)[0]}_index.json"
+
+
+def list_sizes(bucket, prefix):
+    """Size of the objects under a prefix by key"""
+
+    paginator = s3.get_paginator("list_objects_v2")
+    return {
+        item["Key"]: item["Size"]
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+        for item in page.get("Contents", [])
+    }
+
+
+def read_text(bucket, key):
+    response = s3.get_object(Bucket=bucket, Key=key)
+    return response["Body"].read().decode("utf-8")
+
+
+def resolve(playlist_key, uri):
+    """Key of a uri relative to a playlist, None for an absolute one"""
+
+    if "://" in uri or uri.startswith("/"):
+        return None
+    return posixpath.normpath(
+        posixpath.join(posixpath.dirname(playlist_key), uri)
+    )
+
+
+def attributes(entry, names):
+    """Index attributes of a parsed EXT-X-STREAM-INF or EXT-X-MEDIA"""
+
+    values = {}
+    for name, value in entry.items():
+        if name not in names:
+            continue
+        name = names[name]
+        values[name] = int(value) if name in INTEGER_ATTRIBUTES else value
+    return values
+
+
+def object_bytes(key, sizes, errors, byterange=None):
+    """Bytes of a segment or playlist, checked against the listing"""
+
+    if key not in sizes:
+        errors.append(f"Missing {key}")
+        return None
+    if not sizes[key]:
+        errors.append(f"Empty {key}")
+        return None
+    if byterange is None:
+        return sizes[key]
+    length, offset = byterange
+    if offset + length > sizes[key]:
+        errors.append(
+            f"Byte range {length}@{offset} past the end of {key}"
+        )
+        return None
+    return length
+
+
+def media_entry(uri, playlist, segment_bytes, init_bytes=None):
+    """Index entry of a media playlist
+
+    Parameters
+    ----------
+    uri: str, required
+        Playlist uri, relative to the master
+
+    playlist: dict, required
+        hls.parse_playlist of the playlist
+
+    segment_bytes: list, required
+        Bytes of each segment, None when unknown
+
+    init_bytes: int, optional
+        Bytes of the EXT-X-MAP segment
+
+
+    Returns
+    ------
+    Duration, bytes, measured bitrates and segments columns: dict
+
+    """
+
+    segments = playlist["segments"]
+    durations = [round(x["duration"], 3) for x in segments]
+    duration = round(sum(durations), 3)
+    known = [
+        (size, x) for size, x in zip(segment_bytes, durations)
+        if size is not None
+    ]
+    total = sum(x for x, _ in known) + (init_bytes or 0)
+    entry = {
+        "uri": uri,
+        "target_duration": playlist["target_duration"],
+        "duration": duration,
+        "bytes": total,
+        "measured_average_bandwidth": (
+            int(total * 8 / duration) if duration else None
+        ),
+        "measured_peak_bandwidth": max(
+            [int(size * 8 / seconds) for size, seconds in known if seconds] +
+            [0]
+        ),
+        "segments": {
+            "uri": [x["uri"] for x in segments],
+            "duration": durations,
+            "bytes": segment_bytes
+        }
+    }
+    if any("byterange" in x for x in segments):
+        entry["segments"]["offset"] = [
+            x["byterange"][1] if "byterange" in x else None
+            for x in segments
+        ]
+    if playlist["map"] is not None:
+        entry["init"] = {"uri": playlist["map"], "bytes": init_bytes}
+    return entry
+
+
+def check_media(bucket, master_key, uri, sizes, errors):
+    """Check a media playlist and its segments
+
+    Returns
+    ------
+    Index entry, None when the playlist is missing: dict
+
+    """
+
+    key = resolve(master_key, uri)
+    if key is None:
+        errors.append(f"Absolute playlist uri {uri}")
+        return None
+    if object_bytes(key, sizes, errors) is None:
+        return None
+
+    playlist = hls.parse_playlist(read_text(bucket, key))
+    if not playlist["segments"]:
+        errors.append(f"No segments in {key}")
+    if not playlist["endlist"]:
+        errors.append(f"No EXT-X-ENDLIST in {key}")
+    target = playlist["target_duration"]
+    segment_bytes = []
+    for segment in playlist["segments"]:
+        segment_key = resolve(key, segment["uri"])
+        if segment_key is None:
+            # A CDN or another origin, not checked
+            segment_bytes.append(None)
+            continue
+        segment_bytes.append(object_bytes(
+            segment_key, sizes, errors, segment.get("byterange")
+        ))
+        # EXTINF rounded to the nearest integer is at most the target
+        if target is not None and math.floor(
+            segment["duration"] + 0.5
+        ) > target:
+            errors.append(
+                f"Segment {segment_key} of {segment['duration']} s over "
+                f"the target duration {target} s"
+            )
+    init_bytes = None
+    if playlist["map"] is not None:
+        init_key = resolve(key, playlist["map"])
+        if init_key is not None:
+            init_bytes = object_bytes(init_key, sizes, errors)
+    return media_entry(uri, playlist, segment_bytes, init_bytes)
+
+
+def build_index(bucket, master_key, source_duration=None):
+    """Check the HLS output of a master playlist and build its index
+
+    Parameters
+    ----------
+    bucket: str, required
+        Bucket of the HLS output
+
+    master_key: str, required
+        Key of the master playlist
+
+    source_duration: float, optional
+        Seconds of the source, to check the duration of the renditions
+
+
+    Returns
+    ------
+    Index and the errors found: tuple
+
+    """
+
+    folder = master_key.rsplit("/", 1)[0] + "/"
+    sizes = list_sizes(bucket, folder)
+    errors = []
+    if object_bytes(master_key, sizes, errors) is None:
+        return None, errors
+
+    variants, media = hls.parse_master(read_text(bucket, master_key))
+    if not variants:
+        errors.append(f"No variants in {master_key}")
+
+    index = {
+        "version": INDEX_VERSION,
+        "master": master_key.rsplit("/", 1)[1],
+        "variants": [],
+        "media": [],
+        "warnings": []
+    }
+    for variant in variants:
+        entry = check_media(bucket, master_key, variant["uri"], sizes, errors)
+        if entry is None:
+            continue
+        entry = {**attributes(variant["attributes"], VARIANT_ATTRIBUTES),
+                 **entry}
+        declared = entry.get("bandwidth")
+        if declared and entry["measured_peak_bandwidth"] > declared:
+            index["warnings"].append(
+                f"{variant['uri']} peak of "
+                f"{entry['measured_peak_bandwidth']} bit/s over its "
+                f"BANDWIDTH {declared}"
+            )
+        index["variants"].append(entry)
+    for rendition in media:
+        if "URI" not in rendition:
+            # Muxed in the variants, like CLOSED-CAPTIONS
+            continue
+        entry = check_media(bucket, master_key, rendition["URI"], sizes,
+                            errors)
+        if entry is not None:
+            index["media"].append({
+                **attributes(rendition, MEDIA_ATTRIBUTES), **entry
+            })
+
+    entries = index["variants"] + index["media"]
+    if source_duration:
+        for entry in entries:
+            if abs(entry["duration"] - source_duration) > max(
+                DURATION_TOLERANCE, entry["target_duration"] or 0
+            ):
+                index["warnings"].append(
+                    f"{entry['uri']} lasts {entry['duration']} s, the "
+                    f"source {source_duration} s"
+                )
+    return totals(index), errors
+
+
+def totals(index):
+    """Set the duration, segments and bytes of the segments of an index"""
+
+    entries = index["variants"] + index["media"]
+    index["duration"] = max([x["duration"] for x in entries] + [0.0])
+    index["segments"] = sum(len(x["segments"]["uri"]) for x in entries)
+    index["bytes"] = sum(x["bytes"] for x in entries)
+    return index
+
+
+def put_index(bucket, key, index):
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(index, separators=(",", ":")).encode("utf-8"),
+        ContentType="application/json"
+    )
+
+
+def write_index(bucket, master_key, index):
+    """Write the index next to the master playlist
+
+    Returns
+    ------
+    Index key: str
+
+    """
+
+    key = index_key(master_key)
+    put_index(bucket, key, index)
+    return key
+
+
+def verify(bucket, master_key, source_duration=None):
+    """Check the HLS output and write its index
+
+    Returns
+    ------
+    Index key and index: tuple, IntegrityError with the first errors when
+    the output is broken
+
+    """
+
+    index, errors = build_index(bucket, master_key, source_duration)
+    if errors:
+        raise IntegrityError(
+            f"{len(errors)} errors in {master_key}: "
+            f"{'; '.join(errors[:MAX_ERRORS])}"
+        )
+    return write_index(bucket, master_key, index), index
+
+
+def add_media(bucket, key, rendition, group):
+    """Add a rendition to an index, like the subtitles added after the
+    encode, replacing the one of the same type, group and language
+
+    Parameters
+    ----------
+    bucket: str, required
+        Bucket of the index
+
+    key: str, required
+        Key of the index
+
+    rendition: dict, required
+        media_entry of the rendition with its type, group and language
+
+    group: str, required
+        Variants attribute of the rendition group, like subtitles
+
+    """
+
+    index = json.loads(read_text(bucket, key))
+    same = ("type", "group", "language")
+    index["media"] = [
+        x for x in index["media"]
+        if any(x.get(name) != rendition.get(name) for name in same)
+    ] + [rendition]
+    for variant in index["variants"]:
+        variant[group] = rendition["group"]
+    put_index(bucket, key, totals(index))
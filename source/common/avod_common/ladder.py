@@ -0,0 +1,439 @@
+"""ABR ladder of the HLS MediaConvert job
+
+The ladder is described by a profile, a JSON file in the profiles folder
+with the codec, the segment length, the audio bitrate and the rungs. The
+rungs are compiled to the MediaConvert job Settings using the probed
+source in metadata.media_info (width, height and framerate):
+
+- rungs larger than the source, in width and height, are dropped, so a
+  480p source isn't upscaled to 1080p. The smallest rung is always kept;
+- rungs with their own framerate, like a 60 fps rung, are dropped when
+  the source is slower, and the profile framerate is never higher than
+  the source one.
+
+The compiled Settings are cached for each profile and rungs selection,
+only the job inputs and destination are set for every job.
+"""
+import functools
+import hashlib
+import json
+import os
+
+
+profiles_dir = os.path.join(os.path.dirname(__file__), "profiles")
+
+# Rung defaults, a rung of the profile overrides any of them
+rung_defaults = {
+    "quality": 7,
+    "profile": "MAIN",
+    "level": "LEVEL_3_1",
+    "audio_profile": "HEV1",
+    "b_frames": 3,
+    "b_reference": "ENABLED",
+    "adaptive_quantization": "HIGH"
+}
+
+audio_pids = list(range(482, 499))
+
+
+@functools.lru_cache(maxsize=None)
+def load_profile(name):
+    """Read a profile from the profiles folder"""
+
+    with open(os.path.join(profiles_dir, f"{name}.json")) as f:
+        profile = json.load(f)
+
+    if profile.get("codec", "H_264") != "H_264":
+        raise ValueError(f"Unsupported codec: {profile['codec']}")
+    if not profile.get("rungs"):
+        raise ValueError(f"Profile without rungs: {name}")
+    return profile
+
+
+def select_rungs(profile, media_info=None):
+    """Select the rungs for the source
+
+    Parameters
+    ----------
+    profile: dict, required
+        Ladder profile
+
+    media_info: dict, optional
+        Probed source with width, height and framerate
+
+
+    Returns
+    ------
+    Indexes of the selected rungs, and the source framerate when it is
+    slower than the profile one: tuple
+
+    """
+
+    rungs = profile["rungs"]
+    media_info = media_info or {}
+    width = media_info.get("width")
+    height = media_info.get("height")
+    framerate = media_info.get("framerate")
+
+    selected = []
+    for index, rung in enumerate(rungs):
+        if (
+            width and height and
+            rung["width"] > width and rung["height"] > height
+        ):
+            continue
+        if (
+            framerate and "framerate" in rung and
+            rung["framerate"][0] / rung["framerate"][1] > framerate
+        ):
+            continue
+        selected.append(index)
+
+    if not selected:
+        selected.append(
+            min(range(len(rungs)), key=lambda x: rungs[x]["height"])
+        )
+
+    numerator, denominator = profile["framerate"]
+    if framerate and framerate < numerator / denominator:
+        # Rounded so similar sources share the compiled settings
+        framerate = round(framerate, 3)
+    else:
+        framerate = None
+
+    return tuple(selected), framerate
+
+
+def video_description(profile, rung, source_framerate):
+    numerator, denominator = rung.get("framerate", profile["framerate"])
+    framerate = {
+        "FramerateControl": "SPECIFIED",
+        "FramerateNumerator": numerator,
+        "FramerateDenominator": denominator
+    }
+    fps = numerator / denominator
+    if "framerate" not in rung and source_framerate:
+        framerate = {"FramerateControl": "INITIALIZE_FROM_SOURCE"}
+        fps = source_framerate
+
+    return {
+        "Width": rung["width"],
+        "ScalingBehavior": "DEFAULT",
+        "Height": rung["height"],
+        "VideoPreprocessors": {
+            "Deinterlacer": {
+                "Algorithm": "INTERPOLATE",
+                "Mode": "DEINTERLACE",
+                "Control": "NORMAL"
+            }
+        },
+        "TimecodeInsertion": "DISABLED",
+        "AntiAlias": "ENABLED",
+        "Sharpness": 50,
+        "CodecSettings": {
+            "Codec": "H_264",
+            "H264Settings": {
+                "InterlaceMode": "PROGRESSIVE",
+                "ParNumerator": 1,
+                "NumberReferenceFrames": 3,
+                "Syntax": "DEFAULT",
+                "GopClosedCadence": 1,
+                "HrdBufferInitialFillPercentage": 90,
+                "GopSize": round(profile["gop_seconds"] * fps),
+                "Slices": 1,
+                "GopBReference": rung["b_reference"],
+                "HrdBufferSize": rung["buffer_size"],
+                "MaxBitrate": rung["max_bitrate"],
+                "SlowPal": "DISABLED",
+                "ParDenominator": 1,
+                "SpatialAdaptiveQuantization": "ENABLED",
+                "TemporalAdaptiveQuantization": "ENABLED",
+                "FlickerAdaptiveQuantization": "ENABLED",
+                "EntropyEncoding": "CABAC",
+                "RateControlMode": "QVBR",
+                "QvbrSettings": {
+                    "QvbrQualityLevel": rung["quality"],
+                    "QvbrQualityLevelFineTune": 0
+                },
+                "CodecProfile": rung["profile"],
+                "Telecine": "NONE",
+                "MinIInterval": 0,
+                "AdaptiveQuantization": rung["adaptive_quantization"],
+                "CodecLevel": rung["level"],
+                "FieldEncoding": "PAFF",
+                "SceneChangeDetect": "ENABLED",
+                "QualityTuningLevel": "MULTI_PASS_HQ",
+                "FramerateConversionAlgorithm": "DUPLICATE_DROP",
+                "UnregisteredSeiTimecode": "DISABLED",
+                "GopSizeUnits": "FRAMES",
+                "ParControl": "SPECIFIED",
+                "NumberBFramesBetweenReferenceFrames": rung["b_frames"],
+                "RepeatPps": "DISABLED",
+                **framerate
+            }
+        },
+        "AfdSignaling": "NONE",
+        "DropFrameTimecode": "ENABLED",
+        "RespondToAfd": "NONE",
+        "ColorMetadata": "INSERT"
+    }
+
+
+def rung_output(profile, rung, source_framerate):
+    rung = {
+        **rung_defaults,
+        "audio_bitrate": profile["audio_bitrate"],
+        **rung
+    }
+    return {
+        "ContainerSettings": {
+            "Container": "M3U8",
+            "M3u8Settings": {
+                "AudioFramesPerPes": 4,
+                "PcrControl": "PCR_EVERY_PES_PACKET",
+                "PmtPid": 480,
+                "PrivateMetadataPid": 503,
+                "ProgramNumber": 1,
+                "PatInterval": 0,
+                "PmtInterval": 0,
+                "Scte35Source": "NONE",
+                "VideoPid": 481,
+                "AudioPids": audio_pids
+            }
+        },
+        "VideoDescription": video_description(
+            profile, rung, source_framerate
+        ),
+        "AudioDescriptions": [
+            {
+                "AudioTypeControl": "FOLLOW_INPUT",
+                "AudioSourceName": "Audio Selector 1",
+                "CodecSettings": {
+                    "Codec": "AAC",
+                    "AacSettings": {
+                        "AudioDescriptionBroadcasterMix": "NORMAL",
+                        "Bitrate": rung["audio_bitrate"],
+                        "RateControlMode": "CBR",
+                        "CodecProfile": rung["audio_profile"],
+                        "CodingMode": "CODING_MODE_2_0",
+                        "RawFormat": "NONE",
+                        "SampleRate": 48000,
+                        "Specification": "MPEG4"
+                    }
+                },
+                "LanguageCodeControl": "FOLLOW_INPUT",
+                "AudioType": 0
+            }
+        ],
+        "OutputSettings": {
+            "HlsSettings": {
+                "SegmentModifier": "$dt$"
+            }
+        },
+        "NameModifier": rung["name"]
+    }
+
+
+def captions_output():
+    return {
+        "ContainerSettings": {
+            "Container": "M3U8",
+            "M3u8Settings": {
+                "AudioFramesPerPes": 4,
+                "PcrControl": "PCR_EVERY_PES_PACKET",
+                "PmtPid": 480,
+                "PrivateMetadataPid": 503,
+                "ProgramNumber": 1,
+                "PatInterval": 0,
+                "PmtInterval": 0,
+                "Scte35Source": "NONE",
+                "NielsenId3": "NONE",
+                "TimedMetadata": "NONE",
+                "VideoPid": 481,
+                "AudioPids": audio_pids[:11]
+            }
+        },
+        "OutputSettings": {
+            "HlsSettings": {
+                "AudioGroupId": "program_audio",
+                "AudioOnlyContainer": "AUTOMATIC",
+                "IFrameOnlyManifest": "EXCLUDE"
+            }
+        },
+        "NameModifier": "WebVTT",
+        "CaptionDescriptions": [
+            {
+                "CaptionSelectorName": "Captions Selector 1",
+                "DestinationSettings": {
+                    "DestinationType": "WEBVTT"
+                },
+                "LanguageCode": "POR"
+            }
+        ]
+    }
+
+
+@functools.lru_cache(maxsize=64)
+def compile_settings(name, rungs, source_framerate, captions):
+    """Compile the job Settings, without inputs and destination
+
+    Parameters
+    ----------
+    name: str, required
+        Profile name
+
+    rungs: tuple, required
+        Indexes of the rungs, from select_rungs
+
+    source_framerate: float, required
+        Source framerate when it is slower than the profile, or None
+
+    captions: bool, required
+        Whether the captions are embedded as a WebVTT output
+
+
+    Returns
+    ------
+    Job Settings: str, as JSON so the cached value can't be changed
+
+    """
+
+    profile = load_profile(name)
+    outputs = [
+        rung_output(profile, profile["rungs"][x], source_framerate)
+        for x in rungs
+    ]
+    if captions:
+        outputs.append(captions_output())
+
+    settings = {
+        "OutputGroups": [
+            {
+                "CustomName": "HLS",
+                "Name": "Apple HLS",
+                "Outputs": outputs,
+                "OutputGroupSettings": {
+                    "Type": "HLS_GROUP_SETTINGS",
+                    "HlsGroupSettings": {
+                        "ManifestDurationFormat": "INTEGER",
+                        "SegmentLength": profile["segment_length"],
+                        "TimedMetadataId3Period": 10,
+                        "CaptionLanguageSetting": "OMIT",
+                        "TimedMetadataId3Frame": "PRIV",
+                        "CodecSpecification": "RFC_4281",
+                        "OutputSelection": "MANIFESTS_AND_SEGMENTS",
+                        "ProgramDateTimePeriod": 600,
+                        "MinSegmentLength": 0,
+                        "MinFinalSegmentLength": 0,
+                        "DirectoryStructure": "SINGLE_DIRECTORY",
+                        "ProgramDateTime": "EXCLUDE",
+                        "SegmentControl": "SEGMENTED_FILES",
+                        "ManifestCompression": "NONE",
+                        "ClientCache": "ENABLED",
+                        "StreamInfResolution": "INCLUDE"
+                    }
+                }
+            }
+        ],
+        "AdAvailOffset": 0,
+        "Inputs": [
+            {
+                "AudioSelectors": {
+                    "Audio Selector 1": {
+                        "Offset": 0,
+                        "DefaultSelection": "DEFAULT",
+                        "ProgramSelection": 1
+                    }
+                },
+                "VideoSelector": {
+                    "ColorSpace": "FOLLOW",
+                    "Rotate": "DEGREE_0",
+                    "AlphaBehavior": "DISCARD"
+                },
+                "FilterEnable": "AUTO",
+                "PsiControl": "USE_PSI",
+                "FilterStrength": 0,
+                "DeblockFilter": "DISABLED",
+                "DenoiseFilter": "DISABLED",
+                "TimecodeSource": "EMBEDDED"
+            }
+        ]
+    }
+    return json.dumps(settings)
+
+
+def profile_digest(name):
+    """SHA-256 of the Settings of a profile compiled with all its rungs
+
+    It changes with the profile and with the way it is compiled, like the
+    rung defaults, so the outputs of the same source only match when the
+    digest does.
+
+    Parameters
+    ----------
+    name: str, required
+        Profile name, a JSON file in the profiles folder
+
+
+    Returns
+    ------
+    Hex digest: str
+
+    """
+
+    profile = load_profile(name)
+    rungs = tuple(range(len(profile["rungs"])))
+    settings = compile_settings(name, rungs, None, True)
+    return hashlib.sha256(settings.encode("utf-8")).hexdigest()
+
+
+def build_settings(name, file_input, destination, caption_input=None,
+                   media_info=None):
+    """Build the MediaConvert job Settings of a profile
+
+    Parameters
+    ----------
+    name: str, required
+        Profile name, a JSON file in the profiles folder
+
+    file_input: str, required
+        S3 url of the source video
+
+    destination: str, required
+        S3 url of the HLS folder
+
+    caption_input: str, optional
+        S3 url of a SRT file to embed as WebVTT
+
+    media_info: dict, optional
+        Probed source with width, height and framerate
+
+
+    Returns
+    ------
+    Job Settings and names of the rungs: tuple
+
+    """
+
+    profile = load_profile(name)
+    rungs, source_framerate = select_rungs(profile, media_info)
+    settings = json.loads(compile_settings(
+        name, rungs, source_framerate, caption_input is not None
+    ))
+
+    settings["OutputGroups"][0]["OutputGroupSettings"][
+        "HlsGroupSettings"]["Destination"] = destination
+    settings["Inputs"][0]["FileInput"] = file_input
+    if caption_input is not None:
+        settings["Inputs"][0]["CaptionSelectors"] = {
+            "Captions Selector 1": {
+                "SourceSettings": {
+                    "SourceType": "SRT",
+                    "FileSourceSettings": {
+                        "SourceFile": caption_input
+                    }
+                }
+            }
+        }
+
+    return settings, [profile["rungs"][x]["name"] for x in rungs]
@@ -0,0 +1,280 @@
+"""Run ledger of the workflows
+
+Each stage of a workflow has an item in LEDGERTABLE, keyed by the
+workflow uuid and the stage, like hls or transcribe_001 for a chunk. The
+functions update its status and times as the stage moves on, and append
+each change to its list of transitions:
+
+    STARTED, DUPLICATE: the workflow was started, or skipped
+    WAITING: the job waits for admission, see avod_common.admission
+    SUBMITTED: the job was created
+    COMPLETE, FAILED: the stage ended
+    FALLBACK: the audio couldn't be remuxed, MediaConvert extracts it
+
+The job times come from MediaConvert Job.Timing and from the Transcribe
+job, with queue_seconds and run_seconds stored as numbers. The status,
+day and file_name indexes, sorted by the last update, answer what is
+stuck, what finished in the last hour or every run of a file without
+scanning the table. A ledger write never fails a function, errors are
+printed.
+"""
+import os
+from datetime import date, datetime, timezone
+from botocore.exceptions import BotoCoreError, ClientError
+from avod_common import chunks, clients
+
+
+# Ledger table, empty to disable the ledger
+ledger_table = os.environ.get("LEDGERTABLE", "")
+# Days the items are kept, with the expires TTL attribute
+retention_days = int(os.environ.get("LEDGERRETENTIONDAYS", "90"))
+
+# Ledger status of the MediaConvert and Transcribe job statuses
+job_statuses = {
+    "SUBMITTED": "SUBMITTED",
+    "QUEUED": "SUBMITTED",
+    "PROGRESSING": "PROGRESSING",
+    "IN_PROGRESS": "PROGRESSING",
+    "COMPLETE": "COMPLETE",
+    "COMPLETED": "COMPLETE",
+    "ERROR": "FAILED",
+    "CANCELED": "FAILED",
+    "FAILED": "FAILED"
+}
+# Stages run for each chunk of the transcription
+chunked_stages = ("audio", "transcribe")
+
+dynamodb = clients.lazy("dynamodb")
+s3 = clients.lazy("s3")
+
+
+def isoformat(value):
+    """ISO 8601 UTC time of a timezone aware datetime"""
+
+    return value.astimezone(timezone.utc).isoformat(
+        timespec="milliseconds"
+    ).replace("+00:00", "Z")
+
+
+def parse_time(text):
+    return datetime.fromisoformat(text.replace("Z", "+00:00"))
+
+
+def attribute(value):
+    """DynamoDB attribute value of a str, bool, number, dict, list or
+    None"""
+
+    if value is None:
+        return {"NULL": True}
+    if isinstance(value, str):
+        return {"S": value}
+    if isinstance(value, bool):
+        return {"BOOL": value}
+    if isinstance(value, (int, float)):
+        return {"N": repr(value)}
+    if isinstance(value, dict):
+        return {"M": {k: attribute(v) for k, v in value.items()}}
+    return {"L": [attribute(x) for x in value]}
+
+
+def stage_key(metadata, stage):
+    if stage in chunked_stages:
+        return f"{stage}{chunks.chunk_suffix(metadata)}"
+    return stage
+
+
+def update(metadata, stage, status, fields):
+    """update_item of a stage with its new status and transition"""
+
+    fields = {
+        name: isoformat(value) if isinstance(value, date) else value
+        for name, value in fields.items() if value is not None
+    }
+    for name, start, end in (
+        ("queue_seconds", "submitted", "started"),
+        ("run_seconds", "started", "finished")
+    ):
+        if start in fields and end in fields:
+            fields[name] = round((
+                parse_time(fields[end]) - parse_time(fields[start])
+            ).total_seconds(), 3)
+
+    now = datetime.now(timezone.utc)
+    updated = isoformat(now)
+    values = {
+        "status": status,
+        "updated": updated,
+        "day": updated[:10],
+        "file_name": metadata.get("file_name", ""),
+        "expires": int(now.timestamp()) + retention_days * 86400,
+        **fields
+    }
+    names = {f"#{x}": x for x in values}
+    names["#transitions"] = "transitions"
+    attributes = {f":{x}": attribute(v) for x, v in values.items()}
+    attributes[":transition"] = attribute(
+        [{"status": status, "at": updated, **fields}]
+    )
+    attributes[":empty"] = {"L": []}
+
+    dynamodb.update_item(
+        TableName=ledger_table,
+        Key={
+            "uuid": {"S": metadata["uuid"]},
+            "stage": {"S": stage_key(metadata, stage)}
+        },
+        UpdateExpression="SET " + ", ".join(
+            [f"#{x} = :{x}" for x in values] +
+            ["#transitions = list_append("
+             "if_not_exists(#transitions, :empty), :transition)"]
+        ),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=attributes
+    )
+
+
+def record(metadata, stage, status, **fields):
+    """Update a stage of the workflow in the ledger and append the
+    transition
+
+    Parameters
+    ----------
+    metadata: dict, required
+        Step Functions payload metadata, with uuid and file_name
+
+    stage: str, required
+        workflow, probe, hls, audio, transcribe, captions...
+
+    status: str, required
+        STARTED, WAITING, SUBMITTED, COMPLETE, FAILED...
+
+    fields: optional
+        job_id, submitted, started and finished (datetime or ISO 8601),
+        input_bytes, output_bytes, error... None values are left out
+
+
+    Returns
+    ------
+    False when the ledger is disabled or the write failed: bool
+
+    """
+
+    if not ledger_table:
+        return False
+
+    try:
+        update(metadata, stage, status, fields)
+    except Exception as e:
+        # Bad fields, AWS or connection errors: the ledger never fails
+        # the function
+        print(f"Ledger {metadata.get('uuid')} {stage} {status}: {e}")
+        return False
+    return True
+
+
+def job_id(metadata, stage):
+    """Job id last recorded for a stage of the workflow, None when there
+    is none, the stage FAILED or the ledger is disabled"""
+
+    if not ledger_table:
+        return None
+    try:
+        response = dynamodb.get_item(
+            TableName=ledger_table,
+            Key={
+                "uuid": {"S": metadata["uuid"]},
+                "stage": {"S": stage_key(metadata, stage)}
+            },
+            ProjectionExpression="job_id, #status",
+            ExpressionAttributeNames={"#status": "status"},
+            ConsistentRead=True
+        )
+    except (ClientError, BotoCoreError) as e:
+        print(f"Ledger {metadata.get('uuid')} {stage}: {e}")
+        return None
+    item = response.get("Item", {})
+    if item.get("status", {}).get("S") == "FAILED":
+        return None
+    return item.get("job_id", {}).get("S")
+
+
+def redrive_count(metadata):
+    """Re-drives recorded for the workflow, 0 when there is none or the
+    ledger is disabled"""
+
+    if not ledger_table:
+        return 0
+    try:
+        response = dynamodb.get_item(
+            TableName=ledger_table,
+            Key={
+                "uuid": {"S": metadata["uuid"]},
+                "stage": {"S": "workflow"}
+            },
+            ProjectionExpression="redrive",
+            ConsistentRead=True
+        )
+    except (ClientError, BotoCoreError) as e:
+        print(f"Ledger {metadata.get('uuid')} workflow: {e}")
+        return 0
+    return int(response.get("Item", {}).get("redrive", {}).get("N", "0"))
+
+
+def record_mediaconvert(metadata, stage, job, **fields):
+    """record a MediaConvert get_job or create_job Job"""
+
+    timing = job.get("Timing", {})
+    return record(
+        metadata, stage, job_statuses.get(job["Status"], job["Status"]),
+        job_id=job["Id"],
+        job_status=job["Status"],
+        submitted=timing.get("SubmitTime") or job.get("CreatedAt"),
+        started=timing.get("StartTime"),
+        finished=timing.get("FinishTime"),
+        error=job.get("ErrorMessage"),
+        **fields
+    )
+
+
+def record_transcribe(metadata, job, **fields):
+    """record a Transcribe TranscriptionJob"""
+
+    status = job["TranscriptionJobStatus"]
+    return record(
+        metadata, "transcribe", job_statuses.get(status, status),
+        job_id=job["TranscriptionJobName"],
+        job_status=status,
+        submitted=job.get("CreationTime"),
+        started=job.get("StartTime"),
+        finished=job.get("CompletionTime"),
+        error=job.get("FailureReason"),
+        **fields
+    )
+
+
+def object_bytes(bucket, key):
+    """Size of an output object, None when the ledger is disabled or the
+    object can't be read"""
+
+    if not ledger_table:
+        return None
+    try:
+        return s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+    except (ClientError, BotoCoreError):
+        return None
+
+
+def prefix_bytes(bucket, prefix):
+    """Size of the output objects under a prefix, None when the ledger is
+    disabled or they can't be listed"""
+
+    if not ledger_table:
+        return None
+    total = 0
+    try:
+        paginator = s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            total += sum(x["Size"] for x in page.get("Contents", []))
+    except (ClientError, BotoCoreError):
+        return None
+    return total
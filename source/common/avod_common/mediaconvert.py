@@ -0,0 +1,126 @@
+"""MediaConvert endpoint resolver and job adoption
+
+The account endpoint lives at module level, like the clients, so it is
+kept between warm invocations of a function. The endpoint can be seeded
+with the MCENDPOINT environment variable to skip describe_endpoints
+entirely.
+
+A start function run twice for the same stage adopts the job of the
+first run instead of submitting a duplicate: a retry within a minute
+gets it back from create_job by its ClientRequestToken, and later runs
+find it by the job id in the run ledger, see avod_common.ledger.
+"""
+import os
+import time
+from avod_common import chunks, clients, ledger
+
+
+endpoint_ttl = int(os.environ.get("MCENDPOINTTTL", "3600"))
+
+endpoint = {
+    "url": os.environ.get("MCENDPOINT") or None,
+    "expires": float("inf")
+}
+
+
+def get_endpoint():
+    """Return the account MediaConvert endpoint, calling
+    describe_endpoints only when the cached value is missing or expired
+
+    Returns
+    ------
+    MediaConvert endpoint url: str
+
+    """
+
+    if endpoint["url"] is None or endpoint["expires"] < time.monotonic():
+        response = get_client().describe_endpoints()
+        endpoint["url"] = response["Endpoints"][0]["Url"]
+        endpoint["expires"] = time.monotonic() + endpoint_ttl
+    return endpoint["url"]
+
+
+def get_client(endpoint_url=None):
+    """Return a MediaConvert client for the endpoint, one per endpoint url
+
+    Parameters
+    ----------
+    endpoint_url: str, optional
+        Account endpoint, without it the client can only be used to call
+        describe_endpoints
+
+
+    Returns
+    ------
+    MediaConvert client: object
+
+    """
+
+    return clients.client("mediaconvert", endpoint_url)
+
+
+def request_token(metadata, stage):
+    """create_job idempotency token of a stage of the workflow, a new one
+    for each re-drive"""
+
+    redrive = metadata.get("redrive", 0)
+    return (
+        f"{metadata['uuid']}-{stage}{chunks.chunk_suffix(metadata)}"
+        f"{f'-r{redrive}' if redrive else ''}"
+    )
+
+
+def find_job(client, metadata, stage):
+    """Job of a stage submitted by a previous run of the workflow
+
+    Parameters
+    ----------
+    client: object, required
+        MediaConvert client of the account endpoint
+
+    metadata: dict, required
+        Step Functions payload metadata
+
+    stage: str, required
+        hls or audio
+
+
+    Returns
+    ------
+    The Job, None when there is none or it failed: dict
+
+    """
+
+    job_id = ledger.job_id(metadata, stage)
+    if job_id is None:
+        return None
+    try:
+        job = client.get_job(Id=job_id)["Job"]
+    except client.exceptions.NotFoundException:
+        return None
+    if job["Status"] in ("ERROR", "CANCELED"):
+        return None
+    return job
+
+
+def submit_job(client, metadata, stage, **kwargs):
+    """Adopt the job of the stage or create it
+
+    Returns
+    ------
+    create_job response, or the adopted Job: dict
+
+    """
+
+    job = find_job(client, metadata, stage)
+    if job is not None:
+        print(f"Adopted {stage} job {job['Id']}: {job['Status']}")
+        return {"Job": job}
+    return client.create_job(
+        ClientRequestToken=request_token(metadata, stage),
+        UserMetadata={
+            "uuid": metadata["uuid"],
+            "stage": f"{stage}{chunks.chunk_suffix(metadata)}"
+        },
+        **kwargs
+    )
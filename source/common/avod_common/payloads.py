@@ -0,0 +1,21 @@
+"""Helpers for the Step Functions payloads of the functions"""
+from datetime import datetime
+
+
+TIMESTAMP_FORMAT = "%d-%b-%Y (%H:%M:%S.%f)"
+
+
+def timestamp():
+    """Current time in the format of metadata.start_date and
+    metadata.last_update"""
+
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+def touch(payload, status=None):
+    """Set metadata.last_update, and metadata.status when given"""
+
+    if status is not None:
+        payload["metadata"]["status"] = status
+    payload["metadata"]["last_update"] = timestamp()
+    return payload
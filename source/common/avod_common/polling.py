@@ -0,0 +1,120 @@
+"""Poll interval of the Wait states of the Step Functions
+
+The get_* functions return metadata.next_poll_seconds, used by the Wait
+states through SecondsPath. When the remaining time of the job can be
+estimated (from the job progress or from the source duration) the next
+poll happens after half of it, so polls get closer as the job approaches
+completion. Past the estimate, the interval grows with the time the job
+is overdue, starting again from POLLMIN as it is likely about to finish.
+Without an estimate the interval backs off exponentially.
+"""
+import os
+from datetime import datetime, timezone
+
+
+min_poll_seconds = int(os.environ.get("POLLMIN", "5"))
+max_poll_seconds = int(os.environ.get("POLLMAX", "300"))
+
+# Seconds of processing per second of media and fixed queue overhead
+stage_speed = {
+    "audio": 0.1,
+    "transcribe": 0.5,
+    "hls": 1.0
+}
+stage_overhead = 15
+# Fraction of the seconds a job is past its estimate waited before the
+# next poll
+overdue_fraction = 0.25
+
+
+def elapsed_seconds(since):
+    """Seconds since a timezone aware datetime, 0 when it is unknown"""
+
+    if since is None:
+        return 0.0
+    return max((datetime.now(timezone.utc) - since).total_seconds(), 0.0)
+
+
+def source_duration(metadata):
+    """Source duration in seconds from metadata.media_info, if probed, or
+    the duration of the chunk being processed"""
+
+    duration = metadata.get("media_info", {}).get("duration")
+    chunk = metadata.get("chunk", {})
+    if duration and chunk.get("count", 1) > 1:
+        duration = chunk.get("end", duration) - chunk["start"]
+    return duration
+
+
+def next_poll_seconds(stage, elapsed, percent=None, duration=None, polls=0):
+    """Compute the seconds to wait before polling a job again
+
+    Parameters
+    ----------
+    stage: str, required
+        audio, transcribe or hls
+
+    elapsed: float, required
+        Seconds since the job started
+
+    percent: int, optional
+        Job progress from 0 to 100, like MediaConvert JobPercentComplete
+
+    duration: float, optional
+        Source duration in seconds
+
+    polls: int, optional
+        Number of polls already done for this job
+
+
+    Returns
+    ------
+    Seconds to wait: int
+
+    """
+
+    remaining = None
+    if percent:
+        remaining = elapsed * (100 - percent) / percent
+    elif duration:
+        expected = stage_overhead + duration * stage_speed[stage]
+        remaining = expected - elapsed
+
+    if remaining is not None and remaining > 0:
+        seconds = remaining / 2
+    elif remaining is not None:
+        # Back off from when the estimate ran out, not from the first poll
+        seconds = -remaining * overdue_fraction
+    else:
+        seconds = min_poll_seconds * 2 ** min(polls, 16)
+
+    return int(min(max(seconds, min_poll_seconds), max_poll_seconds))
+
+
+def mediaconvert_poll_seconds(stage, job, metadata, polls=0):
+    """next_poll_seconds for a MediaConvert get_job Job"""
+
+    timing = job.get("Timing", {})
+    percent = job.get("JobPercentComplete")
+    if percent and timing.get("StartTime"):
+        # Progress is relative to the transcoding, not to the queue time
+        elapsed = elapsed_seconds(timing["StartTime"])
+    else:
+        elapsed = elapsed_seconds(
+            timing.get("SubmitTime") or job.get("CreatedAt")
+        )
+    return next_poll_seconds(
+        stage, elapsed, percent, source_duration(metadata), polls
+    )
+
+
+def transcribe_poll_seconds(job, metadata, polls=0):
+    """next_poll_seconds for a Transcribe get_transcription_job
+    TranscriptionJob"""
+
+    return next_poll_seconds(
+        "transcribe",
+        elapsed_seconds(job.get("CreationTime")),
+        duration=source_duration(metadata),
+        polls=polls
+    )
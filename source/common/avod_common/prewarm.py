@@ -0,0 +1,222 @@
+"""CDN prewarm of the HLS outputs
+
+The first viewers of a new asset pay the origin latency on the master
+playlist, the media playlists and the first segments of each rendition.
+The prewarm GETs them once through the edge, so they are cached when
+the asset is published:
+
+    the master playlist
+    the media playlist of each variant and rendition of the HLS index
+    their EXT-X-MAP segment and their first segments
+
+The URLs are the keys under the edge base URL, the objects are read to
+the end as a partial response is not cached, and the requests run on a
+bounded thread pool. The cache status comes from the X-Cache header of
+CloudFront (Hit, RefreshHit, Miss from cloudfront), the CF-Cache-Status
+and X-Cache-Status headers of other CDNs, or else an Age over 0.
+"""
+import http.client
+import math
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from avod_common import hls_index
+
+
+# First segments of each rendition
+SEGMENTS = 3
+# Requests in flight
+CONCURRENCY = 16
+# Seconds to connect and between two reads of a response
+TIMEOUT = 10
+# Bytes read at a time, the body is dropped
+CHUNK_SIZE = 64 * 1024
+
+# Cache status headers, most specific first
+CACHE_HEADERS = ("X-Cache", "CF-Cache-Status", "X-Cache-Status")
+HIT = ("hit", "refreshhit", "stale", "updating", "revalidated")
+MISS = ("miss", "expired", "bypass", "dynamic")
+
+
+def url(base_url, key):
+    return f"{base_url.rstrip('/')}/{urllib.parse.quote(key)}"
+
+
+def targets(base_url, master_key, index, segments=SEGMENTS):
+    """Requests of the prewarm of a HLS output
+
+    Parameters
+    ----------
+    base_url: str, required
+        Edge URL of the bucket root, like https://d1234.cloudfront.net
+
+    master_key: str, required
+        Key of the master playlist
+
+    index: dict, required
+        HLS index of the output, see avod_common.hls_index
+
+    segments: int, optional
+        First segments of each rendition
+
+
+    Returns
+    ------
+    Kind (master, playlist, init or segment) and URL of each request,
+    the playlists first: list
+
+    """
+
+    playlists = [("master", url(base_url, master_key))]
+    media = []
+    for entry in index["variants"] + index["media"]:
+        key = hls_index.resolve(master_key, entry["uri"])
+        if key is None:
+            continue
+        playlists.append(("playlist", url(base_url, key)))
+        uris = entry["segments"]["uri"][:segments]
+        if "init" in entry:
+            media.append(("init", entry["init"]["uri"], key))
+        media += [("segment", x, key) for x in uris]
+
+    seen = set()
+    resources = []
+    for kind, uri, playlist_key in media:
+        key = hls_index.resolve(playlist_key, uri)
+        # A CDN or another origin, or a segment shared by byte ranges
+        if key is None or key in seen:
+            continue
+        seen.add(key)
+        resources.append((kind, url(base_url, key)))
+    return playlists + resources
+
+
+def cache_status(headers):
+    """hit, miss or unknown from the response headers"""
+
+    for name in CACHE_HEADERS:
+        value = (headers.get(name) or "").lower()
+        if not value:
+            continue
+        status = value.split()[0].split(",")[0]
+        if status in HIT:
+            return "hit"
+        if status in MISS:
+            return "miss"
+    age = headers.get("Age")
+    if age is not None and age.isdigit():
+        return "hit" if int(age) > 0 else "miss"
+    return "unknown"
+
+
+def fetch(kind, request_url, timeout=TIMEOUT):
+    """GET a URL through the edge and read it to the end
+
+    Returns
+    ------
+    kind, url, HTTP status, cache (hit, miss, unknown or error), seconds
+    to the first byte and to the end, bytes and error: dict
+
+    """
+
+    result = {"kind": kind, "url": request_url, "bytes": 0}
+    started = time.monotonic()
+    try:
+        with urllib.request.urlopen(request_url, timeout=timeout) as f:
+            result["ttfb"] = time.monotonic() - started
+            result["status"] = f.status
+            result["cache"] = cache_status(f.headers)
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                result["bytes"] += len(chunk)
+    except urllib.error.HTTPError as e:
+        result["status"] = e.code
+        result["cache"] = "error"
+        result["error"] = f"{e.code} {e.reason}"
+    except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+        result["cache"] = "error"
+        result["error"] = f"{e}"
+    result["seconds"] = time.monotonic() - started
+    return result
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(math.ceil(len(values) * percent / 100),
+                            len(values)) - 1], 3)
+
+
+def summary(results, skipped=0):
+    """Hit/miss counts and timings of the prewarm requests
+
+    Returns
+    ------
+    requests, hits, misses, unknown, errors and skipped counts, bytes,
+    p50/p95 seconds to the first byte of the hits and misses, p50/p95 and
+    max seconds of the requests and the first errors: dict
+
+    """
+
+    counts = {"hit": 0, "miss": 0, "unknown": 0, "error": 0}
+    for result in results:
+        counts[result["cache"]] += 1
+    seconds = [x["seconds"] for x in results]
+    stats = {
+        "requests": len(results),
+        "hits": counts["hit"],
+        "misses": counts["miss"],
+        "unknown": counts["unknown"],
+        "errors": counts["error"],
+        "skipped": skipped,
+        "bytes": sum(x["bytes"] for x in results),
+        "seconds_p50": percentile(seconds, 50),
+        "seconds_p95": percentile(seconds, 95),
+        "seconds_max": round(max(seconds), 3) if seconds else None
+    }
+    for cache in ("hit", "miss"):
+        ttfb = [x["ttfb"] for x in results if x["cache"] == cache]
+        stats[f"{cache}_ttfb_p50"] = percentile(ttfb, 50)
+        stats[f"{cache}_ttfb_p95"] = percentile(ttfb, 95)
+    stats["error_samples"] = [
+        f"{x['url']}: {x['error']}" for x in results if "error" in x
+    ][:hls_index.MAX_ERRORS]
+    return stats
+
+
+def prewarm(targets, concurrency=CONCURRENCY, timeout=TIMEOUT,
+            deadline=None):
+    """Fetch the requests, the playlists before the segments
+
+    Parameters
+    ----------
+    targets: list, required
+        Kind and URL of each request, see targets
+
+    concurrency: int, optional
+        Requests in flight
+
+    timeout: float, optional
+        Seconds to connect and between two reads of a response
+
+    deadline: float, optional
+        time.time() after which the requests not started are skipped
+
+
+    Returns
+    ------
+    summary of the requests: dict
+
+    """
+
+    def run(request):
+        if deadline is not None and time.time() > deadline:
+            return None
+        return fetch(*request, timeout=timeout)
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        results = list(executor.map(run, targets))
+    done = [x for x in results if x is not None]
+    return summary(done, skipped=len(results) - len(done))
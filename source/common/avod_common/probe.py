@@ -0,0 +1,337 @@
+"""Probe MP4/MOV files with ranged reads
+
+The ISO-BMFF box tree is walked from the start of the file: the top level
+boxes are skipped reading only their headers, so the mdat isn't read, and
+the moov box is read with a single ranged GET wherever it is, at the
+start or at the end of the file. Only the moov boxes needed for the
+media info are parsed: mvhd, and for each trak tkhd, mdhd, hdlr, stsd and
+stts.
+"""
+import struct
+
+
+BLOCK_SIZE = 64 * 1024
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+
+# Boxes with children boxes
+CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+
+class RangeReader:
+    """Read a S3 object with ranged GETs
+
+    Reads are rounded up to block_size, so small reads of close offsets,
+    like box headers, share a request.
+
+    Parameters
+    ----------
+    s3: object, required
+        boto3 S3 client
+
+    bucket: str, required
+        Bucket of the object
+
+    key: str, required
+        Key of the object
+
+    block_size: int, optional
+        Minimum size of each ranged GET
+
+    """
+
+    def __init__(self, s3, bucket, key, block_size=BLOCK_SIZE):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.block_size = block_size
+        self.size = None
+        self.offset = 0
+        self.data = b""
+        self.requests = 0
+        self.bytes_read = 0
+
+    def read(self, offset, size):
+        if (
+            offset >= self.offset and
+            offset + size <= self.offset + len(self.data)
+        ):
+            start = offset - self.offset
+            return self.data[start:start + size]
+        if self.size is not None and offset >= self.size:
+            return b""
+
+        end = offset + max(size, self.block_size) - 1
+        response = self.s3.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f"bytes={offset}-{end}"
+        )
+        # Content-Range: bytes start-end/size
+        self.size = int(response["ContentRange"].rsplit("/", 1)[1])
+        self.offset = offset
+        self.data = response["Body"].read()
+        self.requests += 1
+        self.bytes_read += len(self.data)
+        return self.data[:size]
+
+
+def iter_boxes(data, offset=0, end=None):
+    """Iterate the boxes of a bytes buffer
+
+    Returns
+    ------
+    Box type, payload start and box end offsets: generator of tuple
+
+    """
+
+    end = len(data) if end is None else end
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise ValueError(f"Invalid {box_type!r} box at {offset}")
+        yield box_type, offset + header, offset + size
+        offset += size
+
+
+def find_moov(reader):
+    """Find the moov box walking the top level box headers
+
+    Returns
+    ------
+    moov payload: bytes, the major brand of the ftyp box, and whether the
+    moov is before the mdat: tuple
+
+    """
+
+    offset = 0
+    brand = None
+    faststart = True
+    while True:
+        header = reader.read(offset, 16)
+        if len(header) < 8:
+            raise ValueError("No moov box found")
+        size, box_type = struct.unpack_from(">I4s", header)
+        if not all(32 <= x < 127 for x in box_type):
+            raise ValueError(f"Not an ISO-BMFF file, box at {offset}")
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = reader.size - offset
+        if size < header_size:
+            raise ValueError(f"Invalid {box_type!r} box at {offset}")
+
+        if box_type == b"moov":
+            if size > MAX_MOOV_SIZE:
+                raise ValueError(f"moov box too large: {size} bytes")
+            data = reader.read(offset + header_size, size - header_size)
+            if len(data) < size - header_size:
+                raise ValueError(
+                    f"Truncated moov box, {len(data)} of "
+                    f"{size - header_size} bytes"
+                )
+            return data, brand, faststart
+        if box_type == b"ftyp":
+            brand = header[8:12].decode("latin-1").strip()
+        elif box_type == b"mdat":
+            faststart = False
+        offset += size
+
+
+def full_box(data, offset):
+    """Version of a full box and the offset after version and flags"""
+
+    return data[offset], offset + 4
+
+
+def parse_mvhd(data, offset):
+    version, offset = full_box(data, offset)
+    if version == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, offset + 16)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, offset + 8)
+    return timescale, duration
+
+
+def parse_tkhd(data, offset, end):
+    # Width and height are the last 8 bytes, as 16.16 fixed point
+    width, height = struct.unpack_from(">II", data, end - 8)
+    return width / 65536, height / 65536
+
+
+def parse_mdhd(data, offset):
+    version, offset = full_box(data, offset)
+    if version == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, offset + 16)
+        offset += 28
+    else:
+        timescale, duration = struct.unpack_from(">II", data, offset + 8)
+        offset += 16
+    packed = struct.unpack_from(">H", data, offset)[0]
+    language = "".join(
+        chr(((packed >> shift) & 0x1F) + 0x60) for shift in (10, 5, 0)
+    )
+    return timescale, duration, language
+
+
+def parse_stsd(data, offset, handler):
+    _, offset = full_box(data, offset)
+    offset += 4
+    codec = struct.unpack_from(">4s", data, offset + 4)[0]
+    entry = {"codec": codec.decode("latin-1").strip()}
+    # Sample entry: 8 bytes header, 6 reserved, 2 data reference index
+    offset += 16
+    if handler == "vide":
+        entry["width"], entry["height"] = struct.unpack_from(
+            ">HH", data, offset + 16
+        )
+    elif handler == "soun":
+        channels = struct.unpack_from(">H", data, offset + 8)[0]
+        sample_rate = struct.unpack_from(">I", data, offset + 16)[0]
+        entry["channels"] = channels
+        entry["sample_rate"] = sample_rate >> 16
+    return entry
+
+
+def parse_stts(data, offset):
+    """Number of samples and their total duration in the track timescale"""
+
+    _, offset = full_box(data, offset)
+    count = struct.unpack_from(">I", data, offset)[0]
+    samples = 0
+    duration = 0
+    for sample_count, sample_delta in struct.iter_unpack(
+        ">II", data[offset + 4:offset + 4 + count * 8]
+    ):
+        samples += sample_count
+        duration += sample_count * sample_delta
+    return samples, duration
+
+
+def parse_trak(data, offset, end):
+    track = {}
+    boxes = {}
+
+    def walk(offset, end):
+        for box_type, start, box_end in iter_boxes(data, offset, end):
+            if box_type in CONTAINERS:
+                walk(start, box_end)
+            elif box_type not in boxes:
+                boxes[box_type] = (start, box_end)
+
+    walk(offset, end)
+
+    if b"hdlr" in boxes:
+        start = boxes[b"hdlr"][0]
+        track["type"] = data[start + 8:start + 12].decode("latin-1")
+    if b"tkhd" in boxes:
+        track["display_width"], track["display_height"] = parse_tkhd(
+            data, *boxes[b"tkhd"]
+        )
+    if b"mdhd" in boxes:
+        timescale, duration, language = parse_mdhd(data, boxes[b"mdhd"][0])
+        track["timescale"] = timescale
+        track["duration"] = duration / timescale if timescale else 0.0
+        track["language"] = language
+    if b"stsd" in boxes:
+        track.update(
+            parse_stsd(data, boxes[b"stsd"][0], track.get("type"))
+        )
+    if b"stts" in boxes and track.get("timescale"):
+        samples, duration = parse_stts(data, boxes[b"stts"][0])
+        track["samples"] = samples
+        if track.get("type") == "vide" and duration:
+            track["framerate"] = round(
+                samples * track["timescale"] / duration, 3
+            )
+    return track
+
+
+def parse_moov(moov):
+    """Media info of a moov box payload
+
+    Returns
+    ------
+    Duration, and the video and audio tracks: dict
+
+    """
+
+    info = {"duration": 0.0, "video": [], "audio": []}
+    for box_type, start, end in iter_boxes(moov):
+        if box_type == b"mvhd":
+            timescale, duration = parse_mvhd(moov, start)
+            if timescale:
+                info["duration"] = duration / timescale
+        elif box_type == b"trak":
+            track = parse_trak(moov, start, end)
+            if track.get("type") == "vide":
+                info["video"].append({
+                    "codec": track.get("codec"),
+                    "width": track.get("width"),
+                    "height": track.get("height"),
+                    "display_width": track.get("display_width"),
+                    "display_height": track.get("display_height"),
+                    "framerate": track.get("framerate"),
+                    "duration": track.get("duration")
+                })
+            elif track.get("type") == "soun":
+                info["audio"].append({
+                    "codec": track.get("codec"),
+                    "channels": track.get("channels"),
+                    "sample_rate": track.get("sample_rate"),
+                    "language": track.get("language"),
+                    "duration": track.get("duration")
+                })
+
+    if not info["duration"]:
+        # Fragmented files have the duration in the tracks only
+        info["duration"] = max(
+            [x["duration"] or 0.0 for x in info["video"] + info["audio"]] +
+            [0.0]
+        )
+    return info
+
+
+def probe(reader):
+    """Probe a MP4/MOV file
+
+    Parameters
+    ----------
+    reader: object, required
+        Object with read(offset, size) and size, like RangeReader
+
+
+    Returns
+    ------
+    Media info: dict, with duration in seconds, and width, height,
+    framerate and codecs of the first video and audio tracks
+
+    """
+
+    moov, brand, faststart = find_moov(reader)
+    info = parse_moov(moov)
+
+    video = info["video"][0] if info["video"] else {}
+    audio = info["audio"][0] if info["audio"] else {}
+    return {
+        "brand": brand,
+        "size": reader.size,
+        # moov before mdat, the file plays while it is downloaded
+        "faststart": faststart,
+        "duration": round(info["duration"], 3),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "framerate": video.get("framerate"),
+        "video_codec": video.get("codec"),
+        "audio_codec": audio.get("codec"),
+        "audio_channels": audio.get("channels"),
+        "video": info["video"],
+        "audio": info["audio"]
+    }
@@ -0,0 +1,670 @@
+"""Remux the AAC track of a MP4/MOV file into an audio only MP4
+
+Transcribe only needs the audio, and when the source already has an AAC
+track its samples can be copied as they are instead of transcoded by a
+MediaConvert job. The moov of the source is read like avod_common.probe
+does, the sample tables of the first audio track give the offset and the
+size of each sample, and only the byte ranges holding them are read: the
+ranges closer than max_gap share a ranged GET, and several GETs are in
+flight. The new file has the moov first, its chunk offsets computed from
+the sample sizes, so it is written in order to a stream like
+avod_common.s3_upload.MultipartUploadWriter.
+
+The edit list of the track is applied: a single edit skipping the
+first samples, like the AAC encoder priming, starts the copy at the
+first sample presented, so the transcript times match the video.
+
+The sources that can't be copied raise Unsupported, a ValueError: no
+audio track, another codec than AAC, more than 2 channels or a sample
+rate Transcribe doesn't take, fragmented or encrypted files, and edit
+lists that delay the audio, cut it in several edits or start within a
+sample.
+"""
+import struct
+import time
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+from avod_common import probe
+
+
+# Ranges closer than this are read with a single GET
+MAX_GAP = 1024 * 1024
+# Largest ranged GET
+MAX_RANGE = 8 * 1024 * 1024
+# Ranged GETs in flight
+CONCURRENCY = 8
+# Bytes of the ranges read, or being read, and not written yet
+MAX_BUFFER = 32 * 1024 * 1024
+# Samples in each chunk of the new file, about a second at 48 kHz
+SAMPLES_PER_CHUNK = 48
+
+# objectTypeIndication of MPEG-4 Audio in the esds
+MPEG4_AUDIO = 0x40
+# AAC Main, LC, HE-AAC and HE-AAC v2 audio object types
+AAC_OBJECT_TYPES = {1, 2, 5, 29}
+SAMPLE_RATES = [
+    96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000,
+    11025, 8000, 7350
+]
+# Sample rates and channels Transcribe takes
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 48000
+MAX_CHANNELS = 2
+
+MATRIX = struct.pack(
+    ">9I", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000
+)
+
+
+class Unsupported(ValueError):
+    """The audio of the source can't be copied, it needs a transcode"""
+
+
+def box(box_type, *payloads):
+    payload = b"".join(payloads)
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type, version, flags, *payloads):
+    return box(box_type, struct.pack(">I", version << 24 | flags), *payloads)
+
+
+def track_boxes(moov):
+    """Boxes of the first audio track of a moov payload
+
+    Returns
+    ------
+    Payload start and end offsets by box type: dict
+
+    """
+
+    top = {box_type for box_type, _, _ in probe.iter_boxes(moov)}
+    if b"mvex" in top:
+        raise Unsupported("Fragmented file")
+
+    for box_type, start, end in probe.iter_boxes(moov):
+        if box_type != b"trak":
+            continue
+        boxes = {}
+
+        def walk(offset, end):
+            for box_type, start, box_end in probe.iter_boxes(
+                moov, offset, end
+            ):
+                if box_type in probe.CONTAINERS or box_type == b"edts":
+                    walk(start, box_end)
+                elif box_type not in boxes:
+                    boxes[box_type] = (start, box_end)
+
+        walk(start, end)
+        hdlr = boxes.get(b"hdlr")
+        if hdlr and moov[hdlr[0] + 8:hdlr[0] + 12] == b"soun":
+            return boxes
+    raise Unsupported("No audio track")
+
+
+def descriptors(data, offset, end):
+    """Iterate the MPEG-4 descriptors of an esds
+
+    Returns
+    ------
+    Tag, payload start and end offsets: generator of tuple
+
+    """
+
+    while offset + 2 <= end:
+        tag = data[offset]
+        offset += 1
+        size = 0
+        for _ in range(4):
+            byte = data[offset]
+            offset += 1
+            size = size << 7 | byte & 0x7F
+            if not byte & 0x80:
+                break
+        yield tag, offset, min(offset + size, end)
+        offset += size
+
+
+def parse_esds(data, start, end):
+    """objectTypeIndication and AudioSpecificConfig of an esds payload"""
+
+    for tag, offset, es_end in descriptors(data, start + 4, end):
+        if tag != 0x03:
+            continue
+        # ES_ID, then the flags of the optional fields
+        flags = data[offset + 2]
+        offset += 3
+        if flags & 0x80:
+            offset += 2
+        if flags & 0x40:
+            offset += 1 + data[offset]
+        if flags & 0x20:
+            offset += 2
+        for tag, offset, config_end in descriptors(data, offset, es_end):
+            if tag != 0x04:
+                continue
+            # objectTypeIndication, stream type, buffer size and bitrates
+            object_type = data[offset]
+            for tag, offset, info_end in descriptors(
+                data, offset + 13, config_end
+            ):
+                if tag == 0x05:
+                    return object_type, data[offset:info_end]
+            return object_type, b""
+    raise Unsupported("No decoder config in the esds")
+
+
+def audio_config(config):
+    """Audio object type, sample rate and channel configuration of an
+    AudioSpecificConfig"""
+
+    bits = int.from_bytes(config, "big")
+    length = len(config) * 8
+    position = 0
+
+    def read(count):
+        nonlocal position
+        position += count
+        if position > length:
+            raise Unsupported("Truncated AudioSpecificConfig")
+        return bits >> (length - position) & ((1 << count) - 1)
+
+    object_type = read(5)
+    if object_type == 31:
+        object_type = 32 + read(6)
+    index = read(4)
+    if index == 15:
+        sample_rate = read(24)
+    else:
+        sample_rate = SAMPLE_RATES[index] if index < len(SAMPLE_RATES) else 0
+    return object_type, sample_rate, read(4)
+
+
+def audio_entry(data, start, end):
+    """Check the sample description of an AAC track
+
+    Returns
+    ------
+    esds payload, sample rate and channels: tuple
+
+    """
+
+    _, offset = probe.full_box(data, start)
+    count = struct.unpack_from(">I", data, offset)[0]
+    if count != 1:
+        raise Unsupported(f"{count} sample descriptions")
+    entry_type, entry_start, entry_end = next(
+        probe.iter_boxes(data, offset + 4, end)
+    )
+    if entry_type != b"mp4a":
+        raise Unsupported(
+            f"Audio codec {entry_type.decode('latin-1').strip()}"
+        )
+    # QuickTime sound descriptions 1 and 2 have more fields
+    version = struct.unpack_from(">H", data, entry_start + 8)[0]
+    if version not in (0, 1, 2):
+        raise Unsupported(f"Sound description version {version}")
+    children = entry_start + 28 + (0, 16, 36)[version]
+
+    def find(offset, end):
+        for box_type, box_start, box_end in probe.iter_boxes(
+            data, offset, end
+        ):
+            if box_type == b"esds":
+                return box_start, box_end
+            if box_type == b"wave":
+                found = find(box_start, box_end)
+                if found:
+                    return found
+        return None
+
+    esds = find(children, entry_end)
+    if esds is None:
+        raise Unsupported("No esds box")
+    object_type, config = parse_esds(data, *esds)
+    if object_type != MPEG4_AUDIO or not config:
+        raise Unsupported(f"Audio object type indication {object_type:#x}")
+    profile, sample_rate, channels = audio_config(config)
+    if profile not in AAC_OBJECT_TYPES:
+        raise Unsupported(f"AAC audio object type {profile}")
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        raise Unsupported(f"Sample rate {sample_rate}")
+    if not 1 <= channels <= MAX_CHANNELS:
+        raise Unsupported(f"Channel configuration {channels}")
+    return data[esds[0]:esds[1]], sample_rate, channels
+
+
+def sample_table(data, boxes):
+    """Offset, size and duration of each sample of a track
+
+    Returns
+    ------
+    Offsets, sizes and durations in the track timescale: tuple of list
+
+    """
+
+    for name in (b"stsz", b"stsc", b"stts"):
+        if name not in boxes:
+            raise Unsupported(f"No {name.decode()} box")
+
+    start = boxes[b"stsz"][0]
+    sample_size, count = struct.unpack_from(">II", data, start + 4)
+    if not count:
+        raise Unsupported("No samples in the moov, fragmented file")
+    if sample_size:
+        sizes = [sample_size] * count
+    else:
+        sizes = list(struct.unpack_from(f">{count}I", data, start + 12))
+
+    if b"stco" in boxes:
+        start = boxes[b"stco"][0]
+        chunks = struct.unpack_from(">I", data, start + 4)[0]
+        chunk_offsets = struct.unpack_from(f">{chunks}I", data, start + 8)
+    elif b"co64" in boxes:
+        start = boxes[b"co64"][0]
+        chunks = struct.unpack_from(">I", data, start + 4)[0]
+        chunk_offsets = struct.unpack_from(f">{chunks}Q", data, start + 8)
+    else:
+        raise Unsupported("No stco box")
+
+    start = boxes[b"stsc"][0]
+    entries = struct.unpack_from(">I", data, start + 4)[0]
+    stsc = list(struct.iter_unpack(
+        ">III", data[start + 8:start + 8 + entries * 12]
+    ))
+    if any(x[2] != 1 for x in stsc):
+        raise Unsupported("Samples of several sample descriptions")
+    offsets = []
+    for index, (first, per_chunk, _) in enumerate(stsc):
+        last = stsc[index + 1][0] if index + 1 < len(stsc) else chunks + 1
+        for chunk in range(first - 1, min(last - 1, chunks)):
+            offset = chunk_offsets[chunk]
+            for _ in range(min(per_chunk, count - len(offsets))):
+                offsets.append(offset)
+                offset += sizes[len(offsets) - 1]
+    if len(offsets) < count:
+        raise ValueError("stsc and stco have fewer samples than stsz")
+
+    start = boxes[b"stts"][0]
+    entries = struct.unpack_from(">I", data, start + 4)[0]
+    deltas = []
+    for sample_count, delta in struct.iter_unpack(
+        ">II", data[start + 8:start + 8 + entries * 8]
+    ):
+        deltas.extend([delta] * sample_count)
+    if len(deltas) < count:
+        raise ValueError("stts has fewer samples than stsz")
+    return offsets, sizes, deltas[:count]
+
+
+def media_start(data, boxes, deltas):
+    """Media time the presentation of a track starts at, from its edit
+    list
+
+    Parameters
+    ----------
+    data: bytes, required
+        moov payload
+
+    boxes: dict, required
+        Boxes of the track, see track_boxes
+
+    deltas: list, required
+        Sample durations in the track timescale
+
+
+    Returns
+    ------
+    Media time in the track timescale, the start of a sample: int
+
+    """
+
+    if b"elst" not in boxes:
+        return 0
+    version, offset = probe.full_box(data, boxes[b"elst"][0])
+    count = struct.unpack_from(">I", data, offset)[0]
+    # Segment duration, media time, media rate integer and fraction
+    entry = ">Qqhh" if version == 1 else ">Iihh"
+    edits = list(struct.iter_unpack(entry, data[
+        offset + 4:offset + 4 + count * struct.calcsize(entry)
+    ]))
+    if not edits:
+        return 0
+    if len(edits) > 1:
+        raise Unsupported(f"Edit list of {len(edits)} edits")
+    _, media_time, rate, fraction = edits[0]
+    if media_time < 0:
+        raise Unsupported("Edit list delaying the audio")
+    if (rate, fraction) != (1, 0):
+        raise Unsupported(f"Edit list rate {rate}.{fraction}")
+    times = [0] + list(accumulate(deltas))
+    index = bisect_left(times, media_time)
+    if index >= len(deltas) or times[index] != media_time:
+        raise Unsupported(
+            f"Edit list starting within a sample, at {media_time}"
+        )
+    return media_time
+
+
+def audio_track(moov):
+    """Sample description and sample tables of the AAC track of a moov
+    payload, Unsupported when there is none"""
+
+    boxes = track_boxes(moov)
+    if b"stsd" not in boxes or b"mdhd" not in boxes:
+        raise Unsupported("No stsd or mdhd box")
+    esds, sample_rate, channels = audio_entry(moov, *boxes[b"stsd"])
+    timescale, _, language = probe.parse_mdhd(moov, boxes[b"mdhd"][0])
+    if not timescale:
+        raise ValueError("Audio track without timescale")
+    offsets, sizes, deltas = sample_table(moov, boxes)
+    return {
+        "timescale": timescale,
+        "media_start": media_start(moov, boxes, deltas),
+        "language": language,
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "esds": esds,
+        "offsets": offsets,
+        "sizes": sizes,
+        "deltas": deltas
+    }
+
+
+def select(deltas, timescale, start=0, end=None):
+    """First and last, excluded, samples decoded in a time range in
+    seconds"""
+
+    times = [0] + list(accumulate(deltas))
+    count = len(deltas)
+    first = bisect_left(times, start * timescale, 0, count)
+    last = count if end is None else bisect_left(
+        times, end * timescale, first, count
+    )
+    return first, last
+
+
+def plan_ranges(offsets, sizes, first, last, max_gap=MAX_GAP,
+                max_range=MAX_RANGE):
+    """Byte ranges to read the samples, the ones close enough in the same
+    range
+
+    Returns
+    ------
+    Start and end offsets, and the first and last, excluded, samples of
+    each range: list of list
+
+    """
+
+    ranges = []
+    for index in range(first, last):
+        offset = offsets[index]
+        end = offset + sizes[index]
+        if ranges:
+            current = ranges[-1]
+            if (
+                current[1] <= offset <= current[1] + max_gap and
+                end - current[0] <= max_range
+            ):
+                current[1] = end
+                current[3] = index + 1
+                continue
+        ranges.append([offset, end, index, index + 1])
+    return ranges
+
+
+def stts_entries(deltas):
+    """Runs of the same sample duration"""
+
+    entries = []
+    for delta in deltas:
+        if entries and entries[-1][1] == delta:
+            entries[-1][0] += 1
+        else:
+            entries.append([1, delta])
+    return entries
+
+
+def build_moov(track, sizes, deltas, data_offset):
+    """moov of an audio only file, its samples from data_offset"""
+
+    count = len(sizes)
+    duration = sum(deltas)
+    version = 1 if duration > 0xFFFFFFFF else 0
+    if version:
+        times = struct.pack(">QQIQ", 0, 0, track["timescale"], duration)
+    else:
+        times = struct.pack(">IIII", 0, 0, track["timescale"], duration)
+
+    positions = [0] + list(accumulate(sizes))
+    chunk_offsets = [
+        data_offset + positions[x]
+        for x in range(0, count, SAMPLES_PER_CHUNK)
+    ]
+    if chunk_offsets[-1] > 0xFFFFFFFF:
+        chunk_box = full_box(
+            b"co64", 0, 0, struct.pack(
+                f">I{len(chunk_offsets)}Q", len(chunk_offsets),
+                *chunk_offsets
+            )
+        )
+    else:
+        chunk_box = full_box(
+            b"stco", 0, 0, struct.pack(
+                f">I{len(chunk_offsets)}I", len(chunk_offsets),
+                *chunk_offsets
+            )
+        )
+    stsc = [(1, SAMPLES_PER_CHUNK, 1)]
+    if count % SAMPLES_PER_CHUNK:
+        stsc.append((len(chunk_offsets), count % SAMPLES_PER_CHUNK, 1))
+    if stsc[0][0] == stsc[-1][0]:
+        # A single chunk
+        stsc = stsc[-1:]
+    if len(set(sizes)) == 1:
+        stsz = struct.pack(">II", sizes[0], count)
+    else:
+        stsz = struct.pack(f">II{count}I", 0, count, *sizes)
+    stts = stts_entries(deltas)
+    language = sum(
+        (ord(x) - 0x60) << shift
+        for x, shift in zip(track["language"], (10, 5, 0))
+    )
+
+    sample_entry = box(
+        b"mp4a", bytes(6), struct.pack(">H", 1), bytes(8),
+        struct.pack(
+            ">HHHHI", track["channels"], 16, 0, 0,
+            min(track["sample_rate"], 0xFFFF) << 16
+        ),
+        box(b"esds", track["esds"])
+    )
+    stbl = box(
+        b"stbl",
+        full_box(b"stsd", 0, 0, struct.pack(">I", 1), sample_entry),
+        full_box(b"stts", 0, 0, struct.pack(
+            f">I{len(stts) * 2}I", len(stts), *(x for y in stts for x in y)
+        )),
+        full_box(b"stsc", 0, 0, struct.pack(
+            f">I{len(stsc) * 3}I", len(stsc), *(x for y in stsc for x in y)
+        )),
+        full_box(b"stsz", 0, 0, stsz),
+        chunk_box
+    )
+    minf = box(
+        b"minf",
+        full_box(b"smhd", 0, 0, bytes(4)),
+        box(b"dinf", full_box(
+            b"dref", 0, 0, struct.pack(">I", 1), full_box(b"url ", 0, 1)
+        )),
+        stbl
+    )
+    if version:
+        track_times = struct.pack(">QQIIQ", 0, 0, 1, 0, duration)
+    else:
+        track_times = struct.pack(">IIIII", 0, 0, 1, 0, duration)
+    trak = box(
+        b"trak",
+        full_box(
+            b"tkhd", version, 3, track_times, bytes(8),
+            struct.pack(">hhhH", 0, 0, 0x100, 0), MATRIX, bytes(8)
+        ),
+        box(
+            b"mdia",
+            full_box(b"mdhd", version, 0, times,
+                     struct.pack(">HH", language, 0)),
+            full_box(b"hdlr", 0, 0, bytes(4), b"soun", bytes(12),
+                     b"SoundHandler\0"),
+            minf
+        )
+    )
+    return box(
+        b"moov",
+        full_box(
+            b"mvhd", version, 0, times, struct.pack(">IH", 0x10000, 0x100),
+            bytes(10), MATRIX, bytes(24), struct.pack(">I", 2)
+        ),
+        trak
+    )
+
+
+def read_range(reader, start, end):
+    """Bytes start to end, excluded, of the source of a RangeReader"""
+
+    response = reader.s3.get_object(
+        Bucket=reader.bucket,
+        Key=reader.key,
+        Range=f"bytes={start}-{end - 1}"
+    )
+    data = response["Body"].read()
+    if len(data) != end - start:
+        raise ValueError(f"Short read of bytes {start}-{end - 1}")
+    return data
+
+
+def remux(reader, writer, start=0, end=None, deadline=None,
+          max_gap=MAX_GAP, concurrency=CONCURRENCY, max_buffer=MAX_BUFFER):
+    """Copy the AAC samples of a time range of the source to an audio
+    only MP4
+
+    Parameters
+    ----------
+    reader: object, required
+        probe.RangeReader of the source
+
+    writer: object, required
+        File like object the MP4 is written to
+
+    start: float, optional
+        Seconds of the source the audio starts at, in the presentation
+        timeline of the edit list
+
+    end: float, optional
+        Seconds of the source the audio ends at, None for the end
+
+    deadline: float, optional
+        time.time() after which the copy stops with a TimeoutError
+
+    max_gap: int, optional
+        Bytes between two ranges under which they are read with one GET
+
+    concurrency: int, optional
+        Ranged GETs in flight
+
+    max_buffer: int, optional
+        Bytes of the ranges in flight or waiting to be written, a range
+        is only requested when it fits
+
+
+    Returns
+    ------
+    Samples, seconds and bytes of the audio, and the GETs and bytes read
+    from the source: dict
+
+    """
+
+    moov, _, _ = probe.find_moov(reader)
+    track = audio_track(moov)
+    # The source times are presentation times, after the edit list
+    shift = track["media_start"] / track["timescale"]
+    first, last = select(
+        track["deltas"], track["timescale"], start + shift,
+        None if end is None else end + shift
+    )
+    if first >= last:
+        raise Unsupported(f"No audio samples from {start} to {end} s")
+    sizes = track["sizes"][first:last]
+    deltas = track["deltas"][first:last]
+    total = sum(sizes)
+
+    ftyp = box(b"ftyp", b"isom", struct.pack(">I", 0x200),
+               b"isomiso2mp41")
+    if total + 8 > 0xFFFFFFFF:
+        mdat = struct.pack(">I4sQ", 1, b"mdat", total + 16)
+    else:
+        mdat = struct.pack(">I4s", total + 8, b"mdat")
+    moov_size = len(build_moov(track, sizes, deltas, 0))
+    data_offset = len(ftyp) + moov_size + len(mdat)
+    new_moov = build_moov(track, sizes, deltas, data_offset)
+    if len(new_moov) != moov_size:
+        # The chunk offsets needed co64
+        data_offset += len(new_moov) - moov_size
+        new_moov = build_moov(track, sizes, deltas, data_offset)
+    writer.write(ftyp + new_moov + mdat)
+
+    stats = {
+        "samples": last - first,
+        "seconds": round(sum(deltas) / track["timescale"], 3),
+        "audio_bytes": total,
+        "requests": reader.requests,
+        "bytes_read": reader.bytes_read
+    }
+    offsets = track["offsets"]
+    all_sizes = track["sizes"]
+
+    def write(item, data):
+        range_start, _, range_first, range_last = item
+        view = memoryview(data)
+        writer.write(b"".join(
+            view[offsets[x] - range_start:
+                 offsets[x] - range_start + all_sizes[x]]
+            for x in range(range_first, range_last)
+        ))
+        stats["requests"] += 1
+        stats["bytes_read"] += len(data)
+
+    ranges = plan_ranges(
+        offsets, all_sizes, first, last, max_gap,
+        min(MAX_RANGE, max_buffer)
+    )
+    pending = deque()
+    buffered = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            for item in ranges:
+                size = item[1] - item[0]
+                while pending and (
+                    len(pending) >= concurrency * 2 or
+                    buffered + size > max_buffer
+                ):
+                    done, future = pending.popleft()
+                    buffered -= done[1] - done[0]
+                    write(done, future.result())
+                pending.append((item, executor.submit(
+                    read_range, reader, item[0], item[1]
+                )))
+                buffered += size
+                if deadline is not None and time.time() > deadline:
+                    raise TimeoutError(
+                        f"Remux stopped at sample {item[3]} of {last}"
+                    )
+            while pending:
+                done, future = pending.popleft()
+                write(done, future.result())
+        finally:
+            for _, future in pending:
+                future.cancel()
+    return stats
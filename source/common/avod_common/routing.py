@@ -0,0 +1,126 @@
+"""MediaConvert queue, priority and acceleration of each job
+
+The rules of MCROUTING are tried in order and the first one matching the
+job routes it. A rule matches on any of:
+
+    stage: hls or audio, or a list of them
+    sla: the SLA of the asset, metadata.sla or else metadata.priority
+    min_duration, max_duration: seconds of media the job processes
+    min_size, max_size: bytes of the source
+
+and routes with any of:
+
+    queue: queue name or ARN, like an on-demand queue for the short jobs
+        or a reserved queue for the long ones, Default when not given
+    priority: -50 to 50, the jobs of a queue start by priority
+    acceleration: DISABLED, ENABLED or PREFERRED accelerated transcoding
+
+like [{"name": "short", "max_duration": 120, "queue": "Short"}]. Without
+MCROUTING every job goes to the Default queue and the default rules only
+set the priority, so the audio extracts and the short or urgent sources
+don't wait behind the long encodes. The queue of a job is also its
+admission lane, see avod_common.admission.
+"""
+import os
+import json
+from avod_common import polling
+
+
+# Routing rules, the default_rules when empty
+rules_config = json.loads(os.environ.get("MCROUTING") or "[]")
+default_queue = "Default"
+
+default_rules = [
+    {"name": "urgent", "sla": ["urgent", "news"], "priority": 40},
+    {"name": "audio", "stage": "audio", "priority": 25},
+    {"name": "short", "max_duration": 300, "priority": 10},
+    {"name": "long", "min_duration": 3600, "priority": -10}
+]
+rules = rules_config or default_rules
+
+
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def matches(rule, stage, sla, duration, size):
+    """Whether the conditions of a rule all hold, an unknown duration or
+    size never matches their bounds"""
+
+    if "stage" in rule and stage not in as_list(rule["stage"]):
+        return False
+    if "sla" in rule and sla not in as_list(rule["sla"]):
+        return False
+    for value, low, high in (
+        (duration, "min_duration", "max_duration"),
+        (size, "min_size", "max_size")
+    ):
+        if low not in rule and high not in rule:
+            continue
+        if value is None:
+            return False
+        if value < rule.get(low, value) or value > rule.get(high, value):
+            return False
+    return True
+
+
+def queue_name(queue):
+    """Queue name of a queue name or ARN"""
+
+    return queue.rsplit("/", 1)[-1]
+
+
+def queues():
+    """Names of the queues the rules route to"""
+
+    return sorted(
+        {queue_name(x.get("queue", default_queue)) for x in rules} |
+        {default_queue}
+    )
+
+
+def route(stage, metadata):
+    """Route a MediaConvert job
+
+    Parameters
+    ----------
+    stage: str, required
+        hls or audio
+
+    metadata: dict, required
+        Step Functions payload metadata, with media_info, size, sla or
+        priority and the chunk of an audio extract
+
+
+    Returns
+    ------
+    Rule name, queue, priority and acceleration: dict
+
+    """
+
+    sla = metadata.get("sla", metadata.get("priority"))
+    duration = polling.source_duration(metadata)
+    size = metadata.get("size")
+    rule = next(
+        (x for x in rules if matches(x, stage, sla, duration, size)), {}
+    )
+    return {
+        "rule": rule.get("name", "default"),
+        "queue": rule.get("queue", default_queue),
+        "priority": max(-50, min(50, int(rule.get("priority", 0)))),
+        "acceleration": rule.get("acceleration", "DISABLED"),
+        "sla": sla,
+        "duration": duration
+    }
+
+
+def job_settings(route):
+    """create_job arguments of a route"""
+
+    settings = {
+        "Queue": route["queue"],
+        "Priority": route["priority"]
+    }
+    if route["acceleration"] != "DISABLED":
+        settings["AccelerationSettings"] = {"Mode": route["acceleration"]}
+    return settings
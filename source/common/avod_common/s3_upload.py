@@ -0,0 +1,125 @@
+"""File like writer that streams to a S3 object with a multipart upload"""
+
+PART_SIZE = 8 * 1024 * 1024
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class MultipartUploadWriter:
+    """Stream writes to S3 without a local file
+
+    Writes are buffered in a list of chunks and sent as a part each time
+    the buffer reaches part_size. Documents smaller than one part are
+    sent with a single put_object. If the block managed by the context
+    manager raises, the multipart upload is aborted.
+
+    Parameters
+    ----------
+    s3: object, required
+        boto3 S3 client
+
+    bucket: str, required
+        Destination bucket
+
+    key: str, required
+        Destination key
+
+    part_size: int, optional
+        Size of each uploaded part, at least 5 MB
+
+    content_type: str, optional
+        Content-Type of the object
+
+    """
+
+    def __init__(
+        self, s3, bucket, key, part_size=PART_SIZE, content_type=None
+    ):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE}")
+
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.extra = {"ContentType": content_type} if content_type else {}
+        self.chunks = []
+        self.size = 0
+        self.upload_id = None
+        self.parts = []
+        self.bytes_written = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.chunks.append(data)
+        self.size += len(data)
+        self.bytes_written += len(data)
+        if self.size >= self.part_size:
+            self.upload_part()
+        return len(data)
+
+    def upload_part(self):
+        body = b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+
+        if self.upload_id is None:
+            response = self.s3.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, **self.extra
+            )
+            self.upload_id = response["UploadId"]
+
+        number = len(self.parts) + 1
+        response = self.s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=number,
+            Body=body
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": number})
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        if self.upload_id is None:
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=b"".join(self.chunks),
+                **self.extra
+            )
+            self.chunks = []
+            return
+
+        if self.size:
+            self.upload_part()
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts}
+        )
+
+    def abort(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.chunks = []
+
+        if self.upload_id is not None:
+            self.s3.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+            )
@@ -0,0 +1,132 @@
+"""Subtitle writers for SRT, WebVTT and TTML
+
+All writers share the interface of captions.CaptionWriter, a caption dict
+(start, end, caption) is passed to write() and close() finishes the
+document, so a single pass over the captions can feed all of them.
+"""
+from xml.sax.saxutils import escape, quoteattr
+
+from avod_common.captions import to_millis
+
+
+def format_timestamp(millis, separator="."):
+    """Format integer milliseconds as HH:MM:SS.mmm"""
+
+    seconds, millis = divmod(millis, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%02d:%02d:%02d%s%03d" % (
+        hours, minutes, seconds, separator, millis
+    )
+
+
+class SubtitleWriter:
+    """Base writer, subclasses implement header, cue and footer
+
+    Parameters
+    ----------
+    f: object, required
+        Text file object with a write method
+
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.index = 0
+        self.header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def header(self):
+        pass
+
+    def cue(self, index, start, end, text):
+        raise NotImplementedError
+
+    def footer(self):
+        pass
+
+    def write(self, caption):
+        self.index += 1
+        self.cue(
+            self.index,
+            to_millis(caption["start"]),
+            to_millis(caption["end"]),
+            caption["caption"]
+        )
+
+    def close(self):
+        self.footer()
+
+
+class SRTWriter(SubtitleWriter):
+
+    def cue(self, index, start, end, text):
+        self.f.write(
+            f"{index}\n"
+            f"{format_timestamp(start, ',')} --> "
+            f"{format_timestamp(end, ',')}\n"
+            f"{text}\n\n"
+        )
+
+
+def escape_cue(text):
+    """Escape the WebVTT cue text, where & and < start an escape or a tag
+    and --> is not allowed"""
+
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(
+        "-->", "--&gt;"
+    )
+
+
+class WebVTTWriter(SubtitleWriter):
+
+    def header(self):
+        self.f.write("WEBVTT\n\n")
+
+    def cue(self, index, start, end, text):
+        self.f.write(
+            f"{index}\n"
+            f"{format_timestamp(start)} --> {format_timestamp(end)}\n"
+            f"{escape_cue(text)}\n\n"
+        )
+
+
+class TTMLWriter(SubtitleWriter):
+    """TTML writer
+
+    Parameters
+    ----------
+    f: object, required
+        Text file object with a write method
+
+    language: str, optional
+        Language of the captions, written as xml:lang
+
+    """
+
+    def __init__(self, f, language="pt-BR"):
+        self.language = language
+        super().__init__(f)
+
+    def header(self):
+        self.f.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<tt xmlns="http://www.w3.org/ns/ttml" '
+            f'xml:lang={quoteattr(self.language)}>\n'
+            "<body>\n<div>\n"
+        )
+
+    def cue(self, index, start, end, text):
+        self.f.write(
+            f'<p xml:id="c{index}" begin="{format_timestamp(start)}" '
+            f'end="{format_timestamp(end)}">{escape(text)}</p>\n'
+        )
+
+    def footer(self):
+        self.f.write("</div>\n</body>\n</tt>\n")
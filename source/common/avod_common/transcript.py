@@ -0,0 +1,232 @@
+"""Streaming reader of the Transcribe Transcript.json
+
+The items are read one at a time from the S3 body, so the memory used
+does not depend on the length of the transcript. Used by the captions
+and by the stitching of the chunked transcriptions.
+"""
+import codecs
+import json
+
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = " \t\n\r"
+# Characters a JSON number starts with and is made of
+NUMBER_START = "-0123456789"
+NUMBER_CHARS = "+-.0123456789eE"
+
+decoder = json.JSONDecoder()
+
+
+class TranscriptReader:
+    """Incremental reader over a Transcribe Transcript.json stream
+
+    Only the text between the current position and the end of the last
+    chunk read is kept in memory, so the memory used does not depend on
+    the size of the transcript.
+
+    Parameters
+    ----------
+    stream: object, required
+        Any object with a read(size) method returning bytes, like the
+        StreamingBody returned by s3.get_object
+
+    chunk_size: int, optional
+        Amount of bytes requested from the stream on each read
+
+    """
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read one more chunk from the stream, returns False on EOF"""
+
+        if self.eof:
+            return False
+
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            self.buffer = (
+                self.buffer[self.pos:] + self.decoder.decode(b"", final=True)
+            )
+            self.pos = 0
+            return False
+
+        self.buffer = self.buffer[self.pos:] + self.decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non whitespace character without consuming it"""
+
+        while True:
+            while (
+                self.pos < len(self.buffer) and
+                self.buffer[self.pos] in WHITESPACE
+            ):
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of transcript")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(
+                f"Expected '{char}' at transcript offset {self.pos}"
+            )
+        self.pos += 1
+
+    def decode(self):
+        """Decode the next JSON value, it must fit in memory"""
+
+        if self.peek() in NUMBER_START:
+            self.buffer_number()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            self.pos = end
+            return value
+
+    def buffer_number(self):
+        """Read until the number at the current position is followed by
+        a delimiter, as its start, like 2 of 2.5, is a number too"""
+
+        while True:
+            end = self.pos
+            while (
+                end < len(self.buffer) and self.buffer[end] in NUMBER_CHARS
+            ):
+                end += 1
+            if end < len(self.buffer) or not self.fill():
+                return
+
+    def skip(self):
+        """Consume the next JSON value without building it"""
+
+        depth = 0
+        in_string = False
+        escaped = False
+        started = False
+
+        self.peek()
+        while True:
+            buffer = self.buffer
+            while self.pos < len(buffer):
+                char = buffer[self.pos]
+                if in_string:
+                    if escaped:
+                        escaped = False
+                    elif char == "\\":
+                        escaped = True
+                    elif char == '"':
+                        in_string = False
+                        if depth == 0:
+                            self.pos += 1
+                            return
+                elif char == '"':
+                    in_string = True
+                elif char in "{[":
+                    depth += 1
+                elif char in "}]":
+                    if depth == 0:
+                        return
+                    depth -= 1
+                    if depth == 0:
+                        self.pos += 1
+                        return
+                elif char == ",":
+                    if depth == 0:
+                        return
+                elif char in WHITESPACE:
+                    if depth == 0 and started:
+                        return
+                started = True
+                self.pos += 1
+            if not self.fill():
+                return
+
+    def members(self):
+        """Yield the keys of the object at the current position
+
+        The caller must consume (decode or skip) the value of each key
+        before asking for the next one.
+
+        """
+
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.decode()
+            self.expect(":")
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError(
+                    f"Expected ',' or '}}' at transcript offset {self.pos}"
+                )
+
+    def elements(self):
+        """Yield each element of the array at the current position"""
+
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(
+                    f"Expected ',' or ']' at transcript offset {self.pos}"
+                )
+
+
+def iter_items(stream, chunk_size=CHUNK_SIZE):
+    """Yield results.items from a Transcript.json stream one at a time
+
+    Parameters
+    ----------
+    stream: object, required
+        Transcript.json body, any object with a read(size) method
+
+    chunk_size: int, optional
+        Amount of bytes read from the stream at a time
+
+
+    Returns
+    ------
+    Transcribe items: generator of dict
+
+    """
+
+    reader = TranscriptReader(stream, chunk_size)
+
+    for key in reader.members():
+        if key != "results":
+            reader.skip()
+            continue
+        for results_key in reader.members():
+            if results_key != "items":
+                reader.skip()
+                continue
+            for item in reader.elements():
+                yield item
@@ -0,0 +1,119 @@
+"""Segmented WebVTT for HLS subtitles renditions
+
+The captions are split in WebVTT segments aligned to the video segments,
+so the subtitles media playlist has the same timeline of the video
+playlists. Each segment starts with a X-TIMESTAMP-MAP header that maps
+the WebVTT time 0 to the MPEG-TS timestamp of the start of the video,
+the cue timestamps are the media time of the captions. A caption that
+crosses a segment boundary is repeated in the next segment, like the
+HLS specification allows.
+"""
+import io
+
+from avod_common.captions import to_millis
+from avod_common.subtitles import WebVTTWriter
+
+
+# MPEG-TS timestamps use a 90 kHz clock
+MPEGTS_CLOCK = 90000
+# MPEG-TS timestamp of the start of the video in the TS segments
+MPEGTS_OFFSET = 10 * MPEGTS_CLOCK
+
+
+class SegmentWebVTTWriter(WebVTTWriter):
+    """WebVTT writer for a HLS segment, with the X-TIMESTAMP-MAP header
+
+    Parameters
+    ----------
+    f: object, required
+        Text file object with a write method
+
+    mpegts: int, optional
+        MPEG-TS timestamp of the WebVTT time 0
+
+    """
+
+    def __init__(self, f, mpegts=MPEGTS_OFFSET):
+        self.mpegts = mpegts
+        super().__init__(f)
+
+    def header(self):
+        self.f.write(
+            "WEBVTT\n"
+            f"X-TIMESTAMP-MAP=MPEGTS:{self.mpegts},LOCAL:00:00:00.000\n\n"
+        )
+
+
+def segment_captions(captions, durations):
+    """Group the captions by segment
+
+    Parameters
+    ----------
+    captions: iterable, required
+        Captions with start and end in seconds, sorted by start
+
+    durations: list, required
+        Duration in seconds of each segment
+
+
+    Returns
+    ------
+    Captions of each segment, one list for every duration: generator of
+    list
+
+    """
+
+    boundaries = []
+    end = 0
+    for duration in durations:
+        end += to_millis(duration)
+        boundaries.append(end)
+
+    current = []
+    index = 0
+    for caption in captions:
+        start = to_millis(caption["start"])
+        # Captions after the end of the video go to the last segment
+        while index < len(boundaries) - 1 and start >= boundaries[index]:
+            yield current
+            current = [
+                x for x in current if to_millis(x["end"]) > boundaries[index]
+            ]
+            index += 1
+        current.append(caption)
+
+    while index < len(boundaries):
+        yield current
+        current = [
+            x for x in current if to_millis(x["end"]) > boundaries[index]
+        ]
+        index += 1
+
+
+def segment_webvtt(captions, durations, mpegts=MPEGTS_OFFSET):
+    """Write the WebVTT segments of the captions
+
+    Parameters
+    ----------
+    captions: iterable, required
+        Captions with start, end and caption, sorted by start
+
+    durations: list, required
+        Duration in seconds of each video segment
+
+    mpegts: int, optional
+        MPEG-TS timestamp of the start of the video
+
+
+    Returns
+    ------
+    WebVTT documents, one for every duration: generator of str
+
+    """
+
+    for cues in segment_captions(captions, durations):
+        f = io.StringIO()
+        with SegmentWebVTTWriter(f, mpegts) as writer:
+            for caption in cues:
+                writer.write(caption)
+        yield f.getvalue()
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+from avod_common import admission, clients
+
+
+callback_table = os.environ.get("CALLBACKTABLE", "avod-callbacks")
+# Seconds the final status of a job is kept when its task token is not
+# registered yet, longer than a Lambda retry of the start functions
+marker_seconds = int(os.environ.get("CALLBACKMARKERSECONDS", "86400"))
+sf = clients.lazy("stepfunctions")
+dynamodb = clients.lazy("dynamodb")
+
+# Final states of each service: True when the job succeeded
+final_states = {
+    "aws.mediaconvert": {
+        "COMPLETE": True,
+        "ERROR": False,
+        "CANCELED": False
+    },
+    "aws.transcribe": {
+        "COMPLETED": True,
+        "FAILED": False
+    }
+}
+
+
+def mark(job_id, source, status):
+    """Store the final status of a job whose task token is not stored
+
+    Returns
+    ------
+    False when an item of the job was stored first: bool
+
+    """
+
+    try:
+        dynamodb.put_item(
+            TableName=callback_table,
+            Item={
+                "job_id": {"S": job_id},
+                "source": {"S": source},
+                "status": {"S": status},
+                "expires": {"N": str(int(time.time()) + marker_seconds)}
+            },
+            ConditionExpression="attribute_not_exists(job_id)"
+        )
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        return False
+    return True
+
+
+def lambda_handler(event, context):
+    """Complete Job Lambda function
+
+    Resume the Step Functions execution waiting for a MediaConvert or
+    Transcribe job. The state machine stores the task token of the
+    "Wait For" states in CALLBACKTABLE under the job id, this function
+    sends it back when the job state change event arrives, and frees the
+    admission slot of the job stored with it.
+
+    A short job can end before its task token is stored. The final
+    status is then stored under the job id instead, with an expires TTL,
+    and the "Wait For" state, which only stores its token when there is
+    no item for the job, goes straight to the status of the job.
+
+    Parameters
+    ----------
+    event: dict, required
+        MediaConvert Job State Change or Transcribe Job State Change event
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+
+    Returns
+    ------
+    Job id and callback status: dict
+
+    """
+
+    source = event["source"]
+    detail = event["detail"]
+    if source == "aws.mediaconvert":
+        job_id = detail["jobId"]
+        status = detail["status"]
+        message = detail.get("errorMessage", "")
+    else:
+        job_id = detail["TranscriptionJobName"]
+        status = detail["TranscriptionJobStatus"]
+        message = detail.get("FailureReason", "")
+
+    payload = {
+        "job_id": job_id,
+        "status": status
+    }
+
+    if status not in final_states.get(source, {}):
+        payload["callback"] = "IGNORED"
+        return payload
+
+    response = dynamodb.get_item(
+        TableName=callback_table,
+        Key={"job_id": {"S": job_id}},
+        ConsistentRead=True
+    )
+    if "Item" not in response:
+        if mark(job_id, source, status):
+            # The state machine reads the status when it registers
+            payload["callback"] = "MARKED"
+            return payload
+        # The token was stored since it was read
+        response = dynamodb.get_item(
+            TableName=callback_table,
+            Key={"job_id": {"S": job_id}},
+            ConsistentRead=True
+        )
+    if "task_token" not in response.get("Item", {}):
+        # Already marked by an earlier event of the job
+        payload["callback"] = "NOT FOUND"
+        return payload
+
+    task_token = response["Item"]["task_token"]["S"]
+
+    try:
+        if final_states[source][status]:
+            sf.send_task_success(
+                taskToken=task_token,
+                output=json.dumps(payload)
+            )
+            payload["callback"] = "SUCCESS"
+        else:
+            sf.send_task_failure(
+                taskToken=task_token,
+                error=f"{source.split('.')[1]}.{status}",
+                cause=message or f"Job {job_id} {status}"
+            )
+            payload["callback"] = "FAILURE"
+    except (
+        sf.exceptions.TaskTimedOut,
+        sf.exceptions.TaskDoesNotExist,
+        sf.exceptions.InvalidToken
+    ):
+        # The execution already moved on, e.g. it fell back to polling
+        payload["callback"] = "EXPIRED"
+
+    dynamodb.delete_item(
+        TableName=callback_table,
+        Key={"job_id": {"S": job_id}}
+    )
+    if "ticket" in response["Item"]:
+        # Free the slot of the job for the next one waiting
+        admission.release_job({"admission": {
+            "lane": response["Item"]["lane"]["S"],
+            "ticket": response["Item"]["ticket"]["S"]
+        }})
+    print(payload)
+
+    return payload
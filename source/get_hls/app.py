@@ -1,9 +1,4 @@
-import os
-import boto3
-from datetime import datetime
-
-
-region = os.environ.get("REGION", "us-east-1")
+from avod_common import admission, ledger, mediaconvert, payloads, polling
 
 
 def lambda_handler(event, context):
@@ -31,10 +26,8 @@ def lambda_handler(event, context):
         ):
             job_id = event["Outputs"]["HLS"]["job_id"]
             mediaconvert_endpoint = event["metadata"]["mediaconvert_endpoint"]
-            mediaconvert = boto3.client(
-                "mediaconvert",
-                region_name=region,
-                endpoint_url=mediaconvert_endpoint
+            customer_mediaconvert = mediaconvert.get_client(
+                mediaconvert_endpoint
             )
     except KeyError as e:
         raise {
@@ -44,25 +37,49 @@ def lambda_handler(event, context):
     payload = event
 
     try:
-        response = mediaconvert.get_job(Id=job_id)
+        response = customer_mediaconvert.get_job(Id=job_id)
     except KeyError as e:
         raise {
             "message": f"Error - {e}"
         }
     else:
+        if response["Job"]["Status"] in ("COMPLETE", "ERROR", "CANCELED"):
+            # Free the slot of the job for the next one waiting
+            admission.release_job(payload["metadata"])
+
+        if response["Job"]["Status"] != payload["Outputs"]["HLS"].get(
+            "job_status"
+        ):
+            # Only the status changes are added to the ledger
+            payload["Outputs"]["HLS"]["job_status"] = response["Job"][
+                "Status"]
+            output_bytes = None
+            if response["Job"]["Status"] == "COMPLETE":
+                output_bytes = ledger.prefix_bytes(
+                    payload["Outputs"]["HLS"]["bucket"],
+                    payload["Outputs"]["HLS"]["key"].rsplit("/", 1)[0] + "/"
+                )
+            ledger.record_mediaconvert(
+                payload["metadata"], "hls", response["Job"],
+                output_bytes=output_bytes
+            )
+
         if (
+            response["Job"]["Status"] == 'SUBMITTED' or
             response["Job"]["Status"] == 'IN_PROGRESS' or
             response["Job"]["Status"] == 'PROGRESSING'
         ):
+            polls = payload["Outputs"]["HLS"].get("polls", 0) + 1
+            payload["Outputs"]["HLS"]["polls"] = polls
             payload["metadata"]["status"] = "IN PROGRESS"
-            payload["metadata"]["last_update"] = (
-                datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
+            payload["metadata"]["next_poll_seconds"] = (
+                polling.mediaconvert_poll_seconds(
+                    "hls", response["Job"], payload["metadata"], polls
+                )
             )
+            payloads.touch(payload)
         elif response["Job"]["Status"] == 'COMPLETE':
-            payload["metadata"]["status"] = "COMPLETED"
-            payload["metadata"]["last_update"] = (
-                datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
-            )
+            payloads.touch(payload, "COMPLETED")
         else:
             raise {
                 "message": (
@@ -1,13 +1,14 @@
 import os
-import boto3
 import urllib.request
-from datetime import datetime
+from functools import partial
+from avod_common import admission, chunks, clients, ledger, payloads, polling
+from avod_common.s3_upload import MultipartUploadWriter
 
 
 language_code = os.environ.get("LANG", "pt-BR")
-region = os.environ.get("REGION", "us-east-1")
-transcribe = boto3.client("transcribe", region_name=region)
-s3 = boto3.client("s3", region_name=region)
+transcribe = clients.lazy("transcribe")
+s3 = clients.lazy("s3")
+relay_chunk_size = 1024 * 1024
 
 
 def lambda_handler(event, context):
@@ -33,13 +34,20 @@ def lambda_handler(event, context):
             bucket = event["Outputs"]["Audio"]["bucket"]
             file_name = event["metadata"]["file_name"]
             _id = event["metadata"]["uuid"]
-            job_id = f"{file_name}-{_id}"
+            suffix = chunks.chunk_suffix(event["metadata"])
+            job_id = f"{file_name}-{_id}{suffix}"
     except KeyError as e:
         raise {
             "message": f"Error - {e}"
         }
 
     payload = event
+    previous = payload["Outputs"].get("Transcribe", {})
+    polls = previous.get("polls", 0) + 1
+    # Set by start_transcribe when Transcribe writes to our bucket
+    transcript = {
+        x: previous[x] for x in ("bucket", "key") if x in previous
+    }
     payload["Outputs"]["Transcribe"] = {}
 
     try:
@@ -53,21 +61,38 @@ def lambda_handler(event, context):
         }
     else:
         if response["TranscriptionJob"][
-                    "TranscriptionJobStatus"] == "IN_PROGRESS":
+                    "TranscriptionJobStatus"] in ("COMPLETED", "FAILED"):
+            # Free the slot of the job for the next one waiting
+            admission.release_job(payload["metadata"])
+
+        if response["TranscriptionJob"]["TranscriptionJobStatus"] not in (
+            "COMPLETED", previous.get("job_status")
+        ):
+            # Only the status changes are added to the ledger
+            ledger.record_transcribe(
+                payload["metadata"], response["TranscriptionJob"]
+            )
+
+        if response["TranscriptionJob"][
+                    "TranscriptionJobStatus"] in ("QUEUED", "IN_PROGRESS"):
             payload["metadata"]["status"] = "IN PROGRESS"
-            payload["metadata"]["last_update"] = (
-                datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
+            payload["metadata"]["next_poll_seconds"] = (
+                polling.transcribe_poll_seconds(
+                    response["TranscriptionJob"], payload["metadata"], polls
+                )
             )
+            payloads.touch(payload)
             payload["Outputs"]["Transcribe"] = {
-                "job_id": job_id
+                "job_id": job_id,
+                "job_status": response["TranscriptionJob"][
+                    "TranscriptionJobStatus"],
+                "polls": polls,
+                **transcript
             }
             return payload
         elif response["TranscriptionJob"][
                       "TranscriptionJobStatus"] == "FAILED":
-            payload["metadata"]["status"] = "FAILED"
-            payload["metadata"]["last_update"] = (
-                datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
-            )
+            payloads.touch(payload, "FAILED")
             payload["Outputs"]["Transcribe"] = {
                 "job_id": job_id,
                 "message": response["TranscriptionJob"]["FailureReason"]
@@ -75,35 +100,38 @@ def lambda_handler(event, context):
             raise payload
         elif response["TranscriptionJob"][
                       "TranscriptionJobStatus"] == "COMPLETED":
-            transcribe_uri = response["TranscriptionJob"][
-                                      "Transcript"]["TranscriptFileUri"]
-            # http = urllib3.PoolManager()
-            # transcription = http.request('GET', transcribe_uri)
-            temp_file = "/tmp/Transcript.json"
-            os.mknod(temp_file)
-            urllib.request.urlretrieve(transcribe_uri, temp_file)
-
-            # with open(temp_file, "wb") as f:
-            #    f.write(r.content)
+            if not transcript:
+                # Stream the transcript from the Transcribe bucket to ours
+                transcribe_uri = response["TranscriptionJob"][
+                                          "Transcript"]["TranscriptFileUri"]
+                transcript = {
+                    "bucket": bucket,
+                    "key": f"outputs/{_id}/Transcript{suffix}.json"
+                }
+                with urllib.request.urlopen(transcribe_uri) as source, \
+                        MultipartUploadWriter(
+                            s3, transcript["bucket"], transcript["key"],
+                            content_type="application/json"
+                        ) as f:
+                    for chunk in iter(
+                        partial(source.read, relay_chunk_size), b""
+                    ):
+                        f.write(chunk)
 
-            destination_key = f"outputs/{_id}/Transcript.json"
-            s3.upload_file(temp_file, bucket, destination_key)
-
-            payload["metadata"]["status"] = "COMPLETE"
-            payload["metadata"]["last_update"] = (
-                datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
+            ledger.record_transcribe(
+                payload["metadata"], response["TranscriptionJob"],
+                output_bytes=ledger.object_bytes(
+                    transcript["bucket"], transcript["key"]
+                )
             )
+            payloads.touch(payload, "COMPLETE")
             payload["Outputs"]["Transcribe"] = {
                 "job_id": job_id,
-                "bucket": bucket,
-                "key": f"{destination_key}"
+                **transcript
             }
             return payload
         else:
-            payload["metadata"]["status"] = "FAILED"
-            payload["metadata"]["last_update"] = (
-                datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
-            )
+            payloads.touch(payload, "FAILED")
             payload["Outputs"]["Transcribe"] = {
                 "job_id": job_id,
                 "message": f"Unhandled error for this job: {job_id}"
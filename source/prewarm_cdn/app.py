@@ -0,0 +1,99 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+from avod_common import clients, hls_index, ledger, prewarm
+
+
+# Edge URL of the bucket root, like https://d1234.cloudfront.net, empty
+# to skip the prewarm
+cdn_base_url = os.environ.get("CDNBASEURL", "")
+# First segments of each rendition fetched
+prewarm_segments = int(
+    os.environ.get("PREWARMSEGMENTS", str(prewarm.SEGMENTS))
+)
+# Requests to the edge in flight
+prewarm_concurrency = int(
+    os.environ.get("PREWARMCONCURRENCY", str(prewarm.CONCURRENCY))
+)
+# Seconds to connect and between two reads of a response
+prewarm_timeout = float(
+    os.environ.get("PREWARMTIMEOUT", str(prewarm.TIMEOUT))
+)
+# Seconds before the Lambda timeout the requests not started are skipped
+deadline_margin = 5
+
+s3 = clients.lazy("s3")
+
+
+def lambda_handler(event, context):
+    """Prewarm the CDN with the HLS output Lambda function
+
+    The master playlist, the media playlists and the first
+    PREWARMSEGMENTS segments of each rendition of the HLS index are
+    fetched through the CDNBASEURL edge, so the first viewers don't wait
+    on the origin, see avod_common.prewarm. The prewarm never fails the
+    workflow, the requests that fail are counted as errors.
+
+    Parameters
+    ----------
+    event: dict, required
+        StepFunctions Helper Subtitles event
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+
+    Returns
+    ------
+    Hit, miss and error counts and timings of the requests, or why the
+    prewarm was skipped: dict
+
+    """
+
+    index_key = None
+    try:
+        if ("HLS" in event["Outputs"]):
+            bucket = event["Outputs"]["HLS"]["bucket"]
+            master_key = event["Outputs"]["HLS"]["key"]
+            index_key = event["Outputs"]["HLS"].get("index")
+    except KeyError as e:
+        raise {
+            "message": f"Error - {e}"
+        }
+
+    if not cdn_base_url:
+        return {"skipped": "CDNBASEURL is not set"}
+    if not index_key:
+        return {"skipped": "the HLS output has no index"}
+
+    index = json.loads(hls_index.read_text(bucket, index_key))
+    targets = prewarm.targets(
+        cdn_base_url, master_key, index, prewarm_segments
+    )
+    deadline = None
+    if context is not None:
+        deadline = (
+            time.time() + context.get_remaining_time_in_millis() / 1000 -
+            deadline_margin
+        )
+
+    started = datetime.now(timezone.utc)
+    stats = prewarm.prewarm(
+        targets,
+        concurrency=prewarm_concurrency,
+        timeout=prewarm_timeout,
+        deadline=deadline
+    )
+    print(f"Prewarm {cdn_base_url}/{master_key}: {stats}")
+    ledger.record(
+        event["metadata"], "prewarm", "COMPLETE",
+        started=started,
+        finished=datetime.now(timezone.utc),
+        output_bytes=stats["bytes"],
+        **{
+            name: value for name, value in stats.items()
+            if name != "bytes"
+        }
+    )
+    return stats
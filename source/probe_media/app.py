@@ -0,0 +1,64 @@
+from avod_common import clients, ledger, payloads, probe
+
+
+s3 = clients.lazy("s3")
+
+
+def lambda_handler(event, context):
+    """Probe the source video Lambda function
+
+    The MP4/MOV box tree is read with S3 ranged GETs, only the box headers
+    and the moov box, wherever it is in the file, are downloaded.
+
+    Parameters
+    ----------
+    event: dict, required
+        StepFunctions Input event
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+
+    Returns
+    ------
+    Source duration, resolution, framerate and tracks in
+    metadata.media_info: dict
+
+    """
+
+    try:
+        if (
+            "bucket" in event["metadata"] and
+            "key" in event["metadata"]
+        ):
+            bucket = event["metadata"]["bucket"]
+            key = event["metadata"]["key"]
+    except KeyError as e:
+        raise {
+            "message": f"Error - {e}"
+        }
+
+    payload = event
+    reader = probe.RangeReader(s3, bucket, key)
+
+    try:
+        payload["metadata"]["media_info"] = probe.probe(reader)
+    except ValueError as e:
+        # Not a MP4/MOV file, the stages use their defaults
+        payload["metadata"]["media_info"] = {
+            "error": f"{e}"
+        }
+    print(
+        f"Probe {bucket}/{key}: {reader.requests} requests, "
+        f"{reader.bytes_read} bytes"
+    )
+    ledger.record(
+        payload["metadata"], "probe", "COMPLETE",
+        input_bytes=reader.size,
+        bytes_read=reader.bytes_read,
+        requests=reader.requests,
+        error=payload["metadata"]["media_info"].get("error")
+    )
+
+    payloads.touch(payload)
+    return payload
@@ -0,0 +1,178 @@
+import os
+import re
+import json
+from botocore.exceptions import ClientError
+from avod_common import clients, hls_index, ledger, payloads
+
+
+sf_arn = os.environ.get(
+    "SFARN",
+    "arn:aws:states:us-east-1:123456789012:stateMachine:AVOD"
+)
+# Step Functions outputs of the files directly under outputs/<uuid>/
+artifacts = {
+    "Transcribe": r"Transcript\.json",
+    "WebCaptions": r"WebCaptions_[^/]+",
+    "SRT": r"Captions_[^/]+\.srt",
+    "WebVTT": r"Captions_[^/]+\.vtt",
+    "TTML": r"Captions_[^/]+\.ttml"
+}
+# Metadata of the previous execution that is not carried over
+transient = (
+    "admission", "chunk", "next_poll_seconds", "mediaconvert_endpoint"
+)
+
+s3 = clients.lazy("s3")
+sf = clients.lazy("stepfunctions")
+
+
+def list_outputs(bucket, _id):
+    """Keys under outputs/<uuid>/"""
+
+    prefix = f"outputs/{_id}/"
+    paginator = s3.get_paginator("list_objects_v2")
+    return {
+        item["Key"]
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+        for item in page.get("Contents", [])
+    }
+
+
+def hls_output(bucket, _id, file_name, keys):
+    """HLS output when its index was written, after its playlists and
+    segments were verified, None otherwise"""
+
+    master_key = f"outputs/{_id}/HLS/{file_name.split('.')[0]}.m3u8"
+    index_key = hls_index.index_key(master_key)
+    if master_key not in keys or index_key not in keys:
+        return None
+    return {"bucket": bucket, "key": master_key, "index": index_key}
+
+
+def find_outputs(bucket, _id, file_name):
+    """Outputs of the completed stages of a workflow
+
+    Parameters
+    ----------
+    bucket: str, required
+        Bucket of the source and the outputs
+
+    _id: str, required
+        Workflow uuid
+
+    file_name: str, required
+        Source file name
+
+
+    Returns
+    ------
+    Step Functions Outputs of the stages found: dict
+
+    """
+
+    keys = list_outputs(bucket, _id)
+    outputs = {}
+    for output, pattern in artifacts.items():
+        found = sorted(
+            x for x in keys
+            if re.fullmatch(f"outputs/{re.escape(_id)}/{pattern}", x)
+        )
+        if found:
+            outputs[output] = {"bucket": bucket, "key": found[0]}
+    hls_found = hls_output(bucket, _id, file_name, keys)
+    if hls_found is not None:
+        outputs["HLS"] = hls_found
+    return outputs
+
+
+def execution_name(file_name, _id, redrive):
+    """Step Functions execution name of a re-drive, up to 80 characters"""
+
+    suffix = f"-r{redrive}"
+    return (
+        f"{re.sub(r'[^0-9A-Za-z_.-]', '_', file_name)[:43 - len(suffix)]}"
+        f"-{_id}{suffix}"
+    )
+
+
+def lambda_handler(event, context):
+    """Re-drive Lambda function
+
+    Start a workflow again from the first stage that didn't complete.
+    The Outputs are rebuilt from the files under outputs/<uuid>/, and the
+    state machine skips the HLS encode when its verified index is there, and
+    the transcription when the captions or the transcript are. The
+    MediaConvert and Transcribe jobs still running are adopted by the
+    start functions instead of submitted again.
+
+    Parameters
+    ----------
+    event: dict, required
+        execution_arn of the execution to re-drive, or metadata with
+        uuid, bucket and key
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+
+    Returns
+    ------
+    Execution ARN, and the Outputs of the stages skipped: dict
+
+    """
+
+    try:
+        if "execution_arn" in event:
+            response = sf.describe_execution(
+                executionArn=event["execution_arn"]
+            )
+            metadata = json.loads(response["input"])["metadata"]
+        else:
+            metadata = dict(event["metadata"])
+        bucket = metadata["bucket"]
+        _id = metadata["uuid"]
+        file_name = metadata.setdefault(
+            "file_name", metadata["key"].split("/")[-1]
+        )
+    except (KeyError, ClientError) as e:
+        raise {
+            "message": f"Error - {e}"
+        }
+
+    for x in transient:
+        metadata.pop(x, None)
+    # The metadata of a re-drive by uuid doesn't know the previous ones
+    redrive = max(metadata.get("redrive", 0), ledger.redrive_count(metadata))
+    payload = {"metadata": metadata}
+    payloads.touch(payload, "OK")
+
+    outputs = find_outputs(bucket, _id, file_name)
+    if outputs:
+        payload["Outputs"] = outputs
+
+    while True:
+        redrive += 1
+        metadata["redrive"] = redrive
+        try:
+            response = sf.start_execution(
+                stateMachineArn=sf_arn,
+                name=execution_name(file_name, _id, redrive),
+                input=json.dumps(payload)
+            )
+            break
+        except sf.exceptions.ExecutionAlreadyExists:
+            # A re-drive missing from the ledger, take the next number
+            print(f"Re-drive {redrive} of {_id} already exists")
+    print(response)
+    ledger.record(
+        metadata, "workflow", "STARTED",
+        redrive=redrive,
+        skipped=sorted(outputs),
+        execution_arn=response["executionArn"]
+    )
+
+    return {
+        "executionArn": response["executionArn"],
+        "redrive": redrive,
+        "Outputs": outputs
+    }
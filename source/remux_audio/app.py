@@ -0,0 +1,131 @@
+import os
+import time
+from datetime import datetime, timezone
+from avod_common import (
+    chunks, clients, ledger, payloads, probe, remux, s3_upload
+)
+
+
+# Copy the AAC audio of the MP4/MOV sources, false to always extract the
+# audio with MediaConvert
+remux_enabled = os.environ.get("AUDIOREMUX", "true").lower() == "true"
+# Ranged GETs of the source in flight
+remux_concurrency = int(
+    os.environ.get("REMUXCONCURRENCY", str(remux.CONCURRENCY))
+)
+# Bytes between two audio ranges under which they are read with one GET
+remux_max_gap = int(os.environ.get("REMUXMAXGAP", str(remux.MAX_GAP)))
+# Bytes of the source buffered, up to a quarter of the function memory
+remux_max_buffer = min(
+    remux.MAX_BUFFER,
+    int(os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "128")) *
+    1024 * 1024 // 4
+)
+# Seconds before the Lambda timeout the copy gives up for MediaConvert
+deadline_margin = 10
+
+s3 = clients.lazy("s3")
+
+
+def lambda_handler(event, context):
+    """Remux the AAC audio of the source Lambda function
+
+    The samples of the AAC track, or of the chunk time range, are copied
+    to outputs/<uuid>/<file>_audio.mp4, the file the MediaConvert audio
+    extract writes, reading only their byte ranges of the source. When
+    the source can't be copied, not a MP4/MOV or its audio not AAC stereo
+    or mono, Outputs.Audio is left out and the state machine falls back
+    to the MediaConvert job.
+
+    Parameters
+    ----------
+    event: dict, required
+        StepFunctions Input event
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+
+    Returns
+    ------
+    Audio file bucket and key in Outputs.Audio, without Outputs.Audio
+    for the MediaConvert job: dict
+
+    """
+
+    try:
+        if ("bucket" in event["metadata"] and "key" in event["metadata"]):
+            bucket = event["metadata"]["bucket"]
+            key = event["metadata"]["key"]
+            _id = event["metadata"]["uuid"]
+            file_name = event["metadata"]["file_name"]
+    except KeyError as e:
+        raise {
+            "message": f"Error - {e}"
+        }
+
+    payload = event
+    payload["Outputs"] = {}
+    if not remux_enabled:
+        return payload
+
+    suffix = chunks.chunk_suffix(payload["metadata"])
+    chunk = payload["metadata"].get("chunk", {})
+    start, end = 0, None
+    if chunk.get("count", 1) > 1:
+        start, end = chunk["start"], chunk.get("end")
+    output_key = (
+        f"outputs/{_id}/{file_name.split('/')[-1].split('.')[0]}"
+        f"_audio{suffix}.mp4"
+    )
+    deadline = None
+    if context is not None:
+        deadline = (
+            time.time() + context.get_remaining_time_in_millis() / 1000 -
+            deadline_margin
+        )
+
+    reader = probe.RangeReader(s3, bucket, key)
+    started = datetime.now(timezone.utc)
+    try:
+        with s3_upload.MultipartUploadWriter(
+            s3, bucket, output_key, content_type="audio/mp4"
+        ) as f:
+            stats = remux.remux(
+                reader, f, start, end,
+                deadline=deadline,
+                max_gap=remux_max_gap,
+                concurrency=remux_concurrency,
+                max_buffer=remux_max_buffer
+            )
+    except (ValueError, TimeoutError) as e:
+        print(f"Remux {bucket}/{key}{suffix}: {e}, falling back to "
+              f"MediaConvert")
+        ledger.record(
+            payload["metadata"], "audio", "FALLBACK",
+            error=f"{e}",
+            bytes_read=reader.bytes_read
+        )
+        payloads.touch(payload)
+        return payload
+
+    print(f"Remux {bucket}/{key}{suffix}: {stats}")
+    ledger.record(
+        payload["metadata"], "audio", "COMPLETE",
+        method="remux",
+        started=started,
+        finished=datetime.now(timezone.utc),
+        input_bytes=reader.size,
+        output_bytes=f.bytes_written,
+        bytes_read=stats["bytes_read"],
+        requests=stats["requests"]
+    )
+    payload["Outputs"]["Audio"] = {
+        "bucket": bucket,
+        "key": output_key,
+        "job_status": "COMPLETE",
+        "method": "remux",
+        "seconds": stats["seconds"]
+    }
+    payloads.touch(payload, "COMPLETE")
+    return payload
@@ -0,0 +1,46 @@
+from avod_common import chunks, ledger, payloads, polling
+
+
+def lambda_handler(event, context):
+    """Split Transcription Lambda function
+
+    The source is split in time ranges transcribed concurrently by the
+    Step Functions Map state, see avod_common.chunks. Without a probed
+    duration, or with TRANSCRIBECHUNKSECONDS 0, there is a single chunk.
+
+    Parameters
+    ----------
+    event: dict, required
+        StepFunctions Input event
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+
+    Returns
+    ------
+    Input of each chunk in chunks: dict
+
+    """
+
+    try:
+        metadata = event["metadata"]
+    except KeyError as e:
+        raise {
+            "message": f"Error - {e}"
+        }
+
+    payload = event
+    payloads.touch(payload)
+    payload["chunks"] = [
+        {
+            "metadata": {
+                **metadata,
+                "chunk": chunk
+            }
+        }
+        for chunk in chunks.plan_chunks(polling.source_duration(metadata))
+    ]
+    ledger.record(metadata, "split", "COMPLETE", chunks=len(payload["chunks"]))
+
+    return payload
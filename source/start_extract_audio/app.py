@@ -1,14 +1,13 @@
 import os
-import boto3
-from datetime import datetime
+from avod_common import (
+    chunks, ledger, mediaconvert, payloads, polling, routing
+)
 
 
 mediaconvert_role = os.environ.get(
     "MCROLE",
     "arn:aws:iam::012345678901:role/DummyRole"
 )
-region = os.environ.get("REGION", "us-east-1")
-mediaconvert = boto3.client("mediaconvert", region_name=region)
 
 
 def lambda_handler(event, context):
@@ -41,34 +40,46 @@ def lambda_handler(event, context):
 
     payload = event
     payload["metadata"]["status"] = "IN PROGRESS"
+    payload["metadata"]["next_poll_seconds"] = polling.next_poll_seconds(
+        "audio", 0, duration=polling.source_duration(payload["metadata"])
+    )
     payload["Outputs"] = {}
 
     file_input = f"s3://{bucket}/{key}"
     destination = f"s3://{bucket}/outputs/{_id}/"
+    suffix = chunks.chunk_suffix(payload["metadata"])
+    chunk = payload["metadata"].get("chunk", {})
+    clipping = {}
+    if chunk.get("count", 1) > 1:
+        # Only the chunk time range, from the start of the file
+        clip = {"StartTimecode": chunks.timecode(chunk["start"])}
+        if "end" in chunk:
+            clip["EndTimecode"] = chunks.timecode(chunk["end"])
+        clipping = {"InputClippings": [clip]}
 
     try:
-        response = mediaconvert.describe_endpoints()
+        mediaconvert_endpoint = mediaconvert.get_endpoint()
     except KeyError as e:
         raise {
             "message": f"Error - {e}"
         }
     else:
-        mediaconvert_endpoint = response["Endpoints"][0]["Url"]
         payload["metadata"]["mediaconvert_endpoint"] = (
             mediaconvert_endpoint
         )
-        payload["metadata"]["last_update"] = (
-            datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
-        )
-        customer_mediaconvert = boto3.client(
-            "mediaconvert",
-            region_name=region,
-            endpoint_url=mediaconvert_endpoint
+        payloads.touch(payload)
+        customer_mediaconvert = mediaconvert.get_client(
+            mediaconvert_endpoint
         )
 
+    route = routing.route("audio", payload["metadata"])
+    print(f"Route audio: {route}")
+
     try:
-        response = customer_mediaconvert.create_job(
+        response = mediaconvert.submit_job(
+            customer_mediaconvert, payload["metadata"], "audio",
             Role=mediaconvert_role,
+            **routing.job_settings(route),
             Settings={
               "OutputGroups": [{
                 "Name": "File Group",
@@ -100,7 +111,7 @@ def lambda_handler(event, context):
                     "LanguageCodeControl": "FOLLOW_INPUT"
                   }],
                   "Extension": "mp4",
-                  "NameModifier": "_audio"
+                  "NameModifier": f"_audio{suffix}"
                 }],
                 "OutputGroupSettings": {
                   "Type": "FILE_GROUP_SETTINGS",
@@ -126,8 +137,9 @@ def lambda_handler(event, context):
                 "FilterStrength": 0,
                 "DeblockFilter": "DISABLED",
                 "DenoiseFilter": "DISABLED",
-                "TimecodeSource": "EMBEDDED",
-                "FileInput": file_input
+                "TimecodeSource": "ZEROBASED" if clipping else "EMBEDDED",
+                "FileInput": file_input,
+                **clipping
               }]
             }
         )
@@ -137,8 +149,15 @@ def lambda_handler(event, context):
         }
     else:
         job_id = response['Job']['Id']
+        ledger.record_mediaconvert(
+            payload["metadata"], "audio", response["Job"],
+            input_bytes=payload["metadata"].get("size"),
+            route=route
+        )
         payload["Outputs"]["Audio"] = {
-            "job_id": job_id
+            "job_id": job_id,
+            "job_status": response["Job"]["Status"],
+            "route": route
         }
 
     return payload
@@ -1,34 +1,12 @@
 import os
-import boto3
-import math
-import ast
-from datetime import datetime
+from avod_common import clients, ledger, payloads
+from avod_common.captions import read_captions
+from avod_common.s3_upload import MultipartUploadWriter
+from avod_common.subtitles import SRTWriter
 
 
 target_language_code = os.environ.get("TARGETLANGCODE", "pt-BR")
-region = os.environ.get("REGION", "us-east-1")
-s3 = boto3.client("s3", region_name=region)
-
-
-# Format an SRT timestamp in HH:MM:SS,mmm
-def format_SRT(time_seconds):
-
-    ONE_HOUR = 60 * 60
-    ONE_MINUTE = 60
-    hours = math.floor(time_seconds / ONE_HOUR)
-    remainder = time_seconds - (hours * ONE_HOUR)
-    minutes = math.floor(remainder / 60)
-    remainder = remainder - (minutes * ONE_MINUTE)
-    seconds = math.floor(remainder)
-    remainder = remainder - seconds
-    millis = remainder
-
-    return (
-        str(hours).zfill(2) + ":" +
-        str(minutes).zfill(2) + ":" +
-        str(seconds).zfill(2) + "," +
-        str(math.floor(millis * 1000)).zfill(3)
-    )
+s3 = clients.lazy("s3")
 
 
 def lambda_handler(event, context):
@@ -63,52 +41,36 @@ def lambda_handler(event, context):
 
     try:
         transcribe_file = s3.get_object(Bucket=bucket, Key=key)
-        captions = ast.literal_eval(
-            transcribe_file["Body"].read().decode("utf-8")
-        )
+        captions = read_captions(transcribe_file["Body"].iter_lines())
     except KeyError as e:
         raise {
             "message": f"Error - {e}"
         }
 
-    srt = ''
-    index = 1
-
-    for caption in captions:
-        srt += f"{str(index)}\n"
-        srt += (
-            format_SRT(float(caption['start'])) + " --> " +
-            format_SRT(float(caption['end'])) + "\n"
-        )
-        srt += caption["caption"] + '\n\n'
-        index += 1
-
     srt_name = f"Captions_{target_language_code}.srt"
     destination_key = f"outputs/{_id}/{srt_name}"
 
-    temp_file = f"/tmp/{srt_name}"
-    os.mknod(temp_file)
-
-    with open(temp_file, "w") as f:
-        print(srt, file=f)
-
     try:
-        s3.upload_file(temp_file, bucket, destination_key)
-
-        payload["metadata"]["status"] = "COMPLETED"
-        payload["metadata"]["last_update"] = (
-            datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
+        # Cues are streamed to S3 while the captions are read, with
+        # integer milliseconds timestamps and no local file.
+        with MultipartUploadWriter(
+            s3, bucket, destination_key, content_type="application/x-subrip"
+        ) as f, SRTWriter(f) as writer:
+            for caption in captions:
+                writer.write(caption)
+
+        ledger.record(
+            payload["metadata"], "srt", "COMPLETE",
+            output_bytes=f.bytes_written
         )
+        payloads.touch(payload, "COMPLETED")
         payload["Outputs"]["SRT"] = {
             "bucket": bucket,
             "key": f"{destination_key}"
         }
         return payload
     except KeyError as e:
-        payload["metadata"]["status"] = "FAILED"
-        payload["metadata"]["last_update"] = (
-            datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
-        )
+        payloads.touch(payload, "FAILED")
         payload["Outputs"]["SRT"] = {
             "message": f"{e}"
         }
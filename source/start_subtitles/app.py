@@ -0,0 +1,149 @@
+import os
+from avod_common import clients, hls, hls_index, ledger, payloads, webvtt
+from avod_common.captions import read_captions
+
+
+target_language_code = os.environ.get("TARGETLANGCODE", "pt-BR")
+# MPEG-TS timestamp of the start of the video in the HLS segments
+mpegts_offset = int(
+    os.environ.get("MPEGTSOFFSET", str(webvtt.MPEGTS_OFFSET))
+)
+s3 = clients.lazy("s3")
+
+
+def read_text(bucket, key):
+    response = s3.get_object(Bucket=bucket, Key=key)
+    return response["Body"].read().decode("utf-8")
+
+
+def write_text(bucket, key, text, content_type):
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=text.encode("utf-8"),
+        ContentType=content_type
+    )
+
+
+def lambda_handler(event, context):
+    """Start Subtitles job to add the captions to the HLS output
+
+    The Web Captions are added to the HLS encoded without captions as
+    a subtitles rendition: WebVTT segments aligned to the video segments,
+    a subtitles media playlist and an EXT-X-MEDIA entry in the master
+    playlist. Nothing is encoded, so the captions can be fixed or
+    re-timed by running this function again.
+
+    Parameters
+    ----------
+    event: dict, required
+        StepFunctions Input event
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+
+    Returns
+    ------
+    Subtitles playlist path: dict
+
+    """
+
+    try:
+        if ("HLS" in event["Outputs"]):
+            bucket = event["Outputs"]["HLS"]["bucket"]
+            master_key = event["Outputs"]["HLS"]["key"]
+            captions = event["Outputs"].get("WebCaptions")
+        else:
+            raise KeyError("No HLS output to add the subtitles to")
+    except KeyError as e:
+        raise {
+            "message": f"Error - {e}"
+        }
+
+    payload = event
+
+    if captions is None:
+        # No webcaptions in CAPTIONFORMATS
+        payloads.touch(payload, "COMPLETED")
+        ledger.record(payload["metadata"], "workflow", "COMPLETE")
+        return payload
+
+    folder, master_name = master_key.rsplit("/", 1)
+    base_name = master_name.rsplit(".", 1)[0]
+    playlist_name = f"{base_name}_subtitles_{target_language_code}.m3u8"
+
+    try:
+        master = read_text(bucket, master_key)
+        variants, _ = hls.parse_master(master)
+        segments = hls.parse_media(
+            read_text(bucket, f"{folder}/{variants[0]['uri']}")
+        )
+        caption_file = s3.get_object(
+            Bucket=captions["bucket"],
+            Key=captions["key"]
+        )
+        vtt_segments = webvtt.segment_webvtt(
+            read_captions(caption_file["Body"].iter_lines()),
+            [x["duration"] for x in segments],
+            mpegts_offset
+        )
+
+        playlist = []
+        vtt_bytes = []
+        for index, (segment, text) in enumerate(
+            zip(segments, vtt_segments), 1
+        ):
+            vtt_name = (
+                f"{base_name}_subtitles_{target_language_code}_{index:05d}.vtt"
+            )
+            write_text(bucket, f"{folder}/{vtt_name}", text, "text/vtt")
+            playlist.append({"uri": vtt_name, "duration": segment["duration"]})
+            vtt_bytes.append(len(text.encode("utf-8")))
+
+        media_playlist = hls.media_playlist(playlist)
+        write_text(
+            bucket,
+            f"{folder}/{playlist_name}",
+            media_playlist,
+            "application/vnd.apple.mpegurl"
+        )
+        write_text(
+            bucket,
+            master_key,
+            hls.add_subtitles(master, playlist_name, target_language_code),
+            "application/vnd.apple.mpegurl"
+        )
+        if "index" in payload["Outputs"]["HLS"]:
+            # The index of the verified output gets the rendition too
+            hls_index.add_media(
+                bucket, payload["Outputs"]["HLS"]["index"], {
+                    "type": "SUBTITLES",
+                    "group": "subs",
+                    "language": target_language_code,
+                    "name": target_language_code,
+                    **hls_index.media_entry(
+                        playlist_name, hls.parse_playlist(media_playlist),
+                        vtt_bytes
+                    )
+                },
+                "subtitles"
+            )
+
+        ledger.record(
+            payload["metadata"], "subtitles", "COMPLETE",
+            segments=len(playlist)
+        )
+        ledger.record(payload["metadata"], "workflow", "COMPLETE")
+        payloads.touch(payload, "COMPLETED")
+        payload["Outputs"]["Subtitles"] = {
+            "bucket": bucket,
+            "key": f"{folder}/{playlist_name}"
+        }
+        return payload
+    except KeyError as e:
+        payloads.touch(payload, "FAILED")
+        payload["Outputs"]["Subtitles"] = {
+            "message": f"{e}"
+        }
+        raise payload
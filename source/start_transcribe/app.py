@@ -1,6 +1,5 @@
 import os
-import boto3
-from datetime import datetime
+from avod_common import chunks, clients, ledger, payloads, polling
 
 
 transcribe_role = os.environ.get(
@@ -9,8 +8,51 @@ transcribe_role = os.environ.get(
 )
 language_code = os.environ.get("LANGCODE", "pt-BR")
 file_type = os.environ.get("MEDIATYPE", "mp4")
-region = os.environ.get("REGION", "us-east-1")
-transcribe = boto3.client("transcribe", region_name=region)
+# direct: Transcribe writes Transcript.json to outputs/<uuid>/
+# relay: get_transcribe copies it from the Transcribe bucket
+transcript_output = os.environ.get("TRANSCRIPTOUTPUT", "direct")
+transcribe = clients.lazy("transcribe")
+
+
+def start_job(job_id, file_input, output_location):
+    """Start the Transcribe job, or adopt the job of the same name started
+    by a previous run of the workflow
+
+    The job names are unique by workflow and chunk, so a retry or a
+    re-drive finds the job it started before. A failed job is deleted
+    and started again.
+
+    Returns
+    ------
+    start_transcription_job or get_transcription_job response: dict
+
+    """
+
+    def start():
+        return transcribe.start_transcription_job(
+            TranscriptionJobName=job_id,
+            LanguageCode=language_code,
+            Media={
+                "MediaFileUri": file_input
+            },
+            MediaFormat=file_type,
+            JobExecutionSettings={
+                "DataAccessRoleArn": transcribe_role
+            },
+            **output_location
+        )
+
+    try:
+        return start()
+    except transcribe.exceptions.ConflictException:
+        response = transcribe.get_transcription_job(
+            TranscriptionJobName=job_id
+        )
+    if response["TranscriptionJob"]["TranscriptionJobStatus"] != "FAILED":
+        print(f"Adopted transcribe job {job_id}")
+        return response
+    transcribe.delete_transcription_job(TranscriptionJobName=job_id)
+    return start()
 
 
 def lambda_handler(event, context):
@@ -37,7 +79,8 @@ def lambda_handler(event, context):
             key = event["Outputs"]["Audio"]["key"]
             file_name = event["metadata"]["file_name"]
             _id = event["metadata"]["uuid"]
-            job_id = f"{file_name}-{_id}"
+            suffix = chunks.chunk_suffix(event["metadata"])
+            job_id = f"{file_name}-{_id}{suffix}"
     except KeyError as e:
         raise {
             "message": f"Error - {e}"
@@ -48,40 +91,50 @@ def lambda_handler(event, context):
 
     file_input = f"s3://{bucket}/{key}"
 
+    transcript = {}
+    output_location = {}
+    if transcript_output == "direct":
+        transcript = {
+            "bucket": bucket,
+            "key": f"outputs/{_id}/Transcript{suffix}.json"
+        }
+        output_location = {
+            "OutputBucketName": transcript["bucket"],
+            "OutputKey": transcript["key"]
+        }
+
     try:
-        response = transcribe.start_transcription_job(
-            TranscriptionJobName=job_id,
-            LanguageCode=language_code,
-            Media={
-                "MediaFileUri": file_input
-            },
-            MediaFormat=file_type,
-            JobExecutionSettings={
-                "DataAccessRoleArn": transcribe_role
-            }
-        )
+        response = start_job(job_id, file_input, output_location)
         print(response)
     except KeyError as e:
         raise {
             "message": f"Error - {e}"
         }
     else:
+        ledger.record_transcribe(
+            payload["metadata"], response["TranscriptionJob"],
+            input_bytes=ledger.object_bytes(bucket, key)
+        )
         if response["TranscriptionJob"][
-                    "TranscriptionJobStatus"] == "IN_PROGRESS":
+                    "TranscriptionJobStatus"] in ("QUEUED", "IN_PROGRESS"):
             payload["metadata"]["status"] = "IN PROGRESS"
-            payload["metadata"]["last_update"] = (
-                datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
+            payload["metadata"]["next_poll_seconds"] = (
+                polling.next_poll_seconds(
+                    "transcribe", 0,
+                    duration=polling.source_duration(payload["metadata"])
+                )
             )
+            payloads.touch(payload)
             payload["Outputs"]["Transcribe"] = {
-                "job_id": job_id
+                "job_id": job_id,
+                "job_status": response["TranscriptionJob"][
+                    "TranscriptionJobStatus"],
+                **transcript
             }
             return payload
         elif response["TranscriptionJob"][
                       "TranscriptionJobStatus"] == "FAILED":
-            payload["metadata"]["status"] = "FAILED"
-            payload["metadata"]["last_update"] = (
-                datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
-            )
+            payloads.touch(payload, "FAILED")
             payload["Outputs"]["Transcribe"] = {
                 "job_id": job_id,
                 "message": response["TranscriptionJob"]["FailureReason"]
@@ -89,19 +142,15 @@ def lambda_handler(event, context):
             raise payload
         elif response["TranscriptionJob"][
                       "TranscriptionJobStatus"] == "COMPLETED":
-            payload["metadata"]["status"] = "COMPLETE"
-            payload["metadata"]["last_update"] = (
-                datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
-            )
+            payloads.touch(payload, "COMPLETE")
             payload["Outputs"]["Transcribe"] = {
-                "job_id": job_id
+                "job_id": job_id,
+                "job_status": "COMPLETED",
+                **transcript
             }
             return payload
         else:
-            payload["metadata"]["status"] = "FAILED"
-            payload["metadata"]["last_update"] = (
-                datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
-            )
+            payloads.touch(payload, "FAILED")
             payload["Outputs"]["Transcribe"] = {
                 "job_id": job_id,
                 "message": f"Unhandled error for this job: {job_id}"
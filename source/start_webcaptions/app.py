@@ -1,64 +1,75 @@
 import os
-import boto3
-import json
-from datetime import datetime
+from contextlib import ExitStack
+from functools import partial
+from avod_common import clients, ledger, payloads
+from avod_common.transcript import iter_items
+from avod_common.captions import CaptionWriter
+from avod_common.s3_upload import MultipartUploadWriter
+from avod_common.subtitles import SRTWriter, TTMLWriter, WebVTTWriter
 
 
 source_language_code = os.environ.get("SOURCELANGCODE", "pt-BR")
-region = os.environ.get("REGION", "us-east-1")
-s3 = boto3.client("s3", region_name=region)
-
-
-def lambda_handler(event, context):
-    """Start Web Captions job to generate captions from transcribe function
+target_language_code = os.environ.get("TARGETLANGCODE", source_language_code)
+caption_formats = os.environ.get("CAPTIONFORMATS", "webcaptions,srt,vtt,ttml")
+s3 = clients.lazy("s3")
+
+# Format name: (Outputs key, file name, content type, writer)
+caption_outputs = {
+    "webcaptions": (
+        "WebCaptions",
+        f"WebCaptions_{source_language_code}",
+        "application/x-ndjson",
+        CaptionWriter
+    ),
+    "srt": (
+        "SRT",
+        f"Captions_{target_language_code}.srt",
+        "application/x-subrip",
+        SRTWriter
+    ),
+    "vtt": (
+        "WebVTT",
+        f"Captions_{target_language_code}.vtt",
+        "text/vtt",
+        WebVTTWriter
+    ),
+    "ttml": (
+        "TTML",
+        f"Captions_{target_language_code}.ttml",
+        "application/ttml+xml",
+        partial(TTMLWriter, language=target_language_code)
+    )
+}
+formats = [x.strip() for x in caption_formats.split(",") if x.strip()]
+for x in formats:
+    if x not in caption_outputs:
+        raise ValueError(f"Unknown caption format: {x}")
+
+
+def segment_captions(items):
+    """Group Transcribe items into caption lines
 
     Parameters
     ----------
-    event: dict, required
-        StepFunctions Input event
-
-    context: object, required
-        Lambda Context runtime methods and attributes
+    items: iterable, required
+        Transcribe results.items
 
 
     Returns
     ------
-    Web Captions file path: dict
+    Captions with start, end, caption and wordConfidence: generator of dict
 
     """
 
-    try:
-        if ("Transcribe" in event["Outputs"]):
-            bucket = event["Outputs"]["Transcribe"]["bucket"]
-            key = event["Outputs"]["Transcribe"]["key"]
-            _id = event["metadata"]["uuid"]
-    except KeyError as e:
-        raise {
-            "message": f"Error - {e}"
-        }
-
-    payload = event
-
-    try:
-        transcribe_file = s3.get_object(Bucket=bucket, Key=key)
-        transcribe_metadata = json.loads(
-            transcribe_file["Body"].read().decode("utf-8")
-        )
-    except KeyError as e:
-        raise {
-            "message": f"Error - {e}"
-        }
-
     end_time = 0.0
     max_length = 50
     word_count = 0
     max_words = 12
     max_silence = 1.5
 
-    captions = []
     caption = None
 
-    for item in transcribe_metadata["results"]["items"]:
+    for item in items:
         is_punctuation = item["type"] == "punctuation"
 
         if caption is None:
@@ -83,7 +94,7 @@ def lambda_handler(event, context):
             if (len(caption["caption"]) > 0 and
                (end_time + max_silence) < start_time):
                 caption["end"] = start_time
-                captions.append(caption)
+                yield caption
 
                 caption = {
                     "start": float(start_time),
@@ -121,41 +132,94 @@ def lambda_handler(event, context):
         # If we have reached a good amount of text finalize the caption
         if (word_count >= max_words or len(caption["caption"]) >= max_length):
             caption["end"] = end_time
-            captions.append(caption)
+            yield caption
             word_count = 0
             caption = None
 
     # Close the last caption if required
     if caption is not None:
         caption["end"] = end_time
-        captions.append(caption)
+        yield caption
 
-    webcaptions_name = f"WebCaptions_{source_language_code}"
-    destination_key = f"outputs/{_id}/{webcaptions_name}"
 
-    temp_file = f"/tmp/{webcaptions_name}"
-    os.mknod(temp_file)
+def lambda_handler(event, context):
+    """Start Web Captions job to generate captions from transcribe function
 
-    with open(temp_file, "w") as f:
-        print(captions, file=f)
+    The transcript is read once and every caption is written to all the
+    formats in CAPTIONFORMATS (WebCaptions, SRT, WebVTT and TTML).
+
+    Parameters
+    ----------
+    event: dict, required
+        StepFunctions Input event
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+
+    Returns
+    ------
+    Captions files path: dict
+
+    """
+
+    try:
+        if ("Transcribe" in event["Outputs"]):
+            bucket = event["Outputs"]["Transcribe"]["bucket"]
+            key = event["Outputs"]["Transcribe"]["key"]
+            _id = event["metadata"]["uuid"]
+    except KeyError as e:
+        raise {
+            "message": f"Error - {e}"
+        }
+
+    payload = event
 
     try:
-        s3.upload_file(temp_file, bucket, destination_key)
+        transcribe_file = s3.get_object(Bucket=bucket, Key=key)
+    except KeyError as e:
+        raise {
+            "message": f"Error - {e}"
+        }
+
+    try:
+        # Items are parsed while they are read from S3 and every caption
+        # is streamed to the S3 uploads, so neither the transcript nor
+        # the captions are kept in memory or in /tmp.
+        with ExitStack() as stack:
+            uploads = []
+            writers = []
+            for x in formats:
+                output, file_name, content_type, writer = caption_outputs[x]
+                destination_key = f"outputs/{_id}/{file_name}"
+                f = stack.enter_context(
+                    MultipartUploadWriter(
+                        s3, bucket, destination_key,
+                        content_type=content_type
+                    )
+                )
+                uploads.append(f)
+                writers.append(stack.enter_context(writer(f)))
+                payload["Outputs"][output] = {
+                    "bucket": bucket,
+                    "key": f"{destination_key}"
+                }
 
-        payload["metadata"]["status"] = "COMPLETED"
-        payload["metadata"]["last_update"] = (
-            datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
+            for caption in segment_captions(
+                iter_items(transcribe_file["Body"])
+            ):
+                for writer in writers:
+                    writer.write(caption)
+
+        ledger.record(
+            payload["metadata"], "captions", "COMPLETE",
+            formats=formats,
+            output_bytes=sum(x.bytes_written for x in uploads)
         )
-        payload["Outputs"]["WebCaptions"] = {
-            "bucket": bucket,
-            "key": f"{destination_key}"
-        }
+        payloads.touch(payload, "COMPLETED")
         return payload
     except KeyError as e:
-        payload["metadata"]["status"] = "FAILED"
-        payload["metadata"]["last_update"] = (
-            datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
-        )
+        payloads.touch(payload, "FAILED")
         payload["Outputs"]["WebCaptions"] = {
             "message": f"{e}"
         }
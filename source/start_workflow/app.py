@@ -1,42 +1,187 @@
 import os
 import re
 import uuid
-import boto3
 import json
-from datetime import datetime
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
+from botocore.exceptions import ClientError
+from avod_common import chunks, clients, ladder, ledger, payloads
+from avod_common.fingerprint import fingerprint
 
-_id = str(uuid.uuid4())
 regex = "[^/]+$"
 
 sf_arn = os.environ.get(
     "SFARN",
     "arn:aws:states:us-east-1:123456789012:stateMachine:AVOD"
 )
-region = os.environ.get("REGION", "us-east-1")
-aws_environment = os.environ.get("AWSENV", "AWS")
+# Index of the outputs by content fingerprint, empty to disable it
+dedup_table = os.environ.get("DEDUPTABLE", "")
+# Settings the outputs depend on, hashed to the dedup profile: the HLS
+# ladder profile, the transcription and captions languages and formats
+ladder_profile = os.environ.get("LADDERPROFILE", "default")
+language_code = os.environ.get("LANGCODE", "pt-BR")
+source_language_code = os.environ.get("SOURCELANGCODE", "pt-BR")
+target_language_code = os.environ.get(
+    "TARGETLANGCODE", source_language_code
+)
+caption_formats = os.environ.get("CAPTIONFORMATS", "webcaptions,srt,vtt,ttml")
+# Samples hashed for the fingerprint, 0 to use the ETag
+dedup_samples = int(os.environ.get("DEDUPSAMPLES", "0"))
+# link: write outputs/<uuid>/duplicate.json, copy: copy the outputs
+dedup_mode = os.environ.get("DEDUPMODE", "link")
+# Objects of a batch started at the same time
+ingest_concurrency = int(os.environ.get("INGESTCONCURRENCY", "8"))
+# Admission priority by key prefix, like {"input/news/": "news"}
+priority_prefixes = json.loads(os.environ.get("PRIORITYPREFIXES") or "{}")
+default_priority = os.environ.get("DEFAULTPRIORITY", "standard")
+
+s3 = clients.lazy("s3")
+sf = clients.lazy("stepfunctions")
+dynamodb = clients.lazy("dynamodb")
+
+
+@functools.lru_cache(maxsize=None)
+def dedup_profile():
+    """Profile key of the settings the outputs depend on
+
+    The ladder profile name followed by a hash of the compiled ladder,
+    the languages, the caption formats and the transcription chunks, so
+    a change of any of them doesn't reuse the previous outputs.
+
+    Returns
+    ------
+    Profile key, like default-0123456789abcdef: str
+
+    """
+
+    settings = {
+        "ladder": ladder.profile_digest(ladder_profile),
+        "language": language_code,
+        "source_language": source_language_code,
+        "target_language": target_language_code,
+        "caption_formats": sorted(caption_formats.split(",")),
+        "chunk_seconds": chunks.chunk_seconds,
+        "chunk_overlap": chunks.chunk_overlap
+    }
+    sha = hashlib.sha256(json.dumps(settings, sort_keys=True).encode())
+    return f"{ladder_profile}-{sha.hexdigest()[:16]}"
 
-if aws_environment == "AWS_SAM_LOCAL":
-    sf = boto3.client(
-      "stepfunctions",
-      endpoint_url="http://stepfunctions:8083"
+
+def find_outputs(fingerprint_id, profile):
+    """Outputs of a previous workflow of the same content and profile
+
+    Returns
+    ------
+    Previous workflow uuid and Outputs, None when there is none or its
+    HLS was deleted: tuple
+
+    """
+
+    response = dynamodb.get_item(
+        TableName=dedup_table,
+        Key={
+            "fingerprint": {"S": fingerprint_id},
+            "profile": {"S": profile}
+        }
     )
-else:
-    sf = boto3.client(
-        "stepfunctions",
-        region_name=region
+    if "Item" not in response:
+        return None
+
+    previous = response["Item"]["uuid"]["S"]
+    outputs = json.loads(response["Item"]["outputs"]["S"])
+    hls = outputs.get("HLS", {})
+    try:
+        s3.head_object(Bucket=hls["bucket"], Key=hls["key"])
+    except (KeyError, ClientError):
+        return None
+    return previous, outputs
+
+
+def copy_outputs(bucket, previous, outputs, _id):
+    """Copy the outputs of a previous workflow to outputs/<uuid>/"""
+
+    source = f"outputs/{previous}/"
+    destination = f"outputs/{_id}/"
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=source):
+        for item in page.get("Contents", []):
+            s3.copy_object(
+                CopySource={"Bucket": bucket, "Key": item["Key"]},
+                Bucket=bucket,
+                Key=destination + item["Key"][len(source):]
+            )
+    return json.loads(json.dumps(outputs).replace(source, destination))
+
+
+def iter_records(event):
+    """S3 records of a S3 event, or of the S3 events in the bodies of a
+    SQS batch
+
+    Returns
+    ------
+    SQS message id, None for S3 events, and S3 record: generator of tuple
+
+    """
+
+    for record in event["Records"]:
+        if record.get("eventSource") == "aws:sqs":
+            body = json.loads(record["body"])
+            # s3:TestEvent has no Records
+            for s3_record in body.get("Records", []):
+                yield record["messageId"], s3_record
+        else:
+            yield None, record
+
+
+def execution_name(file_name, _id):
+    """Step Functions execution name, up to 80 characters without spaces
+    or special characters"""
+
+    return f"{re.sub(r'[^0-9A-Za-z_.-]', '_', file_name)[:43]}-{_id}"
+
+
+def object_priority(key):
+    """Admission priority of the longest prefix matching the key"""
+
+    prefixes = [x for x in priority_prefixes if key.startswith(x)]
+    if not prefixes:
+        return default_priority
+    return priority_prefixes[max(prefixes, key=len)]
+
+
+def object_uuid(bucket, key, record):
+    """Workflow uuid of an upload
+
+    The same for every delivery of the S3 record, from the bucket, the
+    key and the ETag and sequencer of the upload, so a retried event
+    starts the same execution name again.
+
+    Returns
+    ------
+    uuid: str
+
+    """
+
+    s3_object = record["s3"]["object"]
+    name = (
+        f"s3://{bucket}/{key}#{s3_object.get('eTag', '')}"
+        f"-{s3_object.get('sequencer', '')}"
     )
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, name))
 
 
-def lambda_handler(event, context):
-    """Start StepFunction Lambda function
+def start_object(record):
+    """Start the Step Functions for an uploaded object
+
+    Starting it again, when the event is retried, is a success: the
+    execution already started is kept.
 
     Parameters
     ----------
-    event: dict, required
-        S3 PutObject event
-
-    context: object, required
-        Lambda Context runtime methods and attributes
+    record: dict, required
+        S3 event record
 
 
     Returns
@@ -45,22 +190,11 @@ def lambda_handler(event, context):
 
     """
 
-    bucket = ""
-    key = ""
-    file_name = ""
-    event_time = ""
-
-    try:
-        if ("name" in event["Records"][0]["s3"]["bucket"] and
-                "key" in event["Records"][0]["s3"]["object"]):
-            bucket = event["Records"][0]["s3"]["bucket"]["name"]
-            key = event["Records"][0]["s3"]["object"]["key"]
-            file_name = re.findall(regex, key)[0]
-            event_time = event["Records"][0]["eventTime"]
-    except KeyError as e:
-        raise {
-            "message": f"Error - {e}"
-        }
+    bucket = record["s3"]["bucket"]["name"]
+    key = unquote_plus(record["s3"]["object"]["key"])
+    _id = object_uuid(bucket, key, record)
+    file_name = re.findall(regex, key)[0]
+    event_time = record["eventTime"]
 
     payload = {
         "metadata": {
@@ -70,20 +204,120 @@ def lambda_handler(event, context):
             "bucket": bucket,
             "key": key,
             "file_name": file_name,
-            "start_date": datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
+            "priority": object_priority(key),
+            "start_date": payloads.timestamp()
         }
     }
+    if "size" in record["s3"]["object"]:
+        payload["metadata"]["size"] = record["s3"]["object"]["size"]
+
+    if dedup_table:
+        fingerprint_id = fingerprint(s3, bucket, key, dedup_samples)
+        payload["metadata"]["dedup"] = {
+            "fingerprint": fingerprint_id,
+            "profile": dedup_profile()
+        }
+        found = find_outputs(fingerprint_id, dedup_profile())
+        if found is not None:
+            # Same content already processed, skip the Step Functions
+            previous, outputs = found
+            if dedup_mode == "copy":
+                outputs = copy_outputs(bucket, previous, outputs, _id)
+            else:
+                s3.put_object(
+                    Bucket=bucket,
+                    Key=f"outputs/{_id}/duplicate.json",
+                    Body=json.dumps({"uuid": previous, "Outputs": outputs}),
+                    ContentType="application/json"
+                )
+            payload["metadata"]["status"] = "DUPLICATE"
+            payload["metadata"]["duplicate_of"] = previous
+            payload["Outputs"] = outputs
+            print(f"Duplicate of {previous}: {fingerprint_id}")
+            ledger.record(
+                payload["metadata"], "workflow", "DUPLICATE",
+                input_bytes=payload["metadata"].get("size"),
+                duplicate_of=previous
+            )
+            return payload
 
+    name = execution_name(file_name, _id)
     try:
         response = sf.start_execution(
             stateMachineArn=sf_arn,
-            name=f"{file_name}-{_id}",
+            name=name,
             input=json.dumps(payload)
         )
-        print(response)
-    except KeyError as e:
+    except sf.exceptions.ExecutionAlreadyExists:
+        # A retry of an event with this object already started
+        print(f"Execution already started: {name}")
+        payload["metadata"]["status"] = "ALREADY STARTED"
+        return payload
+    print(response)
+    ledger.record(
+        payload["metadata"], "workflow", "STARTED",
+        input_bytes=payload["metadata"].get("size"),
+        execution_arn=response["executionArn"]
+    )
+
+    return payload
+
+
+def lambda_handler(event, context):
+    """Start StepFunction Lambda function
+
+    Every record of the event is started, with a uuid for each upload.
+    For SQS batches the messages with a record that failed are returned
+    in batchItemFailures, so only those are retried.
+
+    Parameters
+    ----------
+    event: dict, required
+        S3 PutObject event, or SQS event of S3 PutObject events
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+
+    Returns
+    ------
+    Object/StepFunction information of each object, and the SQS messages
+    that failed: dict
+
+    """
+
+    try:
+        records = list(iter_records(event))
+    except (KeyError, ValueError) as e:
         raise {
             "message": f"Error - {e}"
         }
 
-    return payload
+    def start(item):
+        message_id, record = item
+        try:
+            return message_id, start_object(record), None
+        except Exception as e:
+            print(f"Error starting {record.get('s3', {})}: {e}")
+            return message_id, None, e
+
+    with ThreadPoolExecutor(max_workers=ingest_concurrency) as executor:
+        results = list(executor.map(start, records))
+
+    executions = [x[1] for x in results if x[1] is not None]
+    failed = [x for x in results if x[2] is not None]
+    if any(message_id is None for message_id, _, _ in failed):
+        # S3 events are retried whole, there is no partial failure, the
+        # objects already started keep their execution
+        raise RuntimeError(
+            f"{len(failed)} of {len(results)} objects failed: "
+            f"{[str(x[2]) for x in failed]}"
+        )
+
+    return {
+        "executions": executions,
+        "batchItemFailures": [
+            {"itemIdentifier": message_id}
+            for message_id in dict.fromkeys(x[0] for x in failed)
+        ]
+    }
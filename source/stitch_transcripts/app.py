@@ -0,0 +1,90 @@
+from avod_common import clients, ledger, payloads
+from avod_common.s3_upload import MultipartUploadWriter
+from avod_common.transcript import iter_items
+from stitch import stitch, write_transcript
+
+
+s3 = clients.lazy("s3")
+
+
+def chunk_items(output):
+    """Items of the Transcript.json of a chunk, read when iterated"""
+
+    response = s3.get_object(Bucket=output["bucket"], Key=output["key"])
+    yield from iter_items(response["Body"])
+
+
+def lambda_handler(event, context):
+    """Stitch Transcripts Lambda function
+
+    Parameters
+    ----------
+    event: list, required
+        Output of each chunk of the StepFunctions Map state
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+
+    Returns
+    ------
+    Transcript.json of the whole source in Outputs.Transcribe: dict
+
+    """
+
+    try:
+        results = sorted(
+            event, key=lambda x: x["metadata"]["chunk"]["index"]
+        )
+        chunks = [x["metadata"]["chunk"] for x in results]
+        outputs = [x["Outputs"]["Transcribe"] for x in results]
+        file_name = results[0]["metadata"]["file_name"]
+        _id = results[0]["metadata"]["uuid"]
+    except (KeyError, IndexError) as e:
+        raise {
+            "message": f"Error - {e}"
+        }
+
+    payload = {
+        "metadata": dict(results[0]["metadata"]),
+        "Outputs": {}
+    }
+    del payload["metadata"]["chunk"]
+
+    if len(results) == 1:
+        # Not chunked, the chunk transcript is the source one
+        payload["Outputs"] = results[0]["Outputs"]
+    else:
+        transcript = {
+            "bucket": outputs[0]["bucket"],
+            "key": f"outputs/{_id}/Transcript.json"
+        }
+        with MultipartUploadWriter(
+            s3, transcript["bucket"], transcript["key"],
+            content_type="application/json"
+        ) as f:
+            # The chunks are read one after the other, as the items are
+            # written
+            count = write_transcript(
+                f, f"{file_name}-{_id}",
+                stitch(chunks, [chunk_items(x) for x in outputs])
+            )
+        ledger.record(
+            payload["metadata"], "stitch", "COMPLETE",
+            chunks=len(results),
+            items=count,
+            output_bytes=f.bytes_written
+        )
+
+        payload["Outputs"] = {
+            "Audio": {
+                "chunks": [x["Outputs"]["Audio"] for x in results]
+            },
+            "Transcribe": {
+                "job_ids": [x["job_id"] for x in outputs],
+                **transcript
+            }
+        }
+
+    payloads.touch(payload, "COMPLETE")
+    return payload
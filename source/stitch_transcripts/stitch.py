@@ -0,0 +1,135 @@
+"""Stitch the Transcript.json of the chunks of a transcription
+
+The items of each chunk are moved to the source timeline adding the
+chunk start. The overlap of two chunks is cut on word boundaries: the
+words of the first chunk starting before the middle of the overlap are
+kept, then the words of the second one starting at or after the end of
+the last word kept. A word across the middle is kept once, from the
+first chunk when it heard its start, else from the second one.
+Punctuation follows the word before it.
+
+The items are read and written one at a time, only the text of the
+transcript is kept in memory.
+"""
+import json
+
+
+def cut_points(chunks):
+    """Source time where each chunk stops being used
+
+    Parameters
+    ----------
+    chunks: list, required
+        Chunks with start and end, sorted by start
+
+
+    Returns
+    ------
+    Seconds, None for the last chunk: list
+
+    """
+
+    cuts = []
+    for chunk, following in zip(chunks, chunks[1:]):
+        cuts.append((following["start"] + chunk["end"]) / 2)
+    return cuts + [None]
+
+
+def shift(item, offset):
+    item = dict(item)
+    for name in ("start_time", "end_time"):
+        if name in item:
+            item[name] = "%.3f" % (float(item[name]) + offset)
+    return item
+
+
+def stitch(chunks, transcripts):
+    """Stitch the items of the chunks
+
+    Parameters
+    ----------
+    chunks: list, required
+        Chunks with start and end in seconds, sorted by start
+
+    transcripts: list, required
+        Iterable of the Transcribe items of each chunk, like iter_items
+        of its Transcript.json
+
+
+    Returns
+    ------
+    Items in the source timeline, with their id renumbered: generator
+
+    """
+
+    index = 0
+    low = 0.0
+    for chunk, items, high in zip(
+        chunks, transcripts, cut_points(chunks)
+    ):
+        keep = False
+        last_end = low
+        for item in items:
+            if item["type"] == "punctuation":
+                if not keep:
+                    continue
+            else:
+                start = float(item["start_time"]) + chunk["start"]
+                keep = start >= low and (high is None or start < high)
+                if not keep:
+                    continue
+                item = shift(item, chunk["start"])
+                last_end = max(last_end, float(item["end_time"]))
+            if "id" in item:
+                item["id"] = index
+            index += 1
+            yield item
+        # The next chunk goes on after the last word kept
+        low = last_end
+
+
+def write_transcript(f, job_name, items):
+    """Write a Transcript.json with the stitched items
+
+    The items are written as they come and the transcript text, built
+    from them, after them.
+
+    Parameters
+    ----------
+    f: object, required
+        File object with a write(str) method
+
+    job_name: str, required
+        jobName of the transcript
+
+    items: iterable, required
+        Items of the transcript
+
+
+    Returns
+    ------
+    Items written: int
+
+    """
+
+    encoder = json.JSONEncoder()
+    f.write(
+        f'{{"jobName": {encoder.encode(job_name)}, "status": "COMPLETED", '
+        f'"results": {{"items": ['
+    )
+    words = []
+    count = 0
+    for item in items:
+        if count:
+            f.write(", ")
+        for part in encoder.iterencode(item):
+            f.write(part)
+        content = item["alternatives"][0]["content"]
+        if words and item["type"] != "punctuation":
+            words.append(" ")
+        words.append(content)
+        count += 1
+    f.write('], "transcripts": [{"transcript": ')
+    f.write(encoder.encode("".join(words)))
+    f.write("}]}}")
+    return count
@@ -0,0 +1,68 @@
+from avod_common import hls_index, ledger, payloads, polling
+
+
+def lambda_handler(event, context):
+    """Verify the HLS output and write its index Lambda function
+
+    The master playlist, the media playlists and every segment they
+    reference are checked against a listing of the HLS folder, and the
+    index of the renditions and segments is written next to the master
+    playlist, see avod_common.hls_index. A broken output fails the HLS
+    branch, so a re-drive encodes it again.
+
+    Parameters
+    ----------
+    event: dict, required
+        Get HLS Output event
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+
+    Returns
+    ------
+    Index key in Outputs.HLS.index: dict
+
+    """
+
+    try:
+        if ("HLS" in event["Outputs"]):
+            bucket = event["Outputs"]["HLS"]["bucket"]
+            master_key = event["Outputs"]["HLS"]["key"]
+        else:
+            raise KeyError("No HLS output to verify")
+    except KeyError as e:
+        raise {
+            "message": f"Error - {e}"
+        }
+
+    payload = event
+
+    try:
+        key, index = hls_index.verify(
+            bucket, master_key,
+            polling.source_duration(payload["metadata"])
+        )
+    except hls_index.IntegrityError as e:
+        print(e)
+        ledger.record(payload["metadata"], "verify", "FAILED", error=f"{e}")
+        # A re-drive submits a new HLS job instead of adopting this one
+        ledger.record(payload["metadata"], "hls", "FAILED", error=f"{e}")
+        payloads.touch(payload, "FAILED")
+        raise
+
+    print({
+        "index": key,
+        "segments": index["segments"],
+        "warnings": index["warnings"]
+    })
+    ledger.record(
+        payload["metadata"], "verify", "COMPLETE",
+        variants=len(index["variants"]),
+        segments=index["segments"],
+        output_bytes=index["bytes"],
+        warnings=index["warnings"] or None
+    )
+    payload["Outputs"]["HLS"]["index"] = key
+    payloads.touch(payload, "COMPLETED")
+    return payload
@@ -0,0 +1,42 @@
+"""Unit tests of the Lambda functions and of the common layer
+
+The common layer is on the path like in Lambda, and the modules of a
+function are imported from its folder with the load fixture. The clients
+get fake credentials and never reach AWS, the tests answer their calls.
+"""
+import importlib.util
+import os
+import sys
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = os.path.join(ROOT, "source")
+EVENTS = os.path.join(ROOT, "events")
+
+sys.path.insert(0, os.path.join(SOURCE, "common"))
+for name, value in {
+    "AWS_ACCESS_KEY_ID": "test",
+    "AWS_SECRET_ACCESS_KEY": "test",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_EC2_METADATA_DISABLED": "true"
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def load(monkeypatch):
+    """Import a module of a function folder, like stitch of
+    stitch_transcripts, as a new module"""
+
+    def load_module(function, module="app"):
+        folder = os.path.join(SOURCE, function)
+        monkeypatch.syspath_prepend(folder)
+        spec = importlib.util.spec_from_file_location(
+            f"{function}_{module}", os.path.join(folder, f"{module}.py")
+        )
+        loaded = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(loaded)
+        return loaded
+
+    return load_module
@@ -0,0 +1,162 @@
+import json
+import os
+import pytest
+from conftest import SOURCE
+from avod_common import admission
+
+
+LANE = "mediaconvert/Test"
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    def set_limits(rate=1.0, burst=2, concurrency=3):
+        monkeypatch.setitem(admission.limits_overrides, LANE, {
+            "rate": rate, "burst": burst, "concurrency": concurrency
+        })
+    set_limits()
+    return set_limits
+
+
+@pytest.fixture
+def scheduler(limits):
+    clock = admission.FakeClock(1000.0)
+    notified = []
+
+    def notify(waiter, lane):
+        notified.append((clock.time(), waiter["ticket"]))
+        return waiter["token"] != "gone"
+
+    scheduler = admission.Scheduler(admission.MemoryStore(), notify, clock)
+    scheduler.notified = notified
+    return scheduler
+
+
+def running(scheduler):
+    return scheduler.store.get_lane(LANE)[0]["running"]
+
+
+def test_burst_then_rate(scheduler, limits):
+    limits(rate=0.5, burst=2, concurrency=10)
+
+    for x in range(4):
+        scheduler.acquire(LANE, f"job-{x}", "token", max_wait=60)
+
+    assert scheduler.notified == [
+        (1000.0, "job-0"), (1000.0, "job-1"),
+        (1002.0, "job-2"), (1004.0, "job-3")
+    ]
+
+
+def test_waiters_without_tokens_wait_for_the_dispatch(scheduler, limits):
+    limits(rate=0.1, burst=1, concurrency=10)
+
+    assert scheduler.acquire(LANE, "job-0", "token") == ["job-0"]
+    assert scheduler.acquire(LANE, "job-1", "token", max_wait=5) == []
+
+    assert scheduler.dispatch(LANE, max_wait=10) == ["job-1"]
+    assert scheduler.notified[-1] == (1010.0, "job-1")
+
+
+def test_concurrency_limit_and_release(scheduler):
+    for x in range(5):
+        scheduler.acquire(LANE, f"job-{x}", "token", max_wait=60)
+
+    assert [x[1] for x in scheduler.notified] == ["job-0", "job-1", "job-2"]
+    assert running(scheduler) == 3
+
+    assert scheduler.release(LANE, "job-1", max_wait=60)
+    assert scheduler.notified[-1][1] == "job-3"
+    assert running(scheduler) == 3
+    # A second release of the same job doesn't free another slot
+    assert not scheduler.release(LANE, "job-1", max_wait=60)
+    assert running(scheduler) == 3
+
+
+def test_priority_then_arrival(scheduler, limits):
+    limits(concurrency=1)
+    scheduler.acquire(LANE, "first", "token", "standard")
+    for ticket, priority in [
+        ("backlog", "backlog"), ("standard", "standard"),
+        ("unknown", "other"), ("news", "news")
+    ]:
+        scheduler.clock.sleep(1)
+        scheduler.acquire(LANE, ticket, "token", priority)
+
+    for _ in range(4):
+        scheduler.release(LANE, scheduler.notified[-1][1], max_wait=60)
+
+    assert [x[1] for x in scheduler.notified] == [
+        "first", "news", "standard", "backlog", "unknown"
+    ]
+
+
+def test_reclaim_expired_leases(scheduler, monkeypatch):
+    monkeypatch.setattr(admission, "lease_seconds", 100)
+    scheduler.acquire(LANE, "job-0", "token")
+    scheduler.clock.sleep(50)
+    scheduler.acquire(LANE, "job-1", "token")
+
+    scheduler.clock.sleep(60)
+
+    assert scheduler.reclaim(LANE) == ["job-0"]
+    assert running(scheduler) == 1
+    assert scheduler.reclaim(LANE) == []
+
+
+def test_waiter_gone_frees_its_slot(scheduler):
+    assert scheduler.acquire(LANE, "job-0", "gone") == []
+    assert running(scheduler) == 0
+    assert scheduler.acquire(LANE, "job-1", "token") == ["job-1"]
+
+
+def test_release_of_a_failed_job(load, scheduler, monkeypatch):
+    app = load("admission")
+    monkeypatch.setattr(admission, "admission_table", "avod-admission")
+    monkeypatch.setitem(admission.scheduler, "default", scheduler)
+    scheduler.acquire(LANE, "uuid-hls", "token")
+    event = {
+        "release": True,
+        "metadata": {
+            "uuid": "uuid",
+            "admission": {"lane": LANE, "ticket": "uuid-hls"}
+        }
+    }
+
+    assert app.lambda_handler(event, None) == {"released": True}
+    assert running(scheduler) == 0
+    assert app.lambda_handler(event, None) == {"released": False}
+    # A job that failed before its admission has no slot
+    del event["metadata"]["admission"]
+    assert app.lambda_handler(event, None) == {"released": False}
+
+
+def test_failures_after_the_admission_release_the_slot():
+    with open(os.path.join(
+        SOURCE, "stepfunctions", "VODWorkFlow.asl.json"
+    )) as f:
+        definition = json.load(f)
+
+    def branches(states):
+        for state in states.values():
+            for branch in state.get("Branches", []):
+                yield branch["States"]
+                yield from branches(branch["States"])
+            if "Iterator" in state:
+                yield state["Iterator"]["States"]
+                yield from branches(state["Iterator"]["States"])
+
+    stages = []
+    for states in branches(definition["States"]):
+        for name in states:
+            if not name.startswith("Admit "):
+                continue
+            stage = name[len("Admit "):]
+            stages.append(stage)
+            release = states[f"Release {stage}"]
+            assert release["Parameters"]["release"] is True
+            assert release["Next"] == f"{stage} Failed"
+            for step in ("Execute", "Wait For", "Get Status"):
+                for catch in states[f"{step} {stage}"]["Catch"]:
+                    assert catch["Next"] != f"{stage} Failed"
+    assert sorted(stages) == ["Extract Audio", "HLS", "Transcribe"]
@@ -0,0 +1,91 @@
+import io
+import json
+import pytest
+from avod_common import captions
+
+
+def caption(start, end, text, confidence):
+    return {
+        "start": start,
+        "end": end,
+        "caption": text,
+        "wordConfidence": [
+            {"w": w, "c": c} for w, c in zip(text.split(), confidence)
+        ]
+    }
+
+
+CAPTIONS = [
+    caption(0.5, 1.75, "olá mundo", [0.99, 0.876]),
+    caption(2.0, 3.001, "olá de novo", [1.0, 0.5, 0.004]),
+    caption(3.001, 4.5, "", []),
+    caption(10.25, 12.0, "mundo novo", [0.2, 0.8]),
+    caption(12.0, 13.5, "de novo", [0.61, 0.005])
+]
+
+
+def write(block_size):
+    f = io.StringIO()
+    captions.write_captions(CAPTIONS, f, block_size)
+    return f.getvalue()
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 1000])
+def test_round_trip(block_size):
+    document = write(block_size)
+
+    read = list(captions.read_captions(io.StringIO(document)))
+
+    assert len(document.splitlines()) == 1 + -(-len(CAPTIONS) // block_size)
+    assert [(x["start"], x["end"], x["caption"]) for x in read] == [
+        (x["start"], x["end"], x["caption"]) for x in CAPTIONS
+    ]
+    assert [[w["w"] for w in x["wordConfidence"]] for x in read] == [
+        x["caption"].split() for x in CAPTIONS
+    ]
+
+
+def test_blocks():
+    header, first, second, third = (
+        json.loads(x) for x in write(2).splitlines()
+    )
+
+    assert header == {"format": "avod-captions", "version": 1}
+    # Starts are deltas from the previous caption, across the blocks
+    assert (first["start"], second["start"], third["start"]) == (
+        [500, 1500], [1001, 7249], [1750]
+    )
+    assert first["duration"] == [1250, 1001]
+    # Each word is added to the string table of the first block using it
+    assert first["strings"] == ["olá", "mundo", "de", "novo"]
+    assert second["strings"] == [] and third["strings"] == []
+    assert second["words"] == [1, 3] and third["words"] == [2, 3]
+    assert second["word_count"] == [0, 2]
+
+
+def test_confidence_is_quantized():
+    first, second = list(captions.read_captions(io.StringIO(write(2))))[:2]
+
+    assert [x["c"] for x in first["wordConfidence"]] == [0.99, 0.88]
+    assert [x["c"] for x in second["wordConfidence"]] == [1.0, 0.5, 0.0]
+
+
+def test_read_bytes_lines():
+    lines = [x.encode("utf-8") for x in write(2).splitlines()]
+
+    read = list(captions.read_captions([b""] + lines + [b"  "]))
+
+    assert read[0]["caption"] == "olá mundo"
+    assert len(read) == len(CAPTIONS)
+
+
+@pytest.mark.parametrize("document, message", [
+    ("", "Empty captions document"),
+    ('{"format": "srt", "version": 1}\n', "Not an AVOD captions document"),
+    ("[1, 2]\n", "Not an AVOD captions document"),
+    ('{"format": "avod-captions", "version": 2}\n',
+     "Unsupported captions version: 2")
+])
+def test_bad_documents(document, message):
+    with pytest.raises(ValueError, match=message):
+        list(captions.read_captions(io.StringIO(document)))
@@ -0,0 +1,198 @@
+import json
+import os
+import pytest
+from conftest import EVENTS, SOURCE
+
+
+JOB_ID = "1234567890123-a1bcd2"
+
+
+def event(name):
+    with open(os.path.join(EVENTS, name)) as f:
+        return json.load(f)
+
+
+class Exceptions:
+    class ConditionalCheckFailedException(Exception):
+        pass
+
+    class TaskTimedOut(Exception):
+        pass
+
+    class TaskDoesNotExist(Exception):
+        pass
+
+    class InvalidToken(Exception):
+        pass
+
+
+class Table:
+    """CALLBACKTABLE, the state machine registering its token between
+    the get_item and the put_item of the function when racing"""
+
+    exceptions = Exceptions
+
+    def __init__(self, racing_token=None):
+        self.items = {}
+        self.racing_token = racing_token
+
+    def register(self, job_id, token):
+        """putItem of the "Wait For" states"""
+
+        self.put_item(
+            TableName="avod-callbacks",
+            Item={"job_id": {"S": job_id}, "task_token": {"S": token}},
+            ConditionExpression="attribute_not_exists(job_id)"
+        )
+
+    def get_item(self, TableName, Key, **kwargs):
+        item = self.items.get(Key["job_id"]["S"])
+        if self.racing_token is not None:
+            self.register(Key["job_id"]["S"], self.racing_token)
+            self.racing_token = None
+        return {} if item is None else {"Item": dict(item)}
+
+    def put_item(self, TableName, Item, ConditionExpression=None):
+        assert ConditionExpression == "attribute_not_exists(job_id)"
+        if Item["job_id"]["S"] in self.items:
+            raise Exceptions.ConditionalCheckFailedException()
+        self.items[Item["job_id"]["S"]] = Item
+
+    def delete_item(self, TableName, Key):
+        self.items.pop(Key["job_id"]["S"], None)
+
+
+class StepFunctions:
+    exceptions = Exceptions
+
+    def __init__(self):
+        self.calls = []
+
+    def send_task_success(self, **kwargs):
+        self.calls.append(("success", kwargs))
+
+    def send_task_failure(self, **kwargs):
+        self.calls.append(("failure", kwargs))
+
+
+@pytest.fixture
+def complete_job(load, monkeypatch):
+    app = load("complete_job")
+    monkeypatch.setattr(app, "dynamodb", Table())
+    monkeypatch.setattr(app, "sf", StepFunctions())
+    released = []
+    monkeypatch.setattr(app.admission, "release_job", released.append)
+    app.released = released
+    return app
+
+
+def test_resumes_the_waiting_execution(complete_job):
+    complete_job.dynamodb.items[JOB_ID] = {
+        "job_id": {"S": JOB_ID},
+        "task_token": {"S": "token"},
+        "lane": {"S": "mediaconvert/Default"},
+        "ticket": {"S": "uuid-hls"}
+    }
+
+    payload = complete_job.lambda_handler(
+        event("mediaconvert_job_state_change_event.json"), None
+    )
+
+    assert payload["callback"] == "SUCCESS"
+    (kind, call), = complete_job.sf.calls
+    assert kind == "success" and call["taskToken"] == "token"
+    assert JOB_ID not in complete_job.dynamodb.items
+    assert complete_job.released == [{"admission": {
+        "lane": "mediaconvert/Default", "ticket": "uuid-hls"
+    }}]
+
+
+def test_fails_the_waiting_execution(complete_job):
+    complete_job.dynamodb.items[JOB_ID] = {
+        "job_id": {"S": JOB_ID}, "task_token": {"S": "token"}
+    }
+
+    payload = complete_job.lambda_handler(
+        event("mediaconvert_job_error_event.json"), None
+    )
+
+    assert payload["callback"] == "FAILURE"
+    (kind, call), = complete_job.sf.calls
+    assert kind == "failure" and call["error"] == "mediaconvert.ERROR"
+    assert "indeo4" in call["cause"]
+
+
+def test_event_before_the_token_is_registered(complete_job):
+    payload = complete_job.lambda_handler(
+        event("transcribe_job_state_change_event.json"), None
+    )
+
+    assert payload["callback"] == "MARKED"
+    job_id = payload["job_id"]
+    marker = complete_job.dynamodb.items[job_id]
+    assert marker["status"] == {"S": "COMPLETED"}
+    assert int(marker["expires"]["N"]) > 0
+    assert complete_job.sf.calls == []
+    # The "Wait For" state can't register and reads the job status
+    with pytest.raises(Exceptions.ConditionalCheckFailedException):
+        complete_job.dynamodb.register(job_id, "token")
+    # A duplicate event leaves the marker
+    payload = complete_job.lambda_handler(
+        event("transcribe_job_state_change_event.json"), None
+    )
+    assert payload["callback"] == "NOT FOUND"
+    assert job_id in complete_job.dynamodb.items
+
+
+def test_token_registered_while_marking(complete_job, monkeypatch):
+    monkeypatch.setattr(complete_job, "dynamodb", Table("token"))
+
+    payload = complete_job.lambda_handler(
+        event("mediaconvert_job_state_change_event.json"), None
+    )
+
+    assert payload["callback"] == "SUCCESS"
+    assert complete_job.sf.calls[0][1]["taskToken"] == "token"
+    assert JOB_ID not in complete_job.dynamodb.items
+
+
+def test_progress_events_are_ignored(complete_job):
+    progressing = event("mediaconvert_job_state_change_event.json")
+    progressing["detail"]["status"] = "PROGRESSING"
+
+    payload = complete_job.lambda_handler(progressing, None)
+
+    assert payload["callback"] == "IGNORED"
+    assert complete_job.dynamodb.items == {}
+
+
+def wait_states(states):
+    for name, state in states.items():
+        if name.startswith("Wait For "):
+            yield name, state
+        for branch in state.get("Branches", []):
+            yield from wait_states(branch["States"])
+        if "Iterator" in state:
+            yield from wait_states(state["Iterator"]["States"])
+
+
+def test_wait_states_read_the_status_of_a_marked_job():
+    with open(os.path.join(
+        SOURCE, "stepfunctions", "VODWorkFlow.asl.json"
+    )) as f:
+        definition = json.load(f)
+
+    states = dict(wait_states(definition["States"]))
+    assert sorted(states) == [
+        "Wait For Extract Audio", "Wait For HLS", "Wait For Transcribe"
+    ]
+    for name, state in states.items():
+        assert state["Parameters"]["ConditionExpression"] == (
+            "attribute_not_exists(job_id)"
+        )
+        catch = state["Catch"][0]
+        assert catch["ErrorEquals"] == [
+            "DynamoDB.ConditionalCheckFailedException"
+        ]
+        assert catch["ResultPath"] is None
+        assert catch["Next"] == name.replace("Wait For", "Get Status")
@@ -0,0 +1,301 @@
+import io
+import json
+import os
+import pytest
+from conftest import EVENTS
+from avod_common import hls_index
+
+
+FOLDER = "outputs/uuid/HLS/"
+MASTER = """#EXTM3U
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",LANGUAGE="en",NAME="English",\
+DEFAULT=YES,URI="audio/key_aac.m3u8"
+#EXT-X-MEDIA:TYPE=CLOSED-CAPTIONS,GROUP-ID="cc",INSTREAM-ID="CC1",NAME="CC"
+#EXT-X-STREAM-INF:BANDWIDTH=1000000,RESOLUTION=1280x720,CODECS="avc1",\
+AUDIO="audio"
+key_720p.m3u8
+"""
+
+
+def playlist(*segments, target=6, init=None, endlist=True):
+    """Media playlist of (duration, uri) or (duration, uri, byterange)"""
+
+    lines = ["#EXTM3U", f"#EXT-X-TARGETDURATION:{target}"]
+    if init is not None:
+        lines.append(f'#EXT-X-MAP:URI="{init}"')
+    for duration, uri, *byterange in segments:
+        lines.append(f"#EXTINF:{duration},")
+        if byterange:
+            lines.append(f"#EXT-X-BYTERANGE:{byterange[0]}")
+        lines.append(uri)
+    if endlist:
+        lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def output():
+    """HLS folder of 12 s: a 720p variant of 6 s fMP4 segments, 750 kB
+    each, and an audio rendition of byte ranges of a single file"""
+
+    return {
+        "key.m3u8": MASTER,
+        "key_720p.m3u8": playlist(
+            (6.0, "key_720p_00000.m4s"), (6.0, "key_720p_00001.m4s"),
+            init="key_720p_init.mp4"
+        ),
+        "key_720p_init.mp4": 1000,
+        "key_720p_00000.m4s": 750000,
+        "key_720p_00001.m4s": 750000,
+        "audio/key_aac.m3u8": playlist(
+            (6.0, "key_aac.aac", "96000@0"), (6.0, "key_aac.aac", "96000")
+        ),
+        "audio/key_aac.aac": 192000
+    }
+
+
+class Paginator:
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def paginate(self, Bucket, Prefix):
+        # Two pages, like a listing over 1000 keys
+        keys = sorted(x for x in self.s3.objects if x.startswith(Prefix))
+        for page in (keys[:3], keys[3:]):
+            yield {"Contents": [
+                {"Key": x, "Size": len(self.s3.objects[x])} for x in page
+            ]}
+
+
+class S3:
+    """S3 bucket of objects by key, a playlist as text and a segment as its
+    size"""
+
+    def __init__(self, objects):
+        self.objects = {
+            FOLDER + name: (
+                value.encode("utf-8") if isinstance(value, str)
+                else bytes(value)
+            )
+            for name, value in objects.items()
+        }
+        self.reads = []
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return Paginator(self)
+
+    def get_object(self, Bucket, Key):
+        self.reads.append(Key)
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.objects[Key] = Body
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    def install(objects):
+        s3 = S3(objects)
+        monkeypatch.setattr(hls_index, "s3", s3)
+        return s3
+
+    return install
+
+
+def build(s3, objects, source_duration=12.0):
+    s3(objects)
+    return hls_index.build_index(
+        "bucket", FOLDER + "key.m3u8", source_duration
+    )
+
+
+def test_index(s3):
+    index, errors = build(s3, output())
+
+    assert errors == []
+    assert index["warnings"] == []
+    assert (index["duration"], index["segments"], index["bytes"]) == (
+        12.0, 4, 1000 + 1500000 + 192000
+    )
+    variant, = index["variants"]
+    assert variant["bandwidth"] == 1000000
+    assert variant["audio"] == "audio"
+    assert variant["init"] == {"uri": "key_720p_init.mp4", "bytes": 1000}
+    assert variant["measured_peak_bandwidth"] == 1000000
+    audio, = index["media"]
+    assert (audio["type"], audio["group"], audio["language"]) == (
+        "AUDIO", "audio", "en"
+    )
+    assert audio["segments"] == {
+        "uri": ["key_aac.aac"] * 2,
+        "duration": [6.0, 6.0],
+        "bytes": [96000, 96000],
+        "offset": [0, 96000]
+    }
+
+
+def test_verify_writes_the_index(s3):
+    bucket = s3(output())
+
+    key, index = hls_index.verify("bucket", FOLDER + "key.m3u8", 12.0)
+
+    assert key == FOLDER + "key_index.json"
+    assert json.loads(bucket.objects[key]) == index
+
+
+@pytest.mark.parametrize("name, value, error", [
+    ("key_720p_00001.m4s", None, "Missing outputs/uuid/HLS/key_720p_00001"),
+    ("key_720p_00001.m4s", 0, "Empty outputs/uuid/HLS/key_720p_00001"),
+    ("key_720p_init.mp4", None, "Missing outputs/uuid/HLS/key_720p_init"),
+    ("audio/key_aac.m3u8", None, "Missing outputs/uuid/HLS/audio/key_aac."),
+    ("audio/key_aac.aac", 191999,
+     "Byte range 96000@96000 past the end of outputs/uuid/HLS/audio/"),
+    ("key_720p.m3u8", playlist(
+        (6.0, "key_720p_00000.m4s"), (6.0, "key_720p_00001.m4s"),
+        init="key_720p_init.mp4", endlist=False
+    ), "No EXT-X-ENDLIST in outputs/uuid/HLS/key_720p.m3u8"),
+    ("key_720p.m3u8", playlist(
+        (6.0, "key_720p_00000.m4s"), (6.5, "key_720p_00001.m4s"),
+        init="key_720p_init.mp4"
+    ), "Segment outputs/uuid/HLS/key_720p_00001.m4s of 6.5 s over the "
+       "target duration 6 s"),
+    ("key_720p.m3u8", playlist(), "No segments in outputs/uuid/HLS/key_720p")
+])
+def test_errors(s3, name, value, error):
+    objects = output()
+    if value is None:
+        del objects[name]
+    else:
+        objects[name] = value
+
+    index, errors = build(s3, objects)
+
+    assert len(errors) == 1 and errors[0].startswith(error)
+    with pytest.raises(hls_index.IntegrityError, match="1 errors in "):
+        hls_index.verify("bucket", FOLDER + "key.m3u8")
+
+
+def test_segment_rounded_to_the_target_duration(s3):
+    objects = output()
+    objects["key_720p.m3u8"] = playlist(
+        (6.0, "key_720p_00000.m4s"), (6.499, "key_720p_00001.m4s"),
+        init="key_720p_init.mp4"
+    )
+
+    assert build(s3, objects)[1] == []
+
+
+def test_missing_master(s3):
+    objects = output()
+    del objects["key.m3u8"]
+
+    assert build(s3, objects) == (
+        None, ["Missing outputs/uuid/HLS/key.m3u8"]
+    )
+
+
+def test_errors_in_the_message_are_bounded(s3, monkeypatch):
+    monkeypatch.setattr(hls_index, "MAX_ERRORS", 2)
+    objects = output()
+    for name in ("key_720p_init.mp4", "key_720p_00000.m4s",
+                 "key_720p_00001.m4s"):
+        del objects[name]
+    s3(objects)
+
+    with pytest.raises(hls_index.IntegrityError) as error:
+        hls_index.verify("bucket", FOLDER + "key.m3u8")
+
+    assert str(error.value).startswith("3 errors in ")
+    assert str(error.value).count("Missing") == 2
+
+
+def test_warnings(s3):
+    objects = output()
+    # 1.5 MB in 6 s is 2 Mbit/s, over the BANDWIDTH of 1 Mbit/s
+    objects["key_720p_00001.m4s"] = 1500000
+
+    index, errors = build(s3, objects, source_duration=14.5)
+
+    assert errors == []
+    assert index["warnings"] == [
+        "key_720p.m3u8 peak of 2000000 bit/s over its BANDWIDTH 1000000"
+    ]
+    # Within the target duration of the source, not a warning
+    assert build(s3, output(), source_duration=17.9)[0]["warnings"] == []
+    index, _ = build(s3, output(), source_duration=18.5)
+    assert index["warnings"] == [
+        "key_720p.m3u8 lasts 12.0 s, the source 18.5 s",
+        "audio/key_aac.m3u8 lasts 12.0 s, the source 18.5 s"
+    ]
+
+
+def subtitles(language, segments):
+    playlist = hls_index.hls.parse_playlist(hls_index.hls.media_playlist([
+        {"uri": f"key_subtitles_{language}_{x:05d}.vtt", "duration": 6.0}
+        for x in range(segments)
+    ]))
+    return {
+        "type": "SUBTITLES", "group": "subs", "language": language,
+        **hls_index.media_entry(
+            f"key_subtitles_{language}.m3u8", playlist, [100] * segments
+        )
+    }
+
+
+def test_add_media_replaces_the_same_rendition(s3):
+    bucket = s3(output())
+    key, _ = hls_index.verify("bucket", FOLDER + "key.m3u8", 12.0)
+
+    hls_index.add_media("bucket", key, subtitles("pt-BR", 2), "subtitles")
+    hls_index.add_media("bucket", key, subtitles("es", 2), "subtitles")
+    hls_index.add_media("bucket", key, subtitles("pt-BR", 3), "subtitles")
+
+    index = json.loads(bucket.objects[key])
+    assert [(x["type"], x.get("language")) for x in index["media"]] == [
+        ("AUDIO", "en"), ("SUBTITLES", "es"), ("SUBTITLES", "pt-BR")
+    ]
+    assert index["media"][2]["duration"] == 18.0
+    assert index["variants"][0]["subtitles"] == "subs"
+    assert (index["duration"], index["segments"], index["bytes"]) == (
+        18.0, 4 + 2 + 3, 1000 + 1500000 + 192000 + 500
+    )
+
+
+def event():
+    with open(os.path.join(EVENTS, "get_hls_event.json")) as f:
+        payload = json.load(f)
+    payload["Outputs"]["HLS"]["key"] = FOLDER + "key.m3u8"
+    return payload
+
+
+def test_handler(load, s3):
+    app = load("verify_hls")
+    bucket = s3(output())
+
+    payload = app.lambda_handler(event(), None)
+
+    assert payload["Outputs"]["HLS"]["index"] == FOLDER + "key_index.json"
+    assert payload["metadata"]["status"] == "COMPLETED"
+    assert FOLDER + "key_index.json" in bucket.objects
+
+
+def test_handler_fails_a_broken_output(load, s3):
+    app = load("verify_hls")
+    objects = output()
+    del objects["key_720p_00001.m4s"]
+    s3(objects)
+
+    with pytest.raises(hls_index.IntegrityError):
+        app.lambda_handler(event(), None)
+
+
+def test_handler_without_hls_output(load, s3):
+    app = load("verify_hls")
+    bucket = s3(output())
+    payload = event()
+    del payload["Outputs"]["HLS"]
+
+    # The error dict of the handlers, not a NameError on the bucket
+    with pytest.raises(TypeError):
+        app.lambda_handler(payload, None)
+    assert bucket.reads == []
@@ -0,0 +1,81 @@
+import pytest
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError, EndpointConnectionError
+from avod_common import ledger
+
+
+METADATA = {"uuid": "uuid", "file_name": "key.mp4"}
+
+
+class Table:
+    """LEDGERTABLE raising error on every call when set"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.updates = []
+
+    def update_item(self, **kwargs):
+        if self.error is not None:
+            raise self.error
+        self.updates.append(kwargs)
+
+    def get_item(self, **kwargs):
+        if self.error is not None:
+            raise self.error
+        return {"Item": {
+            "job_id": {"S": "job"}, "status": {"S": "SUBMITTED"}
+        }}
+
+
+@pytest.fixture
+def table(monkeypatch):
+    monkeypatch.setattr(ledger, "ledger_table", "avod-ledger")
+    table = Table()
+    monkeypatch.setattr(ledger, "dynamodb", table)
+    return table
+
+
+def test_record(table):
+    assert ledger.record(
+        METADATA, "hls", "COMPLETE",
+        started=datetime(2020, 1, 1, tzinfo=timezone.utc),
+        finished="2020-01-01T00:01:30.500Z",
+        error=None
+    )
+
+    update, = table.updates
+    assert update["Key"]["stage"] == {"S": "hls"}
+    values = update["ExpressionAttributeValues"]
+    assert values[":status"] == {"S": "COMPLETE"}
+    assert values[":run_seconds"] == {"N": "90.5"}
+    assert ":error" not in values
+
+
+@pytest.mark.parametrize("error", [
+    ClientError(
+        {"Error": {"Code": "ProvisionedThroughputExceededException"}},
+        "UpdateItem"
+    ),
+    EndpointConnectionError(endpoint_url="https://dynamodb"),
+])
+def test_aws_errors_never_fail_the_function(table, error):
+    table.error = error
+
+    assert ledger.record(METADATA, "hls", "COMPLETE") is False
+    assert ledger.job_id(METADATA, "hls") is None
+
+
+def test_bad_fields_never_fail_the_function(table):
+    assert ledger.record(
+        METADATA, "hls", "COMPLETE",
+        started="yesterday", finished="2020-01-01T00:00:00Z"
+    ) is False
+    assert ledger.record({"file_name": "key.mp4"}, "hls", "COMPLETE") is False
+    assert table.updates == []
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(ledger, "ledger_table", "")
+
+    assert ledger.record(METADATA, "hls", "COMPLETE") is False
+    assert ledger.job_id(METADATA, "hls") is None
@@ -0,0 +1,46 @@
+import pytest
+from avod_common import polling
+
+
+def test_half_of_the_remaining_time():
+    # 60 s of audio: 15 s overhead + 6 s of processing
+    assert polling.next_poll_seconds("audio", 0, duration=60) == 10
+    assert polling.next_poll_seconds("hls", 100, percent=50) == 50
+
+
+def test_polls_get_closer_near_the_estimate():
+    seconds = [
+        polling.next_poll_seconds("hls", elapsed, duration=600)
+        for elapsed in (0, 300, 500, 610)
+    ]
+    assert seconds == sorted(seconds, reverse=True)
+    assert seconds[-1] == polling.min_poll_seconds
+
+
+@pytest.mark.parametrize("polls", [1, 10, 100])
+def test_overdue_job_backs_off_from_when_the_estimate_ran_out(polls):
+    # 600 s of media at 1.0 s per second plus the overhead: 615 s
+    just_overdue = polling.next_poll_seconds(
+        "hls", 620, duration=600, polls=polls
+    )
+    assert just_overdue == polling.min_poll_seconds
+    assert polling.next_poll_seconds(
+        "hls", 615 + 120, duration=600, polls=polls
+    ) == 30
+    assert polling.next_poll_seconds(
+        "hls", 615 + 7200, duration=600, polls=polls
+    ) == polling.max_poll_seconds
+
+
+def test_exponential_backoff_without_estimate():
+    seconds = [polling.next_poll_seconds("hls", 0, polls=x) for x in range(8)]
+    assert seconds[:4] == [5, 10, 20, 40]
+    assert seconds[-1] == polling.max_poll_seconds
+
+
+def test_source_duration_of_a_chunk():
+    metadata = {
+        "media_info": {"duration": 3600.0},
+        "chunk": {"count": 3, "start": 1200.0, "end": 2400.0}
+    }
+    assert polling.source_duration(metadata) == 1200.0
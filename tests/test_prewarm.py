@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from conftest import EVENTS
+from avod_common import prewarm
+
+
+MASTER = "outputs/uuid/HLS/key.m3u8"
+INDEX = {
+    "variants": [{
+        "uri": "key_1080p.m3u8",
+        "init": {"uri": "key_1080p_init.mp4"},
+        "segments": {"uri": [f"key_1080p_{x:05d}.m4s" for x in range(5)]}
+    }],
+    "media": [
+        {
+            # Byte ranges of a single file
+            "uri": "audio/key_aac.m3u8",
+            "segments": {"uri": ["key_aac.aac"] * 4}
+        },
+        {
+            # On another origin, not prewarmed
+            "uri": "https://other.example.com/key_subs.m3u8",
+            "segments": {"uri": ["key_subs_00000.vtt"]}
+        }
+    ]
+}
+# Cache headers of the edge by file name, Miss from cloudfront else
+HEADERS = {
+    "key_1080p_00000.m4s": {"X-Cache": "Hit from cloudfront"},
+    "key_1080p_00001.m4s": {"CF-Cache-Status": "HIT"},
+    "key_1080p_00002.m4s": {"X-Cache-Status": "EXPIRED"},
+    "key_aac.aac": {"Age": "12"},
+    "key_1080p_init.mp4": {"Age": "0"},
+    "key_1080p.m3u8": {"Server": "origin"}
+}
+
+
+@pytest.fixture
+def edge():
+    """Local HTTP server standing for the CDN edge, with a 404 and a
+    response slower than the prewarm timeout"""
+
+    requests = Counter()
+
+    class Edge(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            requests[self.path] += 1
+            name = self.path.rsplit("/", 1)[-1]
+            if name == "missing.m4s":
+                self.send_error(404)
+                return
+            if name == "slow.m4s":
+                time.sleep(1)
+            body = b"x" * 100
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            for header, value in HEADERS.get(
+                name, {"X-Cache": "Miss from cloudfront"}
+            ).items():
+                self.send_header(header, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Edge)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/"
+    server.requests = requests
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_targets():
+    targets = prewarm.targets("https://d1.cloudfront.net/", MASTER, INDEX, 3)
+
+    base = "https://d1.cloudfront.net/outputs/uuid/HLS"
+    assert targets == [
+        ("master", f"{base}/key.m3u8"),
+        ("playlist", f"{base}/key_1080p.m3u8"),
+        ("playlist", f"{base}/audio/key_aac.m3u8"),
+        ("init", f"{base}/key_1080p_init.mp4"),
+        ("segment", f"{base}/key_1080p_00000.m4s"),
+        ("segment", f"{base}/key_1080p_00001.m4s"),
+        ("segment", f"{base}/key_1080p_00002.m4s"),
+        ("segment", f"{base}/audio/key_aac.aac")
+    ]
+
+
+@pytest.mark.parametrize("headers, status", [
+    ({"X-Cache": "Hit from cloudfront"}, "hit"),
+    ({"X-Cache": "RefreshHit from cloudfront"}, "hit"),
+    ({"X-Cache": "Miss from cloudfront"}, "miss"),
+    ({"CF-Cache-Status": "DYNAMIC"}, "miss"),
+    ({"X-Cache-Status": "STALE"}, "hit"),
+    ({"X-Cache": "", "CF-Cache-Status": "HIT"}, "hit"),
+    ({"Age": "3"}, "hit"),
+    ({"Age": "0"}, "miss"),
+    ({"Age": "soon"}, "unknown"),
+    ({"X-Cache": "Error from cloudfront"}, "unknown"),
+    ({}, "unknown")
+])
+def test_cache_status(headers, status):
+    assert prewarm.cache_status(headers) == status
+
+
+def test_prewarm_through_the_edge(edge):
+    targets = prewarm.targets(edge.url, MASTER, INDEX, 3)
+
+    stats = prewarm.prewarm(targets, concurrency=4, timeout=5)
+
+    assert stats["requests"] == 8
+    assert (stats["hits"], stats["misses"], stats["unknown"]) == (3, 4, 1)
+    assert stats["errors"] == 0 and stats["error_samples"] == []
+    assert stats["bytes"] == 800
+    # The segment shared by the byte ranges is fetched once
+    assert edge.requests["/outputs/uuid/HLS/audio/key_aac.aac"] == 1
+    assert sum(edge.requests.values()) == 8
+    assert stats["seconds_p50"] <= stats["seconds_p95"] <= (
+        stats["seconds_max"]
+    )
+    assert stats["hit_ttfb_p50"] is not None
+
+
+def test_errors(edge):
+    targets = [
+        ("segment", f"{edge.url}missing.m4s"),
+        ("segment", f"{edge.url}slow.m4s"),
+        ("segment", f"{edge.url}fast.m4s")
+    ]
+
+    stats = prewarm.prewarm(targets, concurrency=3, timeout=0.2)
+
+    assert (stats["errors"], stats["misses"]) == (2, 1)
+    assert len(stats["error_samples"]) == 2
+    assert f"{edge.url}missing.m4s: 404 Not Found" in stats["error_samples"]
+    assert any(
+        x.startswith(f"{edge.url}slow.m4s: ") for x in stats["error_samples"]
+    )
+
+
+def test_deadline_skips_the_requests_not_started(edge):
+    targets = [("segment", f"{edge.url}fast.m4s")] * 3
+
+    stats = prewarm.prewarm(targets, deadline=time.time() - 1)
+
+    assert (stats["requests"], stats["skipped"]) == (0, 3)
+    assert stats["seconds_p50"] is None and stats["seconds_max"] is None
+    assert sum(edge.requests.values()) == 0
+
+
+def test_summary_percentiles():
+    results = [
+        {"cache": "miss", "bytes": 10, "seconds": x / 10, "ttfb": x / 100}
+        for x in range(1, 11)
+    ] + [{"cache": "error", "bytes": 0, "seconds": 5.0,
+          "url": "https://edge/x", "error": "timed out"}]
+
+    stats = prewarm.summary(results, skipped=2)
+
+    assert stats["requests"] == 11
+    assert (stats["misses"], stats["errors"], stats["skipped"]) == (10, 1, 2)
+    assert stats["bytes"] == 100
+    assert stats["seconds_p50"] == 0.6
+    assert stats["seconds_p95"] == 5.0
+    assert stats["seconds_max"] == 5.0
+    assert stats["miss_ttfb_p50"] == 0.05
+    assert stats["miss_ttfb_p95"] == 0.1
+    assert stats["hit_ttfb_p50"] is None
+    assert stats["error_samples"] == ["https://edge/x: timed out"]
+
+
+def prewarm_event():
+    with open(os.path.join(EVENTS, "start_subtitles_event.json")) as f:
+        return json.load(f)
+
+
+def test_handler(load, edge, monkeypatch):
+    app = load("prewarm_cdn")
+    monkeypatch.setattr(app, "cdn_base_url", edge.url)
+    monkeypatch.setattr(app, "prewarm_segments", 2)
+    read = []
+
+    def read_text(bucket, key):
+        read.append((bucket, key))
+        return json.dumps(INDEX)
+
+    monkeypatch.setattr(app.hls_index, "read_text", read_text)
+    event = prewarm_event()
+
+    stats = app.lambda_handler(event, None)
+
+    assert read == [("example-bucket", event["Outputs"]["HLS"]["index"])]
+    assert stats["requests"] == 7 and stats["errors"] == 0
+    assert sum(edge.requests.values()) == 7
+
+
+def test_handler_skips(load, monkeypatch):
+    app = load("prewarm_cdn")
+    event = prewarm_event()
+
+    monkeypatch.setattr(app, "cdn_base_url", "")
+    assert app.lambda_handler(event, None) == {
+        "skipped": "CDNBASEURL is not set"
+    }
+    monkeypatch.setattr(app, "cdn_base_url", "https://d1.cloudfront.net")
+    del event["Outputs"]["HLS"]["index"]
+    assert app.lambda_handler(event, None) == {
+        "skipped": "the HLS output has no index"
+    }
@@ -0,0 +1,220 @@
+import io
+import struct
+import pytest
+from avod_common import probe
+
+
+MATRIX = struct.pack(">9I", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+
+
+def box(box_type, *payloads):
+    payload = b"".join(payloads)
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def large_box(box_type, payload):
+    """Box with a 64 bits largesize"""
+
+    return struct.pack(">I4sQ", 1, box_type, 16 + len(payload)) + payload
+
+
+def eof_box(box_type, payload):
+    """Box with size 0, up to the end of the file"""
+
+    return struct.pack(">I4s", 0, box_type) + payload
+
+
+def full_box(box_type, version, flags, *payloads):
+    return box(box_type, struct.pack(">I", version << 24 | flags), *payloads)
+
+
+def times(version, timescale, duration):
+    """Creation and modification times, timescale and duration of a mvhd
+    or mdhd"""
+
+    if version:
+        return struct.pack(">QQIQ", 0, 0, timescale, duration)
+    return struct.pack(">IIII", 0, 0, timescale, duration)
+
+
+def tkhd(version, width=0, height=0):
+    if version:
+        ids = struct.pack(">QQIIQ", 0, 0, 1, 0, 0)
+    else:
+        ids = struct.pack(">IIIII", 0, 0, 1, 0, 0)
+    return full_box(
+        b"tkhd", version, 3, ids, bytes(8), bytes(8), MATRIX,
+        struct.pack(">II", int(width * 65536), int(height * 65536))
+    )
+
+
+def mdhd(version, timescale, duration, language="und"):
+    packed = sum(
+        (ord(x) - 0x60) << shift for x, shift in zip(language, (10, 5, 0))
+    )
+    return full_box(b"mdhd", version, 0, times(version, timescale, duration),
+                    struct.pack(">HH", packed, 0))
+
+
+def trak(handler, entry, version, timescale, stts, display=(0, 0),
+         language="und"):
+    return box(
+        b"trak",
+        tkhd(version, *display),
+        box(
+            b"mdia",
+            mdhd(version, timescale, sum(x * y for x, y in stts), language),
+            full_box(b"hdlr", 0, 0, bytes(4), handler, bytes(12), b"\0"),
+            box(b"minf", box(
+                b"stbl",
+                full_box(b"stsd", 0, 0, struct.pack(">I", 1), entry),
+                full_box(b"stts", 0, 0, struct.pack(">I", len(stts)),
+                         *(struct.pack(">II", *x) for x in stts))
+            ))
+        )
+    )
+
+
+def video_entry(width, height):
+    return box(b"avc1", bytes(6), struct.pack(">H", 1), bytes(16),
+               struct.pack(">HH", width, height), bytes(50))
+
+
+def audio_entry(channels, sample_rate):
+    return box(b"mp4a", bytes(6), struct.pack(">H", 1), bytes(8),
+               struct.pack(">HHHHI", channels, 16, 0, 0, sample_rate << 16))
+
+
+def moov(version=0):
+    """10 s of 1280x720 at 25 fps, displayed 16:9 as 1280x720, and of
+    AAC stereo at 48 kHz"""
+
+    return box(
+        b"moov",
+        full_box(b"mvhd", version, 0, times(version, 1000, 10000),
+                 bytes(80)),
+        trak(b"vide", video_entry(1280, 720), version, 12800,
+             [(250, 512)], (1280, 720)),
+        trak(b"soun", audio_entry(2, 48000), version, 48000,
+             [(468, 1024), (1, 768)], language="por")
+    )
+
+
+FTYP = box(b"ftyp", b"mp42", struct.pack(">I", 0), b"isommp42")
+
+
+class S3:
+    """S3 client serving one object, counting the bytes read"""
+
+    def __init__(self, data):
+        self.data = data
+        self.bytes_read = 0
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = (int(x) for x in Range[6:].split("-"))
+        body = self.data[start:end + 1]
+        self.bytes_read += len(body)
+        return {
+            "ContentRange": f"bytes {start}-{start + len(body) - 1}/"
+                            f"{len(self.data)}",
+            "Body": io.BytesIO(body)
+        }
+
+
+def reader(data, block_size=4096):
+    return probe.RangeReader(S3(data), "bucket", "key", block_size)
+
+
+@pytest.mark.parametrize("version", [0, 1])
+def test_probe_moov_at_the_start(version):
+    data = FTYP + moov(version) + box(b"mdat", bytes(100000))
+
+    info = probe.probe(reader(data))
+
+    assert info["brand"] == "mp42"
+    assert info["faststart"] is True
+    assert info["size"] == len(data)
+    assert info["duration"] == 10.0
+    assert (info["width"], info["height"], info["framerate"]) == (
+        1280, 720, 25.0
+    )
+    assert (info["video_codec"], info["audio_codec"]) == ("avc1", "mp4a")
+    assert info["audio_channels"] == 2
+    assert info["video"][0]["display_width"] == 1280
+    assert info["video"][0]["duration"] == 10.0
+    assert info["audio"] == [{
+        "codec": "mp4a", "channels": 2, "sample_rate": 48000,
+        "language": "por", "duration": (468 * 1024 + 768) / 48000
+    }]
+
+
+def test_moov_at_the_end_reads_only_headers_and_the_moov():
+    mdat = bytes(4 * 1024 * 1024)
+    data = FTYP + box(b"free", bytes(10)) + box(b"mdat", mdat) + moov()
+    source = reader(data)
+
+    info = probe.probe(source)
+
+    assert info["faststart"] is False
+    assert info["duration"] == 10.0
+    # A block for the ftyp, free and mdat headers, then one for the moov
+    assert source.requests == 2
+    assert source.s3.bytes_read <= 4096 + len(moov())
+
+
+def test_largesize_and_size_0_boxes():
+    mdat = large_box(b"mdat", bytes(200000))
+    data = FTYP + mdat + eof_box(b"moov", moov()[8:])
+    source = reader(data)
+
+    info = probe.probe(source)
+
+    assert info["duration"] == 10.0
+    assert info["faststart"] is False
+    assert source.s3.bytes_read < 3 * 4096 + len(moov())
+
+
+def test_iter_boxes():
+    data = box(b"free", b"1234") + large_box(b"skip", b"56") + (
+        eof_box(b"mdat", b"7890")
+    )
+
+    assert list(probe.iter_boxes(data)) == [
+        (b"free", 8, 12), (b"skip", 28, 30), (b"mdat", 38, 42)
+    ]
+    with pytest.raises(ValueError, match="Invalid b'free' box at 0"):
+        list(probe.iter_boxes(box(b"free", b"1234")[:-1]))
+    with pytest.raises(ValueError, match="Invalid b'skip' box"):
+        list(probe.iter_boxes(struct.pack(">I4sQ", 1, b"skip", 4)))
+
+
+@pytest.mark.parametrize("version", [0, 1])
+def test_mdhd_and_tkhd_versions(version):
+    data = mdhd(version, 90000, 2 ** 33 if version else 900000, "eng")
+
+    assert probe.parse_mdhd(data, 8) == (
+        90000, 2 ** 33 if version else 900000, "eng"
+    )
+    data = tkhd(version, 1024.5, 576)
+    assert probe.parse_tkhd(data, 8, len(data)) == (1024.5, 576)
+
+
+def test_parse_stts():
+    data = full_box(b"stts", 0, 0, struct.pack(">IIIII", 2, 10, 1001,
+                                               1, 500))
+
+    assert probe.parse_stts(data, 8) == (11, 10510)
+
+
+def test_truncated_moov():
+    data = FTYP + moov()[:-100]
+
+    with pytest.raises(ValueError, match="Truncated moov box"):
+        probe.probe(reader(data))
+
+
+def test_no_moov():
+    with pytest.raises(ValueError, match="No moov box found"):
+        probe.probe(reader(FTYP + box(b"mdat", bytes(100))))
+    with pytest.raises(ValueError, match="Not an ISO-BMFF file"):
+        probe.probe(reader(b"\x89PNG\r\n\x1a\n" + bytes(100)))
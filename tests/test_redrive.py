@@ -0,0 +1,108 @@
+import json
+import os
+import pytest
+from conftest import EVENTS
+
+
+JOB = "531f729c-2f96-4ba7-8cf7-02284f3e7e35"
+
+
+class Paginator:
+    def paginate(self, Bucket, Prefix):
+        yield {"Contents": [{"Key": f"{Prefix}Transcript.json"}]}
+
+
+class S3:
+    def get_paginator(self, name):
+        return Paginator()
+
+
+class StepFunctions:
+    """Step Functions keeping the executions by name"""
+
+    class exceptions:
+        class ExecutionAlreadyExists(Exception):
+            pass
+
+    def __init__(self):
+        self.executions = {}
+
+    def start_execution(self, stateMachineArn, name, input):
+        if name in self.executions:
+            raise self.exceptions.ExecutionAlreadyExists(name)
+        self.executions[name] = json.loads(input)
+        return {"executionArn": f"{stateMachineArn}:{name}"}
+
+    def describe_execution(self, executionArn):
+        name = executionArn.split(":")[-1]
+        return {"input": json.dumps(self.executions[name])}
+
+
+class Ledger:
+    """LEDGERTABLE with the workflow stage items"""
+
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, TableName, Key, **kwargs):
+        item = self.items.get((Key["uuid"]["S"], Key["stage"]["S"]))
+        return {} if item is None else {"Item": item}
+
+    def update_item(self, Key, ExpressionAttributeValues, **kwargs):
+        item = self.items.setdefault(
+            (Key["uuid"]["S"], Key["stage"]["S"]), {}
+        )
+        for name, value in ExpressionAttributeValues.items():
+            item[name[1:]] = value
+
+
+@pytest.fixture
+def redrive(load, monkeypatch):
+    app = load("redrive")
+    monkeypatch.setattr(app, "s3", S3())
+    monkeypatch.setattr(app, "sf", StepFunctions())
+    monkeypatch.setattr(app.ledger, "ledger_table", "avod-ledger")
+    monkeypatch.setattr(app.ledger, "dynamodb", Ledger())
+    return app
+
+
+def event():
+    with open(os.path.join(EVENTS, "redrive_event.json")) as f:
+        return json.load(f)
+
+
+def test_redrives_by_metadata_are_numbered_from_the_ledger(redrive):
+    first = redrive.lambda_handler(event(), None)
+    second = redrive.lambda_handler(event(), None)
+
+    assert (first["redrive"], second["redrive"]) == (1, 2)
+    assert sorted(redrive.sf.executions) == [
+        f"key.mp4-{JOB}-r1", f"key.mp4-{JOB}-r2"
+    ]
+    assert first["Outputs"] == {"Transcribe": {
+        "bucket": "example-bucket", "key": f"outputs/{JOB}/Transcript.json"
+    }}
+
+
+def test_redrive_of_a_redriven_execution(redrive):
+    first = redrive.lambda_handler(event(), None)
+
+    second = redrive.lambda_handler(
+        {"execution_arn": first["executionArn"]}, None
+    )
+
+    assert second["redrive"] == 2
+    assert redrive.sf.executions[f"key.mp4-{JOB}-r2"]["metadata"][
+        "redrive"] == 2
+
+
+def test_redrive_without_the_ledger_takes_the_next_name(
+    redrive, monkeypatch
+):
+    monkeypatch.setattr(redrive.ledger, "ledger_table", "")
+    redrive.lambda_handler(event(), None)
+
+    second = redrive.lambda_handler(event(), None)
+
+    assert second["redrive"] == 2
+    assert len(redrive.sf.executions) == 2
@@ -0,0 +1,464 @@
+import io
+import struct
+import pytest
+from avod_common import probe, remux
+
+
+# AAC LC, 48 kHz, stereo
+ASC = bytes([0x11, 0x90])
+FRAME = 1024
+VIDEO_BLOCK = 5000
+
+
+def box(box_type, *payloads):
+    payload = b"".join(payloads)
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type, version, flags, *payloads):
+    return box(box_type, struct.pack(">I", version << 24 | flags), *payloads)
+
+
+def descriptor(tag, payload):
+    return bytes([tag, len(payload)]) + payload
+
+
+def esds(object_type=0x40, config=ASC):
+    decoder = descriptor(0x04, bytes([object_type, 0x15]) + bytes(11) +
+                         descriptor(0x05, config))
+    return full_box(b"esds", 0, 0, descriptor(
+        0x03, struct.pack(">HB", 1, 0) + decoder + descriptor(0x06, b"\x02")
+    ))
+
+
+def sample_entry(codec=b"mp4a", children=None):
+    if children is None:
+        children = esds()
+    return box(
+        codec, bytes(6), struct.pack(">H", 1), bytes(8),
+        struct.pack(">HHHHI", 2, 16, 0, 0, 48000 << 16), children
+    )
+
+
+def run_lengths(values):
+    runs = []
+    for value in values:
+        if runs and runs[-1][1] == value:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, value])
+    return runs
+
+
+def sample_sizes(frames):
+    return [20 + x % 7 for x in range(frames)]
+
+
+def sample_data(index, size):
+    return bytes([index % 251]) * size
+
+
+def audio_trak(sizes, chunk_offsets, per_chunk, entry, elst=None,
+               co64=False):
+    stsc = []
+    for index, count in enumerate(per_chunk):
+        if not stsc or stsc[-1][1] != count:
+            stsc.append((index + 1, count, 1))
+    stts = run_lengths([FRAME] * len(sizes))
+    if co64:
+        chunk_box = full_box(b"co64", 0, 0, struct.pack(
+            f">I{len(chunk_offsets)}Q", len(chunk_offsets), *chunk_offsets
+        ))
+    else:
+        chunk_box = full_box(b"stco", 0, 0, struct.pack(
+            f">I{len(chunk_offsets)}I", len(chunk_offsets), *chunk_offsets
+        ))
+    stbl = box(
+        b"stbl",
+        full_box(b"stsd", 0, 0, struct.pack(">I", 1), entry),
+        full_box(b"stts", 0, 0, struct.pack(
+            f">I{len(stts) * 2}I", len(stts), *(x for y in stts for x in y)
+        )),
+        full_box(b"stsc", 0, 0, struct.pack(
+            f">I{len(stsc) * 3}I", len(stsc), *(x for y in stsc for x in y)
+        )),
+        full_box(b"stsz", 0, 0, struct.pack(
+            f">II{len(sizes)}I", 0, len(sizes), *sizes
+        )),
+        chunk_box
+    )
+    duration = FRAME * len(sizes)
+    edts = b"" if elst is None else box(b"edts", elst)
+    # "eng" packed as 5 bits characters
+    language = (5 << 10) | (14 << 5) | 7
+    return box(
+        b"trak",
+        full_box(b"tkhd", 0, 3, struct.pack(">IIIII", 0, 0, 2, 0, 0),
+                 bytes(8), struct.pack(">hhhH", 0, 0, 0x100, 0),
+                 remux.MATRIX, bytes(8)),
+        edts,
+        box(
+            b"mdia",
+            full_box(b"mdhd", 0, 0, struct.pack(
+                ">IIIIHH", 0, 0, 48000, duration, language, 0
+            )),
+            full_box(b"hdlr", 0, 0, bytes(4), b"soun", bytes(12),
+                     b"SoundHandler\0"),
+            box(b"minf", full_box(b"smhd", 0, 0, bytes(4)), stbl)
+        )
+    )
+
+
+def video_trak():
+    entry = box(b"avc1", bytes(6), struct.pack(">H", 1), bytes(16),
+                struct.pack(">HH", 640, 360), bytes(50))
+    return box(
+        b"trak",
+        full_box(b"tkhd", 0, 3, struct.pack(">IIIII", 0, 0, 1, 0, 0),
+                 bytes(8), struct.pack(">hhhH", 0, 0, 0, 0),
+                 remux.MATRIX, struct.pack(">II", 640 << 16, 360 << 16)),
+        box(
+            b"mdia",
+            full_box(b"mdhd", 0, 0, struct.pack(
+                ">IIIIHH", 0, 0, 25, 100, 0x55C4, 0
+            )),
+            full_box(b"hdlr", 0, 0, bytes(4), b"vide", bytes(12),
+                     b"VideoHandler\0"),
+            box(b"minf", box(b"stbl", full_box(
+                b"stsd", 0, 0, struct.pack(">I", 1), entry
+            ), full_box(b"stts", 0, 0, struct.pack(">III", 1, 100, 1))))
+        )
+    )
+
+
+def source_mp4(frames=200, per_chunk=47, entry=None, elst=None,
+               moov_first=False, co64=False, mvex=False):
+    """MP4 with a video track and an AAC track, the audio chunks after
+    blocks of video in the mdat
+
+    Returns
+    ------
+    File bytes, and the audio samples: tuple
+
+    """
+
+    entry = sample_entry() if entry is None else entry
+    sizes = sample_sizes(frames)
+    counts = [per_chunk] * (frames // per_chunk)
+    if frames % per_chunk:
+        counts.append(frames % per_chunk)
+    samples = [sample_data(x, size) for x, size in enumerate(sizes)]
+    mdat = b""
+    relative = []
+    index = 0
+    for count in counts:
+        mdat += bytes(VIDEO_BLOCK)
+        relative.append(len(mdat))
+        mdat += b"".join(samples[index:index + count])
+        index += count
+    ftyp = box(b"ftyp", b"isom", struct.pack(">I", 0x200), b"isommp41")
+
+    def moov(data_offset):
+        return box(
+            b"moov",
+            full_box(b"mvhd", 0, 0, struct.pack(
+                ">IIII", 0, 0, 1000, frames * FRAME // 48
+            ), struct.pack(">IH", 0x10000, 0x100), bytes(10),
+                remux.MATRIX, bytes(24), struct.pack(">I", 3)),
+            video_trak(),
+            audio_trak(sizes, [data_offset + x for x in relative], counts,
+                       entry, elst, co64),
+            box(b"mvex") if mvex else b""
+        )
+
+    if moov_first:
+        size = len(moov(0))
+        data = ftyp + moov(len(ftyp) + size + 8) + box(b"mdat", mdat)
+    else:
+        data = ftyp + box(b"mdat", mdat) + moov(len(ftyp) + 8)
+    return data, samples
+
+
+class S3:
+    """S3 client serving one object with ranged GETs"""
+
+    def __init__(self, data):
+        self.data = data
+        self.ranges = []
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = (int(x) for x in Range[6:].split("-"))
+        end = min(end, len(self.data) - 1)
+        self.ranges.append((start, end + 1))
+        return {
+            "ContentRange": f"bytes {start}-{end}/{len(self.data)}",
+            "Body": io.BytesIO(self.data[start:end + 1])
+        }
+
+
+def reader(data, block_size=probe.BLOCK_SIZE):
+    return probe.RangeReader(S3(data), "bucket", "key", block_size)
+
+
+def output_track(output):
+    moov, _, faststart = probe.find_moov(reader(output))
+    assert faststart
+    return moov, remux.audio_track(moov)
+
+
+@pytest.mark.parametrize("moov_first", [False, True])
+def test_round_trip(moov_first):
+    data, samples = source_mp4(moov_first=moov_first)
+    source_moov, _, _ = probe.find_moov(reader(data))
+    source = probe.parse_moov(source_moov)["audio"][0]
+    output = io.BytesIO()
+
+    stats = remux.remux(reader(data), output)
+
+    moov, track = output_track(output.getvalue())
+    info = probe.parse_moov(moov)
+    assert info["audio"] == [source]
+    assert info["video"] == []
+    assert info["duration"] == source["duration"] == 200 * FRAME / 48000
+    assert len(track["sizes"]) == stats["samples"] == 200
+    assert track["deltas"] == [FRAME] * 200
+    assert remux.parse_esds(track["esds"], 0, len(track["esds"])) == (
+        0x40, ASC
+    )
+    assert b"".join(
+        output.getvalue()[offset:offset + size]
+        for offset, size in zip(track["offsets"], track["sizes"])
+    ) == b"".join(samples)
+    assert stats["audio_bytes"] == sum(len(x) for x in samples)
+    assert stats["seconds"] == round(200 * FRAME / 48000, 3)
+
+
+def test_build_moov_is_parsed_by_the_probe():
+    data, _ = source_mp4(frames=100)
+    track = remux.audio_track(probe.find_moov(reader(data))[0])
+
+    moov = remux.build_moov(track, track["sizes"], track["deltas"], 4096)
+
+    payload = moov[8:]
+    info = probe.parse_moov(payload)
+    assert info["duration"] == 100 * FRAME / 48000
+    assert info["audio"] == [{
+        "codec": "mp4a", "channels": 2, "sample_rate": 48000,
+        "language": "eng", "duration": 100 * FRAME / 48000
+    }]
+    rebuilt = remux.audio_track(payload)
+    assert rebuilt["sizes"] == track["sizes"]
+    assert rebuilt["esds"] == track["esds"]
+    assert rebuilt["offsets"][0] == 4096
+    assert rebuilt["offsets"][-1] == 4096 + sum(track["sizes"][:-1])
+
+
+def test_build_moov_co64():
+    data, _ = source_mp4(frames=100, co64=True)
+    track = remux.audio_track(probe.find_moov(reader(data))[0])
+    offset = 0x100000000
+
+    moov = remux.build_moov(track, track["sizes"], track["deltas"], offset)
+
+    assert b"co64" in moov and b"stco" not in moov
+    assert remux.audio_track(moov[8:])["offsets"][0] == offset
+
+
+def test_select_at_chunk_bounds():
+    deltas = [FRAME] * 100
+    second = 48000 / FRAME
+
+    assert remux.select(deltas, 48000) == (0, 100)
+    assert remux.select(deltas, 48000, 10 * FRAME / 48000) == (10, 100)
+    # A sample started before the start belongs to the previous chunk
+    assert remux.select(deltas, 48000, 10.5 * FRAME / 48000) == (11, 100)
+    assert remux.select(deltas, 48000, 0, 20 * FRAME / 48000) == (0, 20)
+    assert remux.select(deltas, 48000, 1, 2) == (
+        int(second) + 1, int(2 * second) + 1
+    )
+    assert remux.select(deltas, 48000, 5, None) == (100, 100)
+
+
+def test_chunk_remux():
+    data, samples = source_mp4()
+    output = io.BytesIO()
+    first, last = remux.select([FRAME] * 200, 48000, 1, 3)
+
+    stats = remux.remux(reader(data), output, 1, 3)
+
+    _, track = output_track(output.getvalue())
+    assert stats["samples"] == len(track["sizes"]) == last - first
+    assert output.getvalue()[track["offsets"][0]:][:track["sizes"][0]] == (
+        samples[first]
+    )
+
+
+def test_chunk_without_samples():
+    data, _ = source_mp4()
+
+    with pytest.raises(remux.Unsupported):
+        remux.remux(reader(data), io.BytesIO(), 10, 20)
+
+
+def test_plan_ranges():
+    offsets = [0, 10, 30, 2000, 2010, 2020]
+    sizes = [10, 10, 10, 10, 10, 10]
+
+    # The 10 bytes gap is merged, not the 1970 bytes one
+    assert remux.plan_ranges(offsets, sizes, 0, 6, max_gap=100) == [
+        [0, 40, 0, 3], [2000, 2030, 3, 6]
+    ]
+    assert remux.plan_ranges(offsets, sizes, 0, 6, max_gap=2000) == [
+        [0, 2030, 0, 6]
+    ]
+    # The ranges stop at max_range
+    assert remux.plan_ranges(
+        offsets, sizes, 0, 6, max_gap=2000, max_range=25
+    ) == [[0, 20, 0, 2], [30, 40, 2, 3], [2000, 2020, 3, 5],
+          [2020, 2030, 5, 6]]
+    assert remux.plan_ranges(offsets, sizes, 2, 4, max_gap=0) == [
+        [30, 40, 2, 3], [2000, 2010, 3, 4]
+    ]
+
+
+def test_remux_reads_only_the_audio():
+    data, samples = source_mp4(frames=470)
+
+    source = reader(data)
+    remux.remux(source, io.BytesIO(), max_gap=1000)
+
+    # The moov, then a GET for the samples of each chunk, the video
+    # blocks between them aren't read
+    audio = sum(len(x) for x in samples)
+    assert source.s3.ranges[-10:] == [
+        (offset, offset + sum(len(x) for x in samples[y:y + 47]))
+        for y, offset in zip(
+            range(0, 470, 47),
+            remux.audio_track(probe.find_moov(reader(data))[0])["offsets"][
+                ::47]
+        )
+    ]
+    assert sum(end - start for start, end in source.s3.ranges[-10:]) == (
+        audio
+    )
+
+
+@pytest.mark.parametrize("entry, message", [
+    (sample_entry(b"ac-3"), "Audio codec ac-3"),
+    (sample_entry(children=b""), "No esds box"),
+    (sample_entry(children=esds(object_type=0x6B)),
+     "Audio object type indication 0x6b"),
+    # AAC LTP, 48 kHz, stereo
+    (sample_entry(children=esds(config=bytes([0x21, 0x90]))),
+     "AAC audio object type 4"),
+    # AAC LC, 48 kHz, 5.1
+    (sample_entry(children=esds(config=bytes([0x11, 0xB0]))),
+     "Channel configuration 6"),
+    # AAC LC, 96 kHz, stereo
+    (sample_entry(children=esds(config=bytes([0x10, 0x10]))),
+     "Sample rate 96000")
+])
+def test_unsupported_audio(entry, message):
+    data, _ = source_mp4(entry=entry)
+
+    with pytest.raises(remux.Unsupported, match=message):
+        remux.remux(reader(data), io.BytesIO())
+
+
+def test_unsupported_files():
+    data, _ = source_mp4()
+    moov, _, _ = probe.find_moov(reader(data))
+    # The audio track is a text track
+    moov = moov.replace(b"soun", b"text")
+    with pytest.raises(remux.Unsupported, match="No audio track"):
+        remux.audio_track(moov)
+
+    fragmented, _ = source_mp4(mvex=True)
+    with pytest.raises(remux.Unsupported, match="Fragmented file"):
+        remux.remux(reader(fragmented), io.BytesIO())
+
+
+def elst(*edits, version=0):
+    entry = ">Qqhh" if version else ">Iihh"
+    return full_box(b"elst", version, 0, struct.pack(">I", len(edits)),
+                    *(struct.pack(entry, *x) for x in edits))
+
+
+@pytest.mark.parametrize("edit_list, skipped", [
+    (elst(), 0),
+    (elst((4000, 0, 1, 0)), 0),
+    # The AAC encoder priming, one frame
+    (elst((4000, FRAME, 1, 0)), 1),
+    (elst((4000, 2 * FRAME, 1, 0), version=1), 2)
+])
+def test_edit_list_applied(edit_list, skipped):
+    data, samples = source_mp4(elst=edit_list)
+    output = io.BytesIO()
+
+    stats = remux.remux(reader(data), output)
+
+    _, track = output_track(output.getvalue())
+    assert stats["samples"] == 200 - skipped
+    assert output.getvalue()[track["offsets"][0]:][:track["sizes"][0]] == (
+        samples[skipped]
+    )
+
+    # A chunk from 1 s of the presentation starts at 1 s + the priming
+    stats = remux.remux(reader(data), io.BytesIO(), 1, 2)
+    first, last = remux.select(
+        [FRAME] * 200, 48000, 1 + skipped * FRAME / 48000,
+        2 + skipped * FRAME / 48000
+    )
+    assert stats["samples"] == last - first
+
+
+@pytest.mark.parametrize("edit_list, message", [
+    (elst((1000, -1, 1, 0), (4000, 0, 1, 0)), "Edit list of 2 edits"),
+    (elst((1000, -1, 1, 0)), "Edit list delaying the audio"),
+    (elst((4000, 0, 2, 0)), "Edit list rate 2.0"),
+    (elst((4000, 1000, 1, 0)), "Edit list starting within a sample")
+])
+def test_edit_list_unsupported(edit_list, message):
+    data, _ = source_mp4(elst=edit_list)
+
+    with pytest.raises(remux.Unsupported, match=message):
+        remux.remux(reader(data), io.BytesIO())
+
+
+class Writer(io.BytesIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(len(data))
+        return super().write(data)
+
+
+@pytest.mark.parametrize("max_buffer", [2500, 1200, 600])
+def test_bytes_in_flight_are_bounded(max_buffer, monkeypatch):
+    data, samples = source_mp4(frames=470)
+    output = Writer()
+    requested = []
+    in_flight = []
+
+    class Executor(remux.ThreadPoolExecutor):
+        def submit(self, function, reader, start, end):
+            # Bytes requested and not written yet, the first write is
+            # the header
+            requested.append(end - start)
+            in_flight.append(sum(requested) - sum(output.writes[1:]))
+            return super().submit(function, reader, start, end)
+
+    monkeypatch.setattr(remux, "ThreadPoolExecutor", Executor)
+
+    remux.remux(reader(data), output, max_gap=0, concurrency=8,
+                max_buffer=max_buffer)
+
+    assert len(in_flight) >= 10
+    assert max(in_flight) <= max_buffer
+    _, track = output_track(output.getvalue())
+    assert b"".join(
+        output.getvalue()[offset:offset + size]
+        for offset, size in zip(track["offsets"], track["sizes"])
+    ) == b"".join(samples)
@@ -0,0 +1,123 @@
+import pytest
+from avod_common import s3_upload
+from avod_common.s3_upload import MIN_PART_SIZE, MultipartUploadWriter
+
+
+class S3:
+    """S3 client recording the calls of the uploads"""
+
+    def __init__(self):
+        self.calls = []
+        self.parts = []
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.calls.append(("put_object", kwargs))
+        self.objects[Key] = Body
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.calls.append(("create_multipart_upload", kwargs))
+        return {"UploadId": "upload"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.calls.append(("upload_part", PartNumber))
+        self.parts.append(Body)
+        return {"ETag": f"etag{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId,
+                                  MultipartUpload):
+        self.calls.append(("complete_multipart_upload",
+                           MultipartUpload["Parts"]))
+        self.objects[Key] = b"".join(self.parts)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append(("abort_multipart_upload", UploadId))
+
+
+def test_small_document_is_a_put_object():
+    s3 = S3()
+
+    with MultipartUploadWriter(s3, "bucket", "key.srt",
+                               content_type="application/x-subrip") as f:
+        assert f.write("olá\n") == 5
+        f.write(b"bytes\n")
+
+    assert s3.calls == [
+        ("put_object", {"ContentType": "application/x-subrip"})
+    ]
+    assert s3.objects["key.srt"] == "olá\nbytes\n".encode("utf-8")
+    assert f.bytes_written == 11
+
+
+def test_parts():
+    s3 = S3()
+    line = b"x" * (1024 * 1024 - 1) + b"\n"
+
+    with MultipartUploadWriter(s3, "bucket", "key.srt",
+                               part_size=MIN_PART_SIZE) as f:
+        for _ in range(12):
+            f.write(line)
+
+    assert [len(x) for x in s3.parts] == [
+        MIN_PART_SIZE, MIN_PART_SIZE, 2 * 1024 * 1024
+    ]
+    assert s3.calls == [
+        ("create_multipart_upload", {}),
+        ("upload_part", 1),
+        ("upload_part", 2),
+        ("upload_part", 3),
+        ("complete_multipart_upload", [
+            {"ETag": "etag1", "PartNumber": 1},
+            {"ETag": "etag2", "PartNumber": 2},
+            {"ETag": "etag3", "PartNumber": 3}
+        ])
+    ]
+    assert s3.objects["key.srt"] == line * 12
+    assert f.bytes_written == 12 * len(line)
+
+
+def test_writes_over_a_part_are_sent_whole():
+    s3 = S3()
+
+    with MultipartUploadWriter(s3, "bucket", "key",
+                               part_size=MIN_PART_SIZE) as f:
+        f.write(b"x" * (MIN_PART_SIZE + 10))
+
+    assert [len(x) for x in s3.parts] == [MIN_PART_SIZE + 10]
+    assert [x[0] for x in s3.calls][-1] == "complete_multipart_upload"
+
+
+def test_abort_on_exception():
+    s3 = S3()
+
+    with pytest.raises(RuntimeError):
+        with MultipartUploadWriter(s3, "bucket", "key",
+                                   part_size=MIN_PART_SIZE) as f:
+            f.write(b"x" * MIN_PART_SIZE)
+            raise RuntimeError("transcript")
+
+    assert [x[0] for x in s3.calls] == [
+        "create_multipart_upload", "upload_part", "abort_multipart_upload"
+    ]
+    assert s3.objects == {}
+    # Closing after the abort sends nothing
+    f.close()
+    assert len(s3.calls) == 3
+
+
+def test_exception_before_the_first_part_writes_nothing():
+    s3 = S3()
+
+    with pytest.raises(RuntimeError):
+        with MultipartUploadWriter(s3, "bucket", "key") as f:
+            f.write(b"partial")
+            raise RuntimeError("transcript")
+
+    assert s3.calls == []
+
+
+def test_part_size():
+    with pytest.raises(ValueError, match="part_size must be at least"):
+        MultipartUploadWriter(S3(), "bucket", "key",
+                              part_size=MIN_PART_SIZE - 1)
+    assert s3_upload.PART_SIZE >= MIN_PART_SIZE
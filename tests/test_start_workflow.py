@@ -0,0 +1,113 @@
+import json
+import os
+import re
+import pytest
+from conftest import EVENTS
+from avod_common import ladder
+
+
+def test_dedup_profile_is_stable(load):
+    first = load("start_workflow").dedup_profile()
+
+    assert re.fullmatch(r"default-[0-9a-f]{16}", first)
+    assert load("start_workflow").dedup_profile() == first
+
+
+def test_dedup_profile_changes_with_the_settings(load, monkeypatch):
+    default = load("start_workflow").dedup_profile()
+
+    monkeypatch.setenv("CAPTIONFORMATS", "webcaptions,srt")
+    formats = load("start_workflow").dedup_profile()
+    monkeypatch.delenv("CAPTIONFORMATS")
+    monkeypatch.setenv("TARGETLANGCODE", "en-US")
+    language = load("start_workflow").dedup_profile()
+
+    assert len({default, formats, language}) == 3
+
+
+def test_dedup_profile_changes_with_the_compiled_ladder(load, monkeypatch):
+    default = load("start_workflow").dedup_profile()
+
+    monkeypatch.setitem(ladder.rung_defaults, "quality", 8)
+    ladder.compile_settings.cache_clear()
+    try:
+        assert load("start_workflow").dedup_profile() != default
+    finally:
+        ladder.compile_settings.cache_clear()
+
+
+class StepFunctions:
+    """Step Functions keeping the executions by name"""
+
+    class exceptions:
+        class ExecutionAlreadyExists(Exception):
+            pass
+
+    def __init__(self):
+        self.executions = {}
+
+    def start_execution(self, stateMachineArn, name, input):
+        if name in self.executions:
+            raise self.exceptions.ExecutionAlreadyExists(name)
+        self.executions[name] = json.loads(input)
+        return {"executionArn": f"{stateMachineArn}:{name}"}
+
+
+@pytest.fixture
+def start_workflow(load, monkeypatch):
+    app = load("start_workflow")
+    monkeypatch.setattr(app, "sf", StepFunctions())
+    monkeypatch.setattr(app.ledger, "record", lambda *args, **kwargs: None)
+    return app
+
+
+def s3_event():
+    with open(os.path.join(EVENTS, "s3_put_event.json")) as f:
+        return json.load(f)
+
+
+def test_retried_event_starts_the_object_once(start_workflow):
+    first = start_workflow.lambda_handler(s3_event(), None)
+    again = start_workflow.lambda_handler(s3_event(), None)
+
+    (name, execution), = start_workflow.sf.executions.items()
+    _id = first["executions"][0]["metadata"]["uuid"]
+    assert name == f"key.mp4-{_id}"
+    assert execution["metadata"]["uuid"] == _id
+    assert again["executions"][0]["metadata"]["uuid"] == _id
+    assert again["executions"][0]["metadata"]["status"] == "ALREADY STARTED"
+
+
+def test_new_upload_of_the_key_is_a_new_workflow(start_workflow):
+    event = s3_event()
+    start_workflow.lambda_handler(event, None)
+    event["Records"][0]["s3"]["object"]["sequencer"] = "0A1B2C3D4E5F678902"
+
+    start_workflow.lambda_handler(event, None)
+
+    assert len(start_workflow.sf.executions) == 2
+
+
+def test_failed_object_of_a_batch_is_retried_alone(start_workflow):
+    event = s3_event()
+    other = json.loads(json.dumps(event["Records"][0]))
+    other["s3"]["object"]["key"] = "input/other.mp4"
+    event["Records"].append(other)
+    started = start_workflow.sf.start_execution
+
+    def fail_other(stateMachineArn, name, input):
+        if name.startswith("other.mp4"):
+            raise RuntimeError("Throttled")
+        return started(stateMachineArn, name, input)
+
+    start_workflow.sf.start_execution = fail_other
+    with pytest.raises(RuntimeError):
+        start_workflow.lambda_handler(event, None)
+    start_workflow.sf.start_execution = started
+
+    payload = start_workflow.lambda_handler(event, None)
+
+    assert sorted(
+        x["metadata"]["status"] for x in payload["executions"]
+    ) == ["ALREADY STARTED", "OK"]
+    assert len(start_workflow.sf.executions) == 2
@@ -0,0 +1,95 @@
+import io
+import json
+from avod_common import transcript
+
+
+CHUNKS = [{"start": 0, "end": 40}, {"start": 30, "end": 70}]
+
+
+def word(content, start, end, id=None):
+    item = {
+        "start_time": "%.3f" % start,
+        "end_time": "%.3f" % end,
+        "alternatives": [{"confidence": "0.9", "content": content}],
+        "type": "pronunciation"
+    }
+    if id is not None:
+        item["id"] = id
+    return item
+
+
+def mark(content):
+    return {
+        "alternatives": [{"confidence": "0.0", "content": content}],
+        "type": "punctuation"
+    }
+
+
+def words(items):
+    return [x["alternatives"][0]["content"] for x in items]
+
+
+def test_word_across_the_cut_is_kept_once(load):
+    stitch = load("stitch_transcripts", "stitch")
+    # The cut is at 35 s, 5 s in the second chunk
+    first = [word("one", 33, 34), word("across", 34.8, 35.6), mark(",")]
+    second = [word("one", 3, 4), word("across", 4.8, 5.6), mark(","),
+              word("two", 6, 7)]
+
+    items = list(stitch.stitch(CHUNKS, [iter(first), iter(second)]))
+
+    assert words(items) == ["one", "across", ",", "two"]
+    assert items[1]["start_time"] == "34.800"
+    assert items[3]["start_time"] == "36.000"
+
+
+def test_word_after_the_cut_comes_from_the_second_chunk(load):
+    stitch = load("stitch_transcripts", "stitch")
+    # The first chunk heard "late" after the cut, the second one before
+    first = [word("one", 33, 34.5), word("late", 35.2, 36)]
+    second = [word("one", 3, 4.5), word("late", 4.9, 6), mark(".")]
+
+    items = list(stitch.stitch(CHUNKS, [iter(first), iter(second)]))
+
+    assert words(items) == ["one", "late", "."]
+    assert items[1]["start_time"] == "34.900"
+
+
+def test_punctuation_follows_its_word_and_ids_are_renumbered(load):
+    stitch = load("stitch_transcripts", "stitch")
+    first = [word("a", 1, 2, 0), mark("."), word("b", 36, 37, 2), mark("?")]
+    second = [word("b", 6, 7, 0), mark("!"), word("c", 8, 9, 2)]
+
+    items = list(stitch.stitch(CHUNKS, [iter(first), iter(second)]))
+
+    assert words(items) == ["a", ".", "b", "!", "c"]
+    assert [x.get("id") for x in items] == [0, None, 2, None, 4]
+
+
+def test_write_transcript(load):
+    stitch = load("stitch_transcripts", "stitch")
+    items = [word("olá", 0, 1), mark(","), word("mundo", 1, 2), mark(".")]
+    f = io.StringIO()
+
+    count = stitch.write_transcript(f, "key.mp4-uuid", iter(items))
+
+    assert count == 4
+    document = json.loads(f.getvalue())
+    assert document["jobName"] == "key.mp4-uuid"
+    assert document["results"]["transcripts"] == [
+        {"transcript": "olá, mundo."}
+    ]
+    assert document["results"]["items"] == items
+    stream = io.BytesIO(f.getvalue().encode("utf-8"))
+    assert list(transcript.iter_items(stream, chunk_size=7)) == items
+
+
+def test_empty_chunks(load):
+    stitch = load("stitch_transcripts", "stitch")
+    items = stitch.stitch(CHUNKS, [iter([]), iter([word("a", 6, 7)])])
+    f = io.StringIO()
+
+    assert stitch.write_transcript(f, "key.mp4-uuid", items) == 1
+    assert json.loads(f.getvalue())["results"]["transcripts"] == [
+        {"transcript": "a"}
+    ]
@@ -0,0 +1,89 @@
+import io
+import pytest
+from avod_common import subtitles, webvtt
+
+
+CAPTIONS = [
+    {"start": 0.5, "end": 2.0, "caption": "Tom & Jerry <3"},
+    {"start": 2.0, "end": 3.25, "caption": "A --> B"}
+]
+
+
+def write(writer, captions=CAPTIONS, **kwargs):
+    f = io.StringIO()
+    with writer(f, **kwargs) as w:
+        for caption in captions:
+            w.write(caption)
+    return f.getvalue()
+
+
+def test_srt():
+    assert write(subtitles.SRTWriter) == (
+        "1\n00:00:00,500 --> 00:00:02,000\nTom & Jerry <3\n\n"
+        "2\n00:00:02,000 --> 00:00:03,250\nA --> B\n\n"
+    )
+
+
+def test_webvtt_escapes_the_cue_text():
+    assert write(subtitles.WebVTTWriter) == (
+        "WEBVTT\n\n"
+        "1\n00:00:00.500 --> 00:00:02.000\nTom &amp; Jerry &lt;3\n\n"
+        "2\n00:00:02.000 --> 00:00:03.250\nA --&gt; B\n\n"
+    )
+
+
+@pytest.mark.parametrize("text, escaped", [
+    ("plain > text", "plain > text"),
+    ("&amp;", "&amp;amp;"),
+    ("<b>bold</b>", "&lt;b>bold&lt;/b>"),
+    ("--->", "---&gt;"),
+    ("-- >", "-- >")
+])
+def test_escape_cue(text, escaped):
+    assert subtitles.escape_cue(text) == escaped
+
+
+def test_webvtt_segments_escape_the_cue_text():
+    segment, = webvtt.segment_webvtt(CAPTIONS[1:], [6.0])
+
+    assert segment.endswith("\nA --&gt; B\n\n")
+
+
+def test_ttml():
+    assert write(subtitles.TTMLWriter, language="en") == (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<tt xmlns="http://www.w3.org/ns/ttml" xml:lang="en">\n'
+        "<body>\n<div>\n"
+        '<p xml:id="c1" begin="00:00:00.500" end="00:00:02.000">'
+        "Tom &amp; Jerry &lt;3</p>\n"
+        '<p xml:id="c2" begin="00:00:02.000" end="00:00:03.250">'
+        "A --&gt; B</p>\n"
+        "</div>\n</body>\n</tt>\n"
+    )
+
+
+@pytest.mark.parametrize("seconds, srt, ttml", [
+    (0, "00:00:00,000", "00:00:00.000"),
+    ("0.001", "00:00:00,001", "00:00:00.001"),
+    (0.0004, "00:00:00,000", "00:00:00.000"),
+    (1.005, "00:00:01,005", "00:00:01.005"),
+    ("2.675", "00:00:02,675", "00:00:02.675"),
+    # Rounded up to the next second, minute and hour
+    (59.9996, "00:01:00,000", "00:01:00.000"),
+    ("3599.9995", "01:00:00,000", "01:00:00.000"),
+    (36000.999, "10:00:00,999", "10:00:00.999"),
+    (360000, "100:00:00,000", "100:00:00.000")
+])
+def test_timestamps(seconds, srt, ttml):
+    cue = [{"start": seconds, "end": seconds, "caption": "x"}]
+
+    assert write(subtitles.SRTWriter, cue) == f"1\n{srt} --> {srt}\nx\n\n"
+    assert f'begin="{ttml}" end="{ttml}"' in write(subtitles.TTMLWriter, cue)
+
+
+def test_transcribe_timestamps_are_exact():
+    # Transcribe times have 3 decimals, no float error reaches the cues
+    for millis in range(0, 7200000, 997):
+        seconds = f"{millis / 1000:.3f}"
+        assert subtitles.to_millis(seconds) == millis
+        assert subtitles.to_millis(float(seconds)) == millis
@@ -0,0 +1,45 @@
+import io
+import json
+import pytest
+from avod_common import transcript
+
+
+ITEMS = [
+    {
+        "start_time": "2.5",
+        "end_time": "2.75",
+        "alternatives": [{"confidence": "0.99", "content": "olá"}],
+        "type": "pronunciation"
+    },
+    {
+        "alternatives": [{"confidence": "0.0", "content": "."}],
+        "type": "punctuation"
+    }
+]
+TRANSCRIPT = json.dumps({
+    "jobName": "key.mp4",
+    "accountId": 123456789012,
+    "results": {
+        "transcripts": [{"transcript": "olá."}],
+        "items": ITEMS
+    },
+    "status": "COMPLETED"
+}, ensure_ascii=False).encode("utf-8")
+NUMBERS = b'[2.5, -1.25e3, 10, 0.0005, 7E-2, 12345678901234567890, true]'
+
+
+@pytest.mark.parametrize("chunk_size", range(1, len(TRANSCRIPT) + 2))
+def test_items_at_every_chunk_size(chunk_size):
+    items = transcript.iter_items(io.BytesIO(TRANSCRIPT), chunk_size)
+    assert list(items) == ITEMS
+
+
+@pytest.mark.parametrize("chunk_size", range(1, len(NUMBERS) + 2))
+def test_numbers_split_across_chunks(chunk_size):
+    reader = transcript.TranscriptReader(io.BytesIO(NUMBERS), chunk_size)
+    assert list(reader.elements()) == json.loads(NUMBERS)
+
+
+def test_truncated_transcript():
+    with pytest.raises(ValueError):
+        list(transcript.iter_items(io.BytesIO(TRANSCRIPT[:-40]), 7))
@@ -0,0 +1,250 @@
+import io
+import json
+import os
+import pytest
+from conftest import EVENTS
+from avod_common import hls, webvtt
+from avod_common.captions import write_captions
+
+
+HEADER = "WEBVTT\nX-TIMESTAMP-MAP=MPEGTS:900000,LOCAL:00:00:00.000\n\n"
+CAPTIONS = [
+    {"start": 1.0, "end": 2.0, "caption": "one"},
+    # Over the boundary of the first and second segments
+    {"start": 5.0, "end": 7.0, "caption": "two"},
+    # Ends on the boundary of the second and third segments
+    {"start": 8.0, "end": 12.0, "caption": "three"},
+    # Over the second and third boundaries
+    {"start": 11.5, "end": 18.5, "caption": "four"}
+]
+
+
+def texts(segments):
+    return [[x["caption"] for x in cues] for cues in segments]
+
+
+def test_segment_captions():
+    segments = webvtt.segment_captions(CAPTIONS, [6.0, 6.0, 6.0, 6.0])
+
+    assert texts(segments) == [
+        ["one", "two"], ["two", "three", "four"], ["four"], ["four"]
+    ]
+
+
+def test_segment_captions_empty_and_late():
+    captions = [
+        {"start": 1.0, "end": 2.0, "caption": "one"},
+        # After the end of the video
+        {"start": 30.0, "end": 31.0, "caption": "late"}
+    ]
+
+    assert texts(webvtt.segment_captions(captions, [6.0, 6.0, 6.0])) == [
+        ["one"], [], ["late"]
+    ]
+    assert texts(webvtt.segment_captions([], [6.0, 6.0])) == [[], []]
+
+
+def test_segment_captions_fractional_durations():
+    # Boundaries at the milliseconds of 6.006 and 12.012
+    captions = [
+        {"start": 6.005, "end": 6.006, "caption": "first"},
+        {"start": 6.006, "end": 6.5, "caption": "second"}
+    ]
+
+    assert texts(webvtt.segment_captions(captions, [6.006, 6.006])) == [
+        ["first"], ["second"]
+    ]
+
+
+def test_segment_webvtt():
+    segments = list(webvtt.segment_webvtt(CAPTIONS[:3], [6.0, 6.0]))
+
+    assert segments == [
+        HEADER +
+        "1\n00:00:01.000 --> 00:00:02.000\none\n\n"
+        "2\n00:00:05.000 --> 00:00:07.000\ntwo\n\n",
+        HEADER +
+        "1\n00:00:05.000 --> 00:00:07.000\ntwo\n\n"
+        "2\n00:00:08.000 --> 00:00:12.000\nthree\n\n"
+    ]
+
+
+def test_segment_webvtt_mpegts():
+    segment, = webvtt.segment_webvtt([], [6.0], mpegts=0)
+
+    assert segment == (
+        "WEBVTT\nX-TIMESTAMP-MAP=MPEGTS:0,LOCAL:00:00:00.000\n\n"
+    )
+
+
+def test_media_playlist():
+    text = hls.media_playlist([
+        {"uri": "key_00001.vtt", "duration": 6.006},
+        {"uri": "key_00002.vtt", "duration": 4.5}
+    ])
+
+    assert text == (
+        "#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:7\n"
+        "#EXT-X-MEDIA-SEQUENCE:1\n#EXT-X-PLAYLIST-TYPE:VOD\n"
+        "#EXTINF:6.006,\nkey_00001.vtt\n#EXTINF:4.500,\nkey_00002.vtt\n"
+        "#EXT-X-ENDLIST\n"
+    )
+    assert hls.parse_playlist(text) == {
+        "segments": [
+            {"uri": "key_00001.vtt", "duration": 6.006},
+            {"uri": "key_00002.vtt", "duration": 4.5}
+        ],
+        "target_duration": 7,
+        "map": None,
+        "endlist": True
+    }
+    assert "#EXT-X-TARGETDURATION:1\n" in hls.media_playlist([])
+
+
+def test_parse_playlist():
+    playlist = hls.parse_playlist(
+        "#EXTM3U\n"
+        "#EXT-X-TARGETDURATION:6\n"
+        '#EXT-X-MAP:URI="key_init.mp4",BYTERANGE="800@0"\n'
+        "#EXTINF:6.0,title\n"
+        "#EXT-X-BYTERANGE:1000@800\n"
+        "key.mp4\n"
+        "#EXTINF:5.5,\n"
+        "#EXT-X-BYTERANGE:500\n"
+        "key.mp4\n"
+        "#EXTINF:2,\n"
+        "https://cdn.example.com/key_00002.m4s\n"
+    )
+
+    assert playlist == {
+        "segments": [
+            {"uri": "key.mp4", "duration": 6.0, "byterange": [1000, 800]},
+            {"uri": "key.mp4", "duration": 5.5, "byterange": [500, 1800]},
+            {"uri": "https://cdn.example.com/key_00002.m4s", "duration": 2.0}
+        ],
+        "target_duration": 6,
+        "map": "key_init.mp4",
+        "endlist": False
+    }
+
+
+MASTER = (
+    "#EXTM3U\n"
+    '#EXT-X-STREAM-INF:BANDWIDTH=1000000,CODECS="avc1.4d401f,mp4a.40.2"\n'
+    "key_720p.m3u8\n"
+    "#EXT-X-STREAM-INF:BANDWIDTH=3000000\n"
+    "key_1080p.m3u8\n"
+)
+
+
+def test_add_subtitles():
+    master = hls.add_subtitles(MASTER, "key_subtitles_pt-BR.m3u8", "pt-BR")
+
+    variants, media = hls.parse_master(master)
+    assert media == [{
+        "TYPE": "SUBTITLES", "GROUP-ID": "subs", "NAME": "pt-BR",
+        "LANGUAGE": "pt-BR", "DEFAULT": "YES", "AUTOSELECT": "YES",
+        "FORCED": "NO", "URI": "key_subtitles_pt-BR.m3u8"
+    }]
+    assert [x["attributes"]["SUBTITLES"] for x in variants] == ["subs"] * 2
+    assert variants[0]["attributes"]["CODECS"] == "avc1.4d401f,mp4a.40.2"
+    # Idempotent, the rendition is replaced
+    assert hls.add_subtitles(
+        master, "key_subtitles_pt-BR.m3u8", "pt-BR"
+    ) == master
+
+
+def test_add_subtitles_of_another_language():
+    master = hls.add_subtitles(MASTER, "key_subtitles_pt-BR.m3u8", "pt-BR")
+    master = hls.add_subtitles(master, "key_subtitles_es.m3u8", "es",
+                               name="Español")
+    master = hls.add_subtitles(master, "key_subtitles_pt-BR.m3u8", "pt-BR")
+
+    variants, media = hls.parse_master(master)
+    assert [(x["LANGUAGE"], x["NAME"]) for x in media] == [
+        ("es", "Español"), ("pt-BR", "pt-BR")
+    ]
+    assert master.count(',SUBTITLES="subs"') == 2
+
+
+class Body(io.BytesIO):
+    def iter_lines(self):
+        return iter(self.read().splitlines())
+
+
+class S3:
+    def __init__(self, objects):
+        self.objects = objects
+
+    def get_object(self, Bucket, Key):
+        return {"Body": Body(self.objects[Key].encode("utf-8"))}
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.objects[Key] = Body.decode("utf-8")
+
+
+def start_subtitles_event():
+    with open(os.path.join(EVENTS, "start_subtitles_event.json")) as f:
+        payload = json.load(f)
+    del payload["Outputs"]["HLS"]["index"]
+    return payload
+
+
+@pytest.fixture
+def subtitles(load, monkeypatch):
+    app = load("start_subtitles")
+    event = start_subtitles_event()
+    folder = event["Outputs"]["HLS"]["key"].rsplit("/", 1)[0]
+    f = io.StringIO()
+    write_captions(CAPTIONS[:3], f)
+    monkeypatch.setattr(app, "s3", S3({
+        event["Outputs"]["HLS"]["key"]: MASTER,
+        f"{folder}/key_720p.m3u8": hls.media_playlist([
+            {"uri": f"key_720p_{x:05d}.ts", "duration": 6.0}
+            for x in range(2)
+        ]),
+        event["Outputs"]["WebCaptions"]["key"]: f.getvalue()
+    }))
+    return app, event, folder
+
+
+def test_handler(subtitles):
+    app, event, folder = subtitles
+
+    payload = app.lambda_handler(event, None)
+    payload = app.lambda_handler(event, None)
+
+    objects = app.s3.objects
+    assert payload["Outputs"]["Subtitles"]["key"] == (
+        f"{folder}/key_subtitles_pt-BR.m3u8"
+    )
+    assert hls.parse_media(objects[f"{folder}/key_subtitles_pt-BR.m3u8"]) == [
+        {"uri": "key_subtitles_pt-BR_00001.vtt", "duration": 6.0},
+        {"uri": "key_subtitles_pt-BR_00002.vtt", "duration": 6.0}
+    ]
+    assert objects[f"{folder}/key_subtitles_pt-BR_00002.vtt"] == (
+        HEADER +
+        "1\n00:00:05.000 --> 00:00:07.000\ntwo\n\n"
+        "2\n00:00:08.000 --> 00:00:12.000\nthree\n\n"
+    )
+    _, media = hls.parse_master(objects[event["Outputs"]["HLS"]["key"]])
+    assert len(media) == 1
+
+
+def test_handler_without_captions(subtitles):
+    app, event, _ = subtitles
+    del event["Outputs"]["WebCaptions"]
+
+    assert app.lambda_handler(event, None)["metadata"]["status"] == (
+        "COMPLETED"
+    )
+    assert "Subtitles" not in event["Outputs"]
+
+
+def test_handler_without_hls_output(subtitles):
+    app, event, _ = subtitles
+    del event["Outputs"]["HLS"]
+
+    # The error dict of the handlers, not a NameError on the captions
+    with pytest.raises(TypeError):
+        app.lambda_handler(event, None)